@@ -2,7 +2,7 @@ from django.contrib import admin
 from monitor.models import (
     MonitoredURL, URLStatus, Alert, Notification,
     PageView, ClickHeatmap, MouseMovement,
-    PerformanceMetric
+    PerformanceMetric, ConversionFunnel
 )
 
 @admin.register(MonitoredURL)
@@ -56,3 +56,9 @@ class PerformanceMetricAdmin(admin.ModelAdmin):
     list_filter = ('timestamp',)
     search_fields = ('page_url', 'session_id')
     readonly_fields = ('timestamp',)
+
+@admin.register(ConversionFunnel)
+class ConversionFunnelAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'date', 'conversion_rate')
+    list_filter = ('date',)
+    search_fields = ('name', 'url__name')
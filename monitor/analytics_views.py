@@ -1,15 +1,20 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.db.models import Count, Avg, Sum, F, Q
 from django.db.models.functions import TruncDate, TruncHour
 from django.utils import timezone
 from datetime import timedelta
 from functools import wraps
 from .models import (
-    MonitoredURL, PageView, ClickHeatmap,
-    MouseMovement, PerformanceMetric
+    MonitoredURL, PageView, ClickHeatmapGrid,
+    MouseMovement, WebVitalSketch, SessionRecording
 )
+from .heatmaps import GRID_COLUMNS, GRID_ROWS, grid_cells, grid_date, summed_grid
+from .web_vitals import vitals_date, vitals_report
+from .session_events import iter_events
+from . import scroll_depth
+from .visitors import unique_counts, unique_visitors_by_day, unique_visitors_by_country
 import json
 import logging
 
@@ -71,27 +76,31 @@ def analytics_overview(request, url_id=None):
         if monitored_url:
             pageview_query = pageview_query.filter(url=monitored_url)
         
+        # Unique visitors and sessions come from the per-day HyperLogLog sketches
+        sketch_urls = [monitored_url] if monitored_url else MonitoredURL.objects.filter(user=request.user)
+        unique_visitors, total_sessions = unique_counts(sketch_urls, start_date)
+        
         # Get total metrics
         total_pageviews = pageview_query.count()
-        unique_visitors = pageview_query.values('visitor_id').distinct().count()
         avg_time_on_page = pageview_query.filter(
             time_on_page__gt=0
         ).aggregate(Avg('time_on_page'))['time_on_page__avg'] or 0
         
         # Get bounce rate (sessions with only 1 pageview)
-        total_sessions = pageview_query.values('session_id').distinct().count()
         single_page_sessions = pageview_query.values('session_id').annotate(
             page_count=Count('id')
         ).filter(page_count=1).count()
-        bounce_rate = (single_page_sessions / total_sessions * 100) if total_sessions > 0 else 0
+        bounce_rate = min(single_page_sessions / total_sessions * 100, 100) if total_sessions > 0 else 0
         
         # Get pageviews by day
-        pageviews_by_day = pageview_query.annotate(
+        pageviews_by_day = list(pageview_query.annotate(
             date=TruncDate('timestamp')
         ).values('date').annotate(
-            count=Count('id'),
-            unique=Count('visitor_id', distinct=True)
-        ).order_by('date')
+            count=Count('id')
+        ).order_by('date'))
+        unique_by_day = unique_visitors_by_day(sketch_urls, start_date)
+        for day in pageviews_by_day:
+            day['unique'] = min(unique_by_day.get(day['date'], 0), day['count'])
         
         # Get top pages
         top_pages = pageview_query.values('page_url').annotate(
@@ -126,7 +135,7 @@ def analytics_overview(request, url_id=None):
             'unique_visitors': unique_visitors,
             'avg_time_on_page': round(avg_time_on_page, 2),
             'bounce_rate': round(bounce_rate, 2),
-            'pageviews_by_day': json.dumps(list(pageviews_by_day), default=str),
+            'pageviews_by_day': json.dumps(pageviews_by_day, default=str),
             'top_pages': list(top_pages),
             'device_breakdown': json.dumps(list(device_breakdown)),
             'browser_breakdown': list(browser_breakdown),
@@ -172,35 +181,31 @@ def heatmap_view(request, url_id=None):
     
     # Get page URL filter
     page_url = request.GET.get('page_url', '')
+    device_type = request.GET.get('device', '')
     days = int(request.GET.get('days', 7))
     start_date = timezone.now() - timedelta(days=days)
     
-    # Base query - MUST filter by user's URLs only
-    clicks_query = ClickHeatmap.objects.filter(
-        timestamp__gte=start_date,
+    # Clicks come from the per-day grids binned at ingest - MUST filter by user's URLs only
+    grids_query = ClickHeatmapGrid.objects.filter(
+        date__gte=grid_date(start_date),
         url__user=request.user  # Critical: filter by user ownership
     )
     
-    if monitored_url:
-        clicks_query = clicks_query.filter(url=monitored_url)
-    elif page_url:
-        clicks_query = clicks_query.filter(page_url=page_url)
-    
     # Get all pages that have click data - filter by user
-    pages_with_clicks = ClickHeatmap.objects.filter(
-        timestamp__gte=start_date,
-        url__user=request.user
-    ).values('page_url').annotate(
-        click_count=Count('id')
+    pages_with_clicks = grids_query.values('page_url').annotate(
+        click_count=Sum('clicks')
     ).order_by('-click_count')[:20]
     
-    # Get click heatmap data
-    click_data = clicks_query.values(
-        'x_position', 'y_position', 'viewport_width', 'viewport_height',
-        'element_tag', 'element_id', 'element_class'
-    ).annotate(
-        count=Count('id')
-    ).order_by('-count')
+    if monitored_url:
+        grids_query = grids_query.filter(url=monitored_url)
+    elif page_url:
+        grids_query = grids_query.filter(page_url=page_url)
+    if device_type:
+        grids_query = grids_query.filter(device_type=device_type)
+    
+    # Sum the grids; the template scales cells to its canvas
+    grid, total_clicks = summed_grid(grids_query)
+    click_data = {'columns': GRID_COLUMNS, 'rows': GRID_ROWS, 'cells': grid_cells(grid)}
     
     # Get rage clicks - filter by user
     rage_clicks = MouseMovement.objects.filter(
@@ -244,10 +249,11 @@ def heatmap_view(request, url_id=None):
         'page_url': page_url,
         'days': days,
         'pages_with_clicks': list(pages_with_clicks),
-        'click_data': json.dumps(list(click_data), default=str),
+        'device_type': device_type,
+        'click_data': json.dumps(click_data) if total_clicks else '',
         'rage_click_data': list(rage_click_data),
         'dead_click_data': list(dead_click_data),
-        'total_clicks': clicks_query.count(),
+        'total_clicks': total_clicks,
         'total_rage_clicks': rage_clicks.count(),
         'total_dead_clicks': dead_clicks.count(),
     }
@@ -288,15 +294,18 @@ def geolocation_view(request, url_id=None):
         visits=Count('id')
     ).order_by('-visits')
     
-    # Get country statistics
-    country_stats = pageview_query.filter(
+    # Get country statistics (unique visitors from the per-country sketches)
+    country_stats = list(pageview_query.filter(
         country__isnull=False
     ).exclude(country='').values('country', 'country_code').annotate(
         visits=Count('id'),
-        unique_visitors=Count('visitor_id', distinct=True),
         avg_time=Avg('time_on_page'),
         avg_scroll=Avg('scroll_depth')
-    ).order_by('-visits')[:20]
+    ).order_by('-visits')[:20])
+    sketch_urls = [monitored_url] if monitored_url else MonitoredURL.objects.filter(user=request.user)
+    unique_by_country = unique_visitors_by_country(sketch_urls, start_date)
+    for stats in country_stats:
+        stats['unique_visitors'] = min(unique_by_country.get(stats['country'], 0), stats['visits'])
     
     # Get city statistics
     city_stats = pageview_query.filter(
@@ -311,7 +320,7 @@ def geolocation_view(request, url_id=None):
         'all_monitored_urls': all_monitored_urls,
         'days': days,
         'visitor_locations': list(visitor_locations),
-        'country_stats': list(country_stats),
+        'country_stats': country_stats,
         'city_stats': list(city_stats),
         'total_locations': visitor_locations.count(),
     }
@@ -334,45 +343,42 @@ def performance_view(request, url_id=None):
     days = int(request.GET.get('days', 7))
     start_date = timezone.now() - timedelta(days=days)
     
-    # Base query - filter by user and URL if specified
-    perf_query = PerformanceMetric.objects.filter(
-        timestamp__gte=start_date,
+    # Per-day percentile sketches built at ingest - filter by user and URL if specified
+    sketch_query = WebVitalSketch.objects.filter(
+        date__gte=vitals_date(start_date),
         url__user=request.user  # Always filter by user ownership
     )
     if monitored_url:
-        perf_query = perf_query.filter(url=monitored_url)
-    
-    # Get average metrics
-    avg_metrics = perf_query.aggregate(
-        avg_fcp=Avg('first_contentful_paint'),
-        avg_lcp=Avg('largest_contentful_paint'),
-        avg_fid=Avg('first_input_delay'),
-        avg_cls=Avg('cumulative_layout_shift'),
-        avg_tti=Avg('time_to_interactive'),
-        avg_dom_load=Avg('dom_load_time'),
-        avg_page_load=Avg('page_load_time')
-    )
-    
-    # Get metrics over time
-    metrics_over_time = perf_query.annotate(
-        date=TruncDate('timestamp')
-    ).values('date').annotate(
-        avg_fcp=Avg('first_contentful_paint'),
-        avg_lcp=Avg('largest_contentful_paint'),
-        avg_fid=Avg('first_input_delay'),
-        avg_cls=Avg('cumulative_layout_shift'),
-        count=Count('id')
-    ).order_by('date')
+        sketch_query = sketch_query.filter(url=monitored_url)
+    
+    # p50/p75/p95 for the range, per page and per day from one pass over the sketches
+    vitals, vitals_by_page, vitals_by_day = vitals_report(sketch_query)
+    
+    # Get metrics over time (p75, as used for the Core Web Vitals assessment)
+    metrics_over_time = [
+        {
+            'date': date,
+            'p75_fcp': day['fcp']['p75'],
+            'p75_lcp': day['lcp']['p75'],
+            'p75_fid': day['fid']['p75'],
+            'p75_cls': day['cls']['p75'],
+            'count': max(summary['count'] for summary in day.values()),
+        }
+        for date, day in sorted(vitals_by_day.items())
+    ]
     
     # Get performance by page
-    performance_by_page = perf_query.values('page_url').annotate(
-        samples=Count('id'),
-        avg_fcp=Avg('first_contentful_paint'),
-        avg_lcp=Avg('largest_contentful_paint'),
-        avg_fid=Avg('first_input_delay'),
-        avg_cls=Avg('cumulative_layout_shift'),
-        avg_page_load=Avg('page_load_time')
-    ).order_by('-samples')[:10]
+    performance_by_page = sorted(
+        (
+            {
+                'page_url': page_url,
+                'samples': max(summary['count'] for summary in page.values()),
+                **{metric: summary['p75'] for metric, summary in page.items()},
+            }
+            for page_url, page in vitals_by_page.items()
+        ),
+        key=lambda page: -page['samples']
+    )[:10]
     
     # Get performance by device (from PageView for device info)
     pageview_query = PageView.objects.filter(
@@ -386,24 +392,26 @@ def performance_view(request, url_id=None):
         count=Count('id')
     ).order_by('-count')
     
-    # Calculate scores (Google's thresholds)
-    def calculate_score(metrics):
-        scores = {
-            'fcp': 'good' if (metrics.get('avg_fcp') or 0) < 1800 else ('needs_improvement' if (metrics.get('avg_fcp') or 0) < 3000 else 'poor'),
-            'lcp': 'good' if (metrics.get('avg_lcp') or 0) < 2500 else ('needs_improvement' if (metrics.get('avg_lcp') or 0) < 4000 else 'poor'),
-            'fid': 'good' if (metrics.get('avg_fid') or 0) < 100 else ('needs_improvement' if (metrics.get('avg_fid') or 0) < 300 else 'poor'),
-            'cls': 'good' if (metrics.get('avg_cls') or 0) < 0.1 else ('needs_improvement' if (metrics.get('avg_cls') or 0) < 0.25 else 'poor'),
-        }
-        return scores
+    # Calculate scores (Google's thresholds, applied to the 75th percentile)
+    def rate(value, good, poor):
+        value = value or 0
+        return 'good' if value < good else ('needs_improvement' if value < poor else 'poor')
+    
+    scores = {
+        'fcp': rate(vitals['fcp']['p75'], 1800, 3000),
+        'lcp': rate(vitals['lcp']['p75'], 2500, 4000),
+        'fid': rate(vitals['fid']['p75'], 100, 300),
+        'cls': rate(vitals['cls']['p75'], 0.1, 0.25),
+    }
     
     context = {
         'monitored_url': monitored_url,
         'all_monitored_urls': all_monitored_urls,
         'days': days,
-        'avg_metrics': avg_metrics,
-        'scores': calculate_score(avg_metrics),
-        'metrics_over_time': json.dumps(list(metrics_over_time), default=str),
-        'performance_by_page': list(performance_by_page),
+        'vitals': vitals,
+        'scores': scores,
+        'metrics_over_time': json.dumps(metrics_over_time, default=str),
+        'performance_by_page': performance_by_page,
         'performance_by_device': list(performance_by_device),
     }
     
@@ -425,65 +433,20 @@ def scroll_depth_view(request, url_id=None):
     days = int(request.GET.get('days', 7))
     start_date = timezone.now() - timedelta(days=days)
     
-    # Get all pageviews with scroll data - filter by user
-    pageviews_query = PageView.objects.filter(
-        timestamp__gte=start_date,
-        url__user=request.user
-    )
-    if monitored_url:
-        pageviews_query = pageviews_query.filter(url=monitored_url)
+    # Materialized daily ScrollHeatmap rows (plus the days since the last run, computed live) - filter by user
+    scroll_urls = [monitored_url] if monitored_url else MonitoredURL.objects.filter(user=request.user)
+    scroll_rows = scroll_depth.rows_for_range(scroll_urls, start_date)
     
     # Calculate scroll depth distribution
     scroll_ranges = {
-        '0-10%': 0, '10-20%': 0, '20-30%': 0, '30-40%': 0, '40-50%': 0,
-        '50-60%': 0, '60-70%': 0, '70-80%': 0, '80-90%': 0, '90-100%': 0
+        f"{label}%": views for label, views in scroll_depth.merge_distribution(scroll_rows).items()
     }
     
-    for pv in pageviews_query:
-        depth = pv.scroll_depth
-        if depth < 10:
-            scroll_ranges['0-10%'] += 1
-        elif depth < 20:
-            scroll_ranges['10-20%'] += 1
-        elif depth < 30:
-            scroll_ranges['20-30%'] += 1
-        elif depth < 40:
-            scroll_ranges['30-40%'] += 1
-        elif depth < 50:
-            scroll_ranges['40-50%'] += 1
-        elif depth < 60:
-            scroll_ranges['50-60%'] += 1
-        elif depth < 70:
-            scroll_ranges['60-70%'] += 1
-        elif depth < 80:
-            scroll_ranges['70-80%'] += 1
-        elif depth < 90:
-            scroll_ranges['80-90%'] += 1
-        else:
-            scroll_ranges['90-100%'] += 1
-    
-    # Get average scroll depth by page - filter by user
-    scroll_by_page_query = PageView.objects.filter(
-        timestamp__gte=start_date,
-        scroll_depth__gt=0,
-        url__user=request.user
-    )
-    if monitored_url:
-        scroll_by_page_query = scroll_by_page_query.filter(url=monitored_url)
-    
-    scroll_by_page = scroll_by_page_query.values('page_url').annotate(
-        avg_scroll=Avg('scroll_depth'),
-        views=Count('id'),
-        scrolled_to_bottom=Count('id', filter=Q(scroll_depth__gte=90))
-    ).order_by('-views')[:15]
+    # Get average scroll depth by page
+    scroll_by_page = scroll_depth.page_summary(scroll_rows, limit=15)
     
     # Get scroll depth over time (daily aggregation)
-    scroll_over_time = pageviews_query.extra(
-        select={'date': 'DATE(timestamp)'}
-    ).values('date').annotate(
-        avg_scroll=Avg('scroll_depth'),
-        total_views=Count('id')
-    ).order_by('date')
+    scroll_over_time = scroll_depth.daily_series(scroll_rows)
     
     # Calculate max count for distribution bar scaling
     max_count = max(scroll_ranges.values()) if scroll_ranges else 1
@@ -498,8 +461,48 @@ def scroll_depth_view(request, url_id=None):
         'scroll_ranges': scroll_ranges,
         'max_count': max_count,
         'deep_scrollers': deep_scrollers,
-        'scroll_by_page': list(scroll_by_page),
-        'scroll_over_time': list(scroll_over_time),
+        'scroll_by_page': scroll_by_page,
+        'scroll_over_time': scroll_over_time,
     }
     
     return render(request, 'analytics/scroll_depth.html', context)
+
+
+REPLAY_BATCH_SIZE = 200  # Timeline entries serialized per streamed piece
+
+
+def _replay_json(recording):
+    """JSON document of a recording, with the timeline streamed chunk by chunk"""
+    summary = {
+        'session_id': recording.session_id,
+        'visitor_id': recording.visitor_id,
+        'start_time': recording.start_time.isoformat(),
+        'end_time': recording.end_time.isoformat() if recording.end_time else None,
+        'duration': recording.duration,
+        'pages_visited': recording.pages_visited,
+        'total_clicks': recording.total_clicks,
+        'total_scrolls': recording.total_scrolls,
+        'had_errors': recording.had_errors,
+        'had_rage_clicks': recording.had_rage_clicks,
+        'device_type': recording.device_type,
+        'browser': recording.browser,
+    }
+    yield json.dumps(summary)[:-1] + ', "events": ['
+    batch = []
+    separator = ''
+    for entry in iter_events(recording.pk):
+        batch.append(entry)
+        if len(batch) >= REPLAY_BATCH_SIZE:
+            yield separator + json.dumps(batch)[1:-1]
+            separator = ', '
+            batch = []
+    if batch:
+        yield separator + json.dumps(batch)[1:-1]
+    yield ']}'
+
+
+@login_required
+def session_replay(request, session_id):
+    """Stream a session recording's event timeline for replay"""
+    recording = get_object_or_404(SessionRecording, session_id=session_id, url__user=request.user)
+    return StreamingHttpResponse(_replay_json(recording), content_type='application/json')
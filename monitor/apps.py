@@ -7,9 +7,24 @@ class MonitorConfig(AppConfig):
     name = 'monitor'
 
     def ready(self):
-        # Only start scheduler in production (gunicorn) or development (runserver)
+        from . import signals  # noqa: F401 - registers signal handlers
+        
+        # Only start background services in production (gunicorn) or development (runserver)
         # Skip during migrations, shell, etc.
-        if 'runserver' in sys.argv or 'gunicorn' in os.environ.get('SERVER_SOFTWARE', ''):
+        from django.conf import settings
+        if not ('runserver' in sys.argv or 'gunicorn' in os.environ.get('SERVER_SOFTWARE', '')):
+            return
+        
+        if (getattr(settings, 'TRACKING_INGEST_MODE', 'sync') == 'queue'
+                and getattr(settings, 'INGEST_CONSUMER_AUTOSTART', True)):
+            try:
+                from .ingest_queue import start_ingest_consumer
+                start_ingest_consumer()
+            except Exception as e:
+                import logging
+                logging.getLogger(__name__).error(f"Failed to start ingest consumer: {e}")
+        
+        if getattr(settings, 'SCHEDULER_AUTOSTART', True):
             try:
                 from .scheduler import start_scheduler
                 import logging
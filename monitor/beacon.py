@@ -0,0 +1,118 @@
+"""
+Tracker Beacon Decoding
+Turns a tracking request body into the list of event dicts EventCollector
+expects, accepting plain JSON or the compact beacon format, optionally
+gzip/deflate compressed
+
+Compact format (Content-Type application/vnd.urlmonitor.beacon+json):
+    {"v": 1, "s": session_id, "u": visitor_id, "p": page_url, "t": epoch_ms,
+     "e": [[type, delta_ms, {other fields}], ...]}
+
+Fields shared by the whole batch are sent once in the header. Each event's
+timestamp is delta_ms after the previous one (the first is relative to
+"t"), and an event may override page_url in its own fields. Event times are
+taken from when the server receives the batch, so the deltas are not
+expanded. navigator.sendBeacon cannot set the beacon Content-Type; its
+text/plain bodies are recognised by the header fields instead.
+"""
+import json
+import zlib
+
+BEACON_CONTENT_TYPE = 'application/vnd.urlmonitor.beacon+json'
+BEACON_VERSION = 1
+MAX_DECODED_SIZE = 5 * 1024 * 1024  # Bytes a compressed body may expand to
+HEADER_FIELDS = {'s': 'session_id', 'u': 'visitor_id', 'p': 'page_url'}
+COMPACT_KEYS = {'v', 's', 'u', 't', 'e'}  # Header keys every compact payload carries
+SNIFFED_CONTENT_TYPE = 'text/plain'  # What sendBeacon sends compact payloads as
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class BeaconError(ValueError):
+    """The request body could not be decoded"""
+
+
+def _decompress(body, wbits):
+    decompressor = zlib.decompressobj(wbits)
+    try:
+        data = decompressor.decompress(body, MAX_DECODED_SIZE)
+    except zlib.error as e:
+        raise BeaconError(f"invalid compressed body: {e}")
+    if decompressor.unconsumed_tail:
+        raise BeaconError("decompressed body too large")
+    return data
+
+
+def decompress_body(body, content_encoding=''):
+    """
+    Undo gzip/deflate compression. The encoding comes from the
+    Content-Encoding header, or is sniffed from the body because
+    navigator.sendBeacon cannot set that header.
+    """
+    encoding = (content_encoding or '').strip().lower()
+    if encoding == 'gzip' or (not encoding and body[:2] == GZIP_MAGIC):
+        return _decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate' or (not encoding and body[:1] == b'\x78'):
+        # "deflate" is zlib-wrapped per RFC 9110, but some clients send it raw
+        return _decompress(body, zlib.MAX_WBITS if body[:1] == b'\x78' else -zlib.MAX_WBITS)
+    if encoding not in ('', 'identity'):
+        raise BeaconError(f"unsupported content encoding {encoding}")
+    return body
+
+
+def expand_compact(payload):
+    """Event dicts for a compact beacon payload"""
+    if payload.get('v') != BEACON_VERSION:
+        raise BeaconError(f"unsupported beacon version {payload.get('v')}")
+    shared = {name: payload[key] for key, name in HEADER_FIELDS.items() if key in payload}
+    entries = payload.get('e')
+    if not isinstance(entries, list):
+        raise BeaconError("missing events")
+
+    try:
+        events = []
+        for entry in entries:
+            event_type, _, fields = entry  # Deltas are not used, see above
+            event = dict(shared)
+            event.update(fields or {})
+            event['type'] = event_type
+            events.append(event)
+    except (TypeError, ValueError) as e:
+        raise BeaconError(f"malformed event: {e}")
+    return events
+
+
+def is_compact(payload, content_type=''):
+    """
+    Whether payload is in the compact format: always when sent with the
+    beacon Content-Type, and for text/plain sendBeacon bodies only when it
+    has the full compact header
+    """
+    media_type = content_type.split(';')[0].strip().lower()
+    if media_type == BEACON_CONTENT_TYPE:
+        return True
+    return media_type == SNIFFED_CONTENT_TYPE and COMPACT_KEYS <= payload.keys()
+
+
+def decode_events(body, content_type='', content_encoding=''):
+    """Events carried by a tracking request body (plain or compact format)"""
+    body = decompress_body(body, content_encoding)
+    try:
+        payload = json.loads(body)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise BeaconError(f"invalid JSON: {e}")
+    if not isinstance(payload, dict):
+        raise BeaconError("payload must be an object")
+
+    if is_compact(payload, content_type):
+        return expand_compact(payload)
+    return payload.get('events', [])
+
+
+def decode_request(request):
+    """decode_events() for a Django request"""
+    return decode_events(
+        request.body,
+        request.META.get('CONTENT_TYPE', ''),
+        request.META.get('HTTP_CONTENT_ENCODING', ''),
+    )
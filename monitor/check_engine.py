@@ -0,0 +1,191 @@
+"""
+Asyncio Check Engine
+Runs HTTP checks for many URLs concurrently on a single event loop thread
+"""
+import asyncio
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MAX_CONCURRENT_CHECKS = 500  # Checks allowed in flight at once across all hosts
+MAX_CONNECTIONS_PER_HOST = 4  # Open sockets allowed to a single host
+CHECK_TIMEOUT = 10  # Seconds before a check is considered timed out
+RESULT_WORKERS = 4  # Threads used to persist results through the Django ORM
+USER_AGENT = 'URLMonitor/1.0'
+
+
+class AsyncCheckEngine:
+    """
+    Owns an asyncio event loop running in a daemon thread.
+
+    Checks are submitted from any thread with submit(); each one runs as a
+    coroutine on the shared loop, so thousands of in-flight checks cost a few
+    KB each instead of an OS thread and a fresh connection each. Completed
+    results are handed to result_handler on a small thread pool because the
+    Django ORM is synchronous.
+    """
+
+    def __init__(self, result_handler, max_concurrent=MAX_CONCURRENT_CHECKS,
+                 per_host_limit=MAX_CONNECTIONS_PER_HOST, timeout=CHECK_TIMEOUT):
+        self.result_handler = result_handler
+        self.max_concurrent = max_concurrent
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.loop = None
+        self.thread = None
+        self.running = False
+        self._ready = threading.Event()
+        self._session = None
+        self._semaphore = None
+        self._executor = None
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the event loop thread"""
+        if self.running:
+            return
+
+        self.running = True
+        self._ready.clear()
+        self._executor = ThreadPoolExecutor(max_workers=RESULT_WORKERS, thread_name_prefix='check-result')
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+        self._ready.wait(timeout=5)
+        logger.info(f"Check engine started (max {self.max_concurrent} concurrent, {self.per_host_limit} per host)")
+
+    def stop(self):
+        """Cancel outstanding checks and stop the event loop thread"""
+        if not self.running:
+            return
+
+        self.running = False
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        try:
+            future.result(timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"Check engine shutdown did not complete cleanly: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self._executor.shutdown(wait=True)
+        logger.info("Check engine stopped")
+
+    def submit(self, url):
+        """
+        Queue a check for a MonitoredURL. Returns False if a check for the
+        same URL is already in flight, True otherwise.
+        """
+        if not self.running:
+            self.start()
+
+        with self._lock:
+            if url.id in self._in_flight:
+                logger.debug(f"Check already in flight for {url.url}, skipping")
+                return False
+            self._in_flight.add(url.id)
+
+        asyncio.run_coroutine_threadsafe(self._check(url), self.loop)
+        return True
+
+    @property
+    def in_flight(self):
+        """Number of checks currently queued or running"""
+        return len(self._in_flight)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._setup())
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    async def _setup(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrent,
+            limit_per_host=self.per_host_limit,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'User-Agent': USER_AGENT},
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+    async def _shutdown(self):
+        tasks = [t for t in asyncio.all_tasks(self.loop) if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._session:
+            await self._session.close()
+
+    async def _check(self, url):
+        try:
+            async with self._semaphore:
+                result = await self._fetch(url)
+            await self.loop.run_in_executor(self._executor, self._handle_result, url, result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Fatal error checking {url.url}: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._in_flight.discard(url.id)
+
+    async def _fetch(self, url):
+        """Perform the HTTP request and return a result dict"""
+        logger.info(f"Checking URL: {url.url}")
+
+        start_time = time.monotonic()
+        try:
+            async with self._session.get(url.url, allow_redirects=True, ssl=True if url.check_ssl else False) as response:
+                # Drain the body in small chunks so the connection can be reused
+                # without holding the whole page in memory
+                async for _ in response.content.iter_chunked(64 * 1024):
+                    pass
+                response_time = (time.monotonic() - start_time) * 1000  # Convert to ms
+                status_code = response.status
+                is_up = (status_code == url.expected_status)
+                error_message = None
+
+        except asyncio.TimeoutError:
+            response_time = self.timeout * 1000
+            status_code = 0
+            is_up = False
+            error_message = f"Timed out after {self.timeout}s"
+            logger.warning(f"Timeout checking {url.url}")
+
+        except Exception as e:
+            response_time = 0
+            status_code = 0
+            is_up = False
+            error_message = str(e) or e.__class__.__name__
+            logger.error(f"Error checking {url.url}: {error_message}")
+
+        return {
+            'status_code': status_code,
+            'response_time': response_time,
+            'is_up': is_up,
+            'error_message': error_message,
+        }
+
+    def _handle_result(self, url, result):
+        """Hand a finished check to the result handler (runs in the executor)"""
+        close_old_connections()
+        try:
+            self.result_handler(url, result)
+        except Exception as e:
+            logger.error(f"Error recording result for {url.url}: {e}", exc_info=True)
+        finally:
+            close_old_connections()
@@ -0,0 +1,100 @@
+"""
+Dashboard Data
+Computes the dashboard and URL list figures with a fixed number of grouped
+queries, regardless of how many URLs a user monitors
+"""
+from datetime import timedelta
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from .rollups import day_bucket, rollup_source
+
+
+def status_summary(urls):
+    """Stats cards (total, up, down, average response) in one aggregate query"""
+    totals = urls.aggregate(
+        total_urls=Count('id'),
+        up_urls=Count('id', filter=Q(state__is_up=True)),
+        down_urls=Count('id', filter=Q(state__is_up=False)),
+        checked_urls=Count('state'),
+        response_sum=Sum('state__last_response_time', filter=Q(state__last_response_time__gt=0)),
+    )
+    checked = totals.pop('checked_urls')
+    response_sum = totals.pop('response_sum') or 0
+    totals['avg_response_time'] = response_sum / checked if checked else 0
+    return totals
+
+
+def uptime_by_url(urls, since, now=None):
+    """
+    Uptime and average response per URL since `since`, from the rollups in
+    one grouped query. Returns {url_id: {'checks', 'uptime', 'avg_response'}}
+    for URLs with checks in the window.
+    """
+    model, start = rollup_source(since, now)
+    rows = model.objects.filter(url__in=urls, bucket__gte=start).values('url_id').annotate(
+        checks=Sum('check_count'),
+        up=Sum('up_count'),
+        latency=Sum('latency_sum'),
+    )
+    return {
+        row['url_id']: {
+            'checks': row['checks'],
+            'uptime': round(row['up'] / row['checks'] * 100, 2),
+            'avg_response': round(row['latency'] / row['checks'], 2),
+        }
+        for row in rows
+        if row['checks']
+    }
+
+
+def daily_chart(urls, days=7, now=None):
+    """
+    Uptime and average response across all given URLs for each of the last
+    `days` days (UTC), from the daily rollups in one grouped query. Days
+    without checks are reported as 0.
+    """
+    from monitor.models import StatusRollupDaily
+
+    now = now or timezone.now()
+    first_day = day_bucket(now) - timedelta(days=days - 1)
+    rows = StatusRollupDaily.objects.filter(url__in=urls, bucket__gte=first_day).values('bucket').annotate(
+        checks=Sum('check_count'),
+        up=Sum('up_count'),
+        latency=Sum('latency_sum'),
+    )
+    by_day = {row['bucket']: row for row in rows}
+
+    chart = {'labels': [], 'uptime': [], 'response_times': []}
+    for i in range(days):
+        day = first_day + timedelta(days=i)
+        row = by_day.get(day)
+        chart['labels'].append(day.strftime('%b %d'))
+        if row and row['checks']:
+            chart['uptime'].append(round(row['up'] / row['checks'] * 100, 2))
+            chart['response_times'].append(round(row['latency'] / row['checks'], 2))
+        else:
+            chart['uptime'].append(0)
+            chart['response_times'].append(0)
+    return chart
+
+
+def enrich_urls(urls, uptime_since, now=None):
+    """
+    Evaluate urls (which should select_related('state')) and attach display
+    fields to each: display_status, last_response_time, and uptime /
+    avg_response for the window starting at uptime_since (None without data).
+    """
+    urls = list(urls)
+    uptime = uptime_by_url([url.id for url in urls], uptime_since, now)
+    for url in urls:
+        state = url.current_state
+        url.last_response_time = state.last_response_time if state else None
+        if state:
+            url.display_status = "UP" if state.is_up else "DOWN"
+        else:
+            url.display_status = "UNKNOWN"
+
+        window = uptime.get(url.id)
+        url.uptime = window['uptime'] if window else None
+        url.avg_response = window['avg_response'] if window else None
+    return urls
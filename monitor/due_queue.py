@@ -0,0 +1,152 @@
+"""
+Due-Time Priority Queue
+Keeps monitors in a min-heap keyed on their next check time
+"""
+import heapq
+import itertools
+import threading
+from datetime import timedelta
+from django.db.models import F
+from django.utils import timezone
+
+
+def due_urls_queryset(queryset=None):
+    """
+    Active MonitoredURLs annotated with last_checked, the time of their latest
+    check from MonitorState. One join replaces a latest-status lookup per URL.
+    """
+    from monitor.models import MonitoredURL
+
+    if queryset is None:
+        queryset = MonitoredURL.objects.all()
+    return queryset.filter(is_active=True).annotate(last_checked=F('state__last_checked_at'))
+
+
+def next_due_time(last_checked, frequency, now=None):
+    """When a URL checked at last_checked becomes due again (now if never checked)"""
+    now = now or timezone.now()
+    if last_checked is None:
+        return now
+    return last_checked + timedelta(minutes=frequency)
+
+
+class DueQueue:
+    """
+    Thread-safe min-heap of (due_time, url_id).
+
+    Rescheduling or removing a URL does not search the heap: the URL's entry
+    map is updated and stale heap entries are discarded when they surface,
+    so every operation is O(log n) and a tick costs O(due items).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}  # url_id -> (due_time, frequency, seq)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, url_id):
+        return url_id in self._entries
+
+    def seed(self, queryset=None, key=None):
+        """
+        Rebuild the queue from the database with a single aggregate query.
+        If key is given, only URL ids for which key(url_id) is true are kept.
+        """
+        now = timezone.now()
+        rows = due_urls_queryset(queryset).values_list('id', 'frequency', 'last_checked')
+
+        heap = []
+        entries = {}
+        for url_id, frequency, last_checked in rows:
+            if key is not None and not key(url_id):
+                continue
+            due = next_due_time(last_checked, frequency, now)
+            seq = next(self._counter)
+            entries[url_id] = (due, frequency, seq)
+            heap.append((due, seq, url_id))
+        heapq.heapify(heap)
+
+        with self._lock:
+            self._heap = heap
+            self._entries = entries
+        return len(entries)
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+            self._entries = {}
+
+    def schedule(self, url_id, due, frequency):
+        """Insert a URL or move it to a new due time"""
+        with self._lock:
+            seq = next(self._counter)
+            self._entries[url_id] = (due, frequency, seq)
+            heapq.heappush(self._heap, (due, seq, url_id))
+
+    def reschedule_after_check(self, url_id, checked_at=None):
+        """Move a URL to checked_at + frequency, if it is still tracked"""
+        checked_at = checked_at or timezone.now()
+        with self._lock:
+            entry = self._entries.get(url_id)
+            if entry is None:
+                return
+            frequency = entry[1]
+            due = checked_at + timedelta(minutes=frequency)
+            seq = next(self._counter)
+            self._entries[url_id] = (due, frequency, seq)
+            heapq.heappush(self._heap, (due, seq, url_id))
+
+    def update_frequency(self, url_id, frequency):
+        """
+        Track a newly saved URL or apply a changed frequency, keeping the
+        current due time anchored to the previous check
+        """
+        with self._lock:
+            entry = self._entries.get(url_id)
+            if entry is None:
+                due = timezone.now()
+            elif entry[1] == frequency:
+                return
+            else:
+                due = entry[0] + timedelta(minutes=frequency - entry[1])
+            seq = next(self._counter)
+            self._entries[url_id] = (due, frequency, seq)
+            heapq.heappush(self._heap, (due, seq, url_id))
+
+    def remove(self, url_id):
+        with self._lock:
+            self._entries.pop(url_id, None)
+
+    def pop_due(self, now=None):
+        """
+        Return the ids of all URLs due at or before now. Popped URLs stay
+        tracked (with their old due time) until reschedule_after_check() is
+        called, so a save during the check keeps its frequency.
+        """
+        now = now or timezone.now()
+        due_ids = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, seq, url_id = heapq.heappop(self._heap)
+                entry = self._entries.get(url_id)
+                if entry is None or entry[2] != seq:
+                    continue  # Stale entry (removed or rescheduled)
+                due_ids.append(url_id)
+        return due_ids
+
+    def seconds_until_next(self, now=None):
+        """Seconds until the earliest live entry is due, or None if empty"""
+        now = now or timezone.now()
+        with self._lock:
+            while self._heap:
+                due, seq, url_id = self._heap[0]
+                entry = self._entries.get(url_id)
+                if entry is None or entry[2] != seq:
+                    heapq.heappop(self._heap)
+                    continue
+                return max((due - now).total_seconds(), 0)
+        return None
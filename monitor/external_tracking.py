@@ -2,272 +2,108 @@
 External URL Tracking Views
 For embedding analytics on monitored websites
 """
+import hashlib
+import logging
+import re
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.http import require_POST, require_GET
+from django.http import JsonResponse, HttpResponse, Http404
+from django.template.loader import get_template
+from django.utils.html import escapejs
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_POST, require_GET, condition
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from .models import MonitoredURL, PageView, ClickHeatmap, MouseMovement, PerformanceMetric
-from .analytics_api import get_client_ip, get_geolocation
-from user_agents import parse
-import json
+from .models import MonitoredURL
+from .analytics_api import get_client_ip, describe_client
+from .ingest import EventCollector
+from .ingest_queue import enqueue_events, ingest_queue_enabled, valid_event_batch
+from .geolocation import LookupCache
+from .beacon import BeaconError, decode_request
+
+logger = logging.getLogger(__name__)
+
+# Tracking script
+SCRIPT_TEMPLATE = 'tracking/tracker.js'
+SCRIPT_PLACEHOLDERS = ('url_id', 'api_endpoint')  # The only values injected per URL
+SCRIPT_MAX_AGE = 3600  # Seconds browsers and CDNs reuse the script before revalidating
+
+_compiled_script = None
+# URL ids known to exist (False for unknown ids is kept briefly)
+_known_urls = LookupCache(maxsize=10000, ttl=300, negative_ttl=30)
 
 
 def add_cors_headers(response):
     """Add CORS headers to allow external websites to send tracking data"""
     response['Access-Control-Allow-Origin'] = '*'
     response['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-    response['Access-Control-Allow-Headers'] = 'Content-Type'
+    response['Access-Control-Allow-Headers'] = 'Content-Type, Content-Encoding'
     response['Access-Control-Max-Age'] = '86400'  # 24 hours
     return response
 
 
+def _compile_tracking_script():
+    """
+    Render templates/tracking/tracker.js once with marker values, minify it
+    and split it around the markers, so serving it is a string join
+    """
+    markers = {name: f'\x00{name}\x00' for name in SCRIPT_PLACEHOLDERS}
+    source = get_template(SCRIPT_TEMPLATE).render(markers)
+
+    # Conservative minification: drop indentation, blank lines and whole-line
+    # comments, keeping line breaks so automatic semicolon insertion still works
+    lines = (line.strip() for line in source.splitlines())
+    minified = '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+    parts = re.split(r'\x00(\w+)\x00', minified)
+    digest = hashlib.sha256(minified.encode()).hexdigest()[:16]
+    return parts, digest
+
+
+def _tracking_script():
+    """(template parts, version digest), compiled once per process"""
+    global _compiled_script
+    if _compiled_script is None:
+        _compiled_script = _compile_tracking_script()
+    return _compiled_script
+
+
+def _tracking_endpoint(request, url_id):
+    return f"{request.scheme}://{request.get_host()}/api/track/{url_id}/"
+
+
+def _tracking_script_etag(request, url_id):
+    """Strong ETag: changes with the script source, the URL id or the host"""
+    parts, digest = _tracking_script()
+    key = f"{digest}:{url_id}:{_tracking_endpoint(request, url_id)}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def _url_exists(url_id):
+    return MonitoredURL.objects.filter(id=url_id).exists()
+
+
 @require_GET
+@cache_control(public=True, max_age=SCRIPT_MAX_AGE)
+@condition(etag_func=_tracking_script_etag)
 def get_tracking_script(request, url_id):
     """
     Returns a JavaScript tracking script that can be embedded on monitored websites
     Usage: <script src="/tracking/{url_id}/script.js"></script>
+
+    Conditional requests whose If-None-Match matches are answered 304 by
+    @condition before this runs, without touching the database.
     """
-    monitored_url = get_object_or_404(MonitoredURL, id=url_id)
-    
-    # Generate the tracking script with the URL ID embedded
-    script = f"""
-(function() {{
-    'use strict';
-    
-    const TRACKING_URL_ID = '{url_id}';
-    const API_ENDPOINT = '{request.scheme}://{request.get_host()}/api/track/{url_id}/';
-    
-    // Generate unique IDs
-    const generateId = () => Math.random().toString(36).substr(2, 9) + Date.now().toString(36);
-    
-    const getVisitorId = () => {{
-        let visitorId = localStorage.getItem('urlmon_visitor_id');
-        if (!visitorId) {{
-            visitorId = generateId();
-            localStorage.setItem('urlmon_visitor_id', visitorId);
-        }}
-        return visitorId;
-    }};
-    
-    const getSessionId = () => {{
-        let sessionId = sessionStorage.getItem('urlmon_session_id');
-        if (!sessionId) {{
-            sessionId = generateId();
-            sessionStorage.setItem('urlmon_session_id', sessionId);
-        }}
-        return sessionId;
-    }};
-    
-    class URLMonitorTracker {{
-        constructor() {{
-            this.visitorId = getVisitorId();
-            this.sessionId = getSessionId();
-            this.pageLoadTime = Date.now();
-            this.eventQueue = [];
-            this.maxScrollDepth = 0;
-            this.clickCount = 0;
-            this.lastClickTime = 0;
-            this.lastClickPosition = null;
-            
-            this.init();
-        }}
-        
-        init() {{
-            this.trackPageView();
-            this.setupClickTracking();
-            this.setupScrollTracking();
-            this.trackPerformanceMetrics();
-            
-            window.addEventListener('beforeunload', () => this.handlePageLeave());
-            setInterval(() => this.flush(), 5000);
-        }}
-        
-        trackPageView() {{
-            const data = {{
-                type: 'pageview',
-                session_id: this.sessionId,
-                visitor_id: this.visitorId,
-                page_url: window.location.pathname,
-                page_title: document.title,
-                referrer: document.referrer,
-                timestamp: new Date().toISOString(),
-                user_agent: navigator.userAgent,
-                screen_resolution: `${{screen.width}}x${{screen.height}}`,
-                viewport_size: `${{window.innerWidth}}x${{window.innerHeight}}`,
-                language: navigator.language
-            }};
-            
-            this.sendImmediately(data);
-        }}
-        
-        setupClickTracking() {{
-            document.addEventListener('click', (e) => {{
-                const now = Date.now();
-                const position = {{ x: e.clientX, y: e.clientY }};
-                
-                this.clickCount++;
-                
-                // Check for rage click
-                if (this.lastClickPosition && 
-                    Math.abs(position.x - this.lastClickPosition.x) < 20 &&
-                    Math.abs(position.y - this.lastClickPosition.y) < 20 &&
-                    now - this.lastClickTime < 1000) {{
-                    
-                    if (this.clickCount >= 3) {{
-                        this.queueEvent({{
-                            type: 'rage_click',
-                            page_url: window.location.pathname,
-                            session_id: this.sessionId,
-                            visitor_id: this.visitorId,
-                            x_position: position.x,
-                            y_position: position.y,
-                            click_count: this.clickCount,
-                            timestamp: new Date().toISOString()
-                        }});
-                    }}
-                }} else {{
-                    this.clickCount = 1;
-                }}
-                
-                this.lastClickTime = now;
-                this.lastClickPosition = position;
-                
-                // Track regular click
-                this.queueEvent({{
-                    type: 'click',
-                    page_url: window.location.pathname,
-                    session_id: this.sessionId,
-                    visitor_id: this.visitorId,
-                    x_position: e.clientX,
-                    y_position: e.clientY,
-                    viewport_width: window.innerWidth,
-                    viewport_height: window.innerHeight,
-                    element_tag: e.target.tagName.toLowerCase(),
-                    element_id: e.target.id || '',
-                    element_class: e.target.className || '',
-                    element_text: e.target.textContent?.substring(0, 100) || '',
-                    timestamp: new Date().toISOString()
-                }});
-            }});
-        }}
-        
-        setupScrollTracking() {{
-            let scrollTimeout;
-            document.addEventListener('scroll', () => {{
-                clearTimeout(scrollTimeout);
-                scrollTimeout = setTimeout(() => {{
-                    const scrollDepth = Math.round(
-                        (window.scrollY / (document.documentElement.scrollHeight - window.innerHeight)) * 100
-                    );
-                    
-                    if (scrollDepth > this.maxScrollDepth) {{
-                        this.maxScrollDepth = scrollDepth;
-                    }}
-                    
-                    this.queueEvent({{
-                        type: 'scroll',
-                        page_url: window.location.pathname,
-                        session_id: this.sessionId,
-                        visitor_id: this.visitorId,
-                        scroll_depth: scrollDepth,
-                        timestamp: new Date().toISOString()
-                    }});
-                }}, 150);
-            }});
-        }}
-        
-        trackPerformanceMetrics() {{
-            if (!window.performance) return;
-            
-            window.addEventListener('load', () => {{
-                setTimeout(() => {{
-                    const timing = performance.timing;
-                    const data = {{
-                        type: 'performance',
-                        page_url: window.location.pathname,
-                        session_id: this.sessionId,
-                        visitor_id: this.visitorId,
-                        dom_load_time: timing.domContentLoadedEventEnd - timing.domContentLoadedEventStart,
-                        page_load_time: timing.loadEventEnd - timing.navigationStart,
-                        timestamp: new Date().toISOString()
-                    }};
-                    
-                    // Try to get Web Vitals
-                    if (window.PerformanceObserver) {{
-                        const paintEntries = performance.getEntriesByType('paint');
-                        const fcpEntry = paintEntries.find(entry => entry.name === 'first-contentful-paint');
-                        if (fcpEntry) data.first_contentful_paint = fcpEntry.startTime;
-                    }}
-                    
-                    this.queueEvent(data);
-                }}, 100);
-            }});
-        }}
-        
-        handlePageLeave() {{
-            const timeOnPage = Math.round((Date.now() - this.pageLoadTime) / 1000);
-            this.sendBeacon({{
-                type: 'page_leave',
-                page_url: window.location.pathname,
-                session_id: this.sessionId,
-                visitor_id: this.visitorId,
-                time_on_page: timeOnPage,
-                scroll_depth: this.maxScrollDepth,
-                timestamp: new Date().toISOString()
-            }});
-        }}
-        
-        queueEvent(data) {{
-            this.eventQueue.push(data);
-            if (this.eventQueue.length >= 10) {{
-                this.flush();
-            }}
-        }}
-        
-        flush() {{
-            if (this.eventQueue.length === 0) return;
-            const events = [...this.eventQueue];
-            this.eventQueue = [];
-            this.send(events);
-        }}
-        
-        send(events) {{
-            fetch(API_ENDPOINT, {{
-                method: 'POST',
-                headers: {{ 'Content-Type': 'application/json' }},
-                body: JSON.stringify({{ events }}),
-                keepalive: true
-            }}).catch(() => {{
-                this.eventQueue.unshift(...events);
-            }});
-        }}
-        
-        sendImmediately(data) {{
-            fetch(API_ENDPOINT, {{
-                method: 'POST',
-                headers: {{ 'Content-Type': 'application/json' }},
-                body: JSON.stringify({{ events: [data] }}),
-                keepalive: true
-            }}).catch(() => {{}});
-        }}
-        
-        sendBeacon(data) {{
-            if (navigator.sendBeacon) {{
-                navigator.sendBeacon(API_ENDPOINT, JSON.stringify({{ events: [data] }}));
-            }}
-        }}
-    }}
-    
-    // Initialize tracker
-    if (document.readyState === 'loading') {{
-        document.addEventListener('DOMContentLoaded', () => new URLMonitorTracker());
-    }} else {{
-        new URLMonitorTracker();
-    }}
-}})();
-"""
-    
+    if not _known_urls.get_or_fetch(url_id, lambda: _url_exists(url_id)):
+        raise Http404("No MonitoredURL matches the given query.")
+
+    values = {
+        'url_id': str(url_id),
+        'api_endpoint': escapejs(_tracking_endpoint(request, url_id)),
+    }
+    parts, digest = _tracking_script()
+    # re.split leaves the marker names at the odd indexes
+    script = ''.join(values[part] if i % 2 else part for i, part in enumerate(parts))
+
     response = HttpResponse(script, content_type='application/javascript')
     return add_cors_headers(response)
 
@@ -290,125 +126,40 @@ def track_external_url(request, url_id):
     
     try:
         monitored_url = get_object_or_404(MonitoredURL, id=url_id)
-        data = json.loads(request.body)
-        events = data.get('events', [])
+        try:
+            # Plain {"events": [...]} JSON or the compact beacon format, optionally compressed
+            events = decode_request(request)
+        except BeaconError as e:
+            response = JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+            return add_cors_headers(response)
         
         if not events:
             response = JsonResponse({'status': 'error', 'message': 'No events'}, status=400)
             return add_cors_headers(response)
         
+        if not valid_event_batch(events):
+            response = JsonResponse({'status': 'error', 'message': 'Invalid events'}, status=400)
+            return add_cors_headers(response)
+        
         # Get client info
         ip_address = get_client_ip(request)
         user_agent_string = request.META.get('HTTP_USER_AGENT', '')
-        geo_data = get_geolocation(ip_address)
         
-        # Parse user agent
-        user_agent = parse(user_agent_string)
-        device_type = 'mobile' if user_agent.is_mobile else ('tablet' if user_agent.is_tablet else 'desktop')
-        browser = f"{user_agent.browser.family} {user_agent.browser.version_string}"
-        os = f"{user_agent.os.family} {user_agent.os.version_string}"
+        if ingest_queue_enabled():
+            # Respond right away; an ingest consumer parses and writes the events
+            enqueue_events(events, ip_address, user_agent_string, url=monitored_url)
+            response = JsonResponse({'status': 'queued', 'queued': len(events)}, status=202)
+            return add_cors_headers(response)
         
-        # Process each event
-        for event in events:
-            event_type = event.get('type')
-            
-            try:
-                if event_type == 'pageview':
-                    PageView.objects.create(
-                        url=monitored_url,
-                        session_id=event.get('session_id'),
-                        visitor_id=event.get('visitor_id'),
-                        page_url=event.get('page_url', ''),
-                        page_title=event.get('page_title', ''),
-                        referrer=event.get('referrer', ''),
-                        user_agent=user_agent_string,
-                        device_type=device_type,
-                        browser=browser,
-                        os=os,
-                        screen_resolution=event.get('screen_resolution', ''),
-                        ip_address=ip_address,
-                        **geo_data
-                    )
-                
-                elif event_type == 'click':
-                    ClickHeatmap.objects.create(
-                        url=monitored_url,
-                        page_url=event.get('page_url', ''),
-                        x_position=event.get('x_position'),
-                        y_position=event.get('y_position'),
-                        viewport_width=event.get('viewport_width'),
-                        viewport_height=event.get('viewport_height'),
-                        element_tag=event.get('element_tag', ''),
-                        element_id=event.get('element_id', ''),
-                        element_class=event.get('element_class', ''),
-                        element_text=event.get('element_text', ''),
-                        session_id=event.get('session_id'),
-                        device_type=device_type
-                    )
-                
-                elif event_type == 'rage_click':
-                    MouseMovement.objects.create(
-                        url=monitored_url,
-                        session_id=event.get('session_id'),
-                        page_url=event.get('page_url', ''),
-                        movement_type='rage_click',
-                        x_position=event.get('x_position', 0),
-                        y_position=event.get('y_position', 0),
-                        click_count=event.get('click_count', 1)
-                    )
-                
-                elif event_type == 'performance':
-                    PerformanceMetric.objects.create(
-                        url=monitored_url,
-                        page_url=event.get('page_url', ''),
-                        session_id=event.get('session_id'),
-                        first_contentful_paint=event.get('first_contentful_paint'),
-                        dom_load_time=event.get('dom_load_time'),
-                        page_load_time=event.get('page_load_time')
-                    )
-                
-                elif event_type == 'scroll':
-                    # Update the most recent pageview with scroll depth
-                    try:
-                        pageview = PageView.objects.filter(
-                            url=monitored_url,
-                            session_id=event.get('session_id'),
-                            visitor_id=event.get('visitor_id'),
-                            page_url=event.get('page_url', '')
-                        ).latest('timestamp')
-                        
-                        # Only update if new scroll depth is greater
-                        new_depth = event.get('scroll_depth', 0)
-                        if new_depth > pageview.scroll_depth:
-                            pageview.scroll_depth = new_depth
-                            pageview.save()
-                    except PageView.DoesNotExist:
-                        pass
-                
-                elif event_type == 'page_leave':
-                    # Update the most recent pageview with final metrics
-                    try:
-                        pageview = PageView.objects.filter(
-                            url=monitored_url,
-                            session_id=event.get('session_id'),
-                            visitor_id=event.get('visitor_id')
-                        ).latest('timestamp')
-                        
-                        pageview.time_on_page = event.get('time_on_page', 0)
-                        pageview.scroll_depth = event.get('scroll_depth', 0)
-                        pageview.save()
-                    except PageView.DoesNotExist:
-                        pass
-            
-            except Exception as e:
-                print(f"Error processing event {event_type}: {e}")
-                continue
+        # Group the events by type and write each model with one bulk_create
+        collector = EventCollector(url=monitored_url, **describe_client(ip_address, user_agent_string))
+        collector.extend(events).flush()
         
         response = JsonResponse({'status': 'success', 'processed': len(events)})
         return add_cors_headers(response)
     
     except Exception as e:
-        print(f"External tracking error: {e}")
+        logger.error(f"External tracking error: {e}")
         response = JsonResponse({'status': 'error', 'message': str(e)}, status=500)
         return add_cors_headers(response)
 
@@ -0,0 +1,254 @@
+"""
+Conversion Funnel Engine
+Streams PageView rows ordered by session and walks each session through the
+ordered steps of every funnel defined for its URL, writing per-day step
+counts and conversion rates to ConversionFunnel. Sessions count on the UTC
+day of their first pageview; incremental runs only recompute the days of
+sessions that received pageviews since the last run.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import Min, OuterRef, Subquery
+from django.utils import timezone
+from .scroll_depth import day_start
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'conversion_funnels'  # AggregateWatermark row of the incremental job
+# Pageview writes this recent may not be committed yet; they are picked up by the next run
+COMPUTE_LAG = timedelta(minutes=2)
+STREAM_CHUNK_SIZE = 2000  # Pageview rows fetched per round trip
+
+
+def session_date(timestamp):
+    """UTC day a session is counted on"""
+    return timestamp.astimezone(dt_timezone.utc).date()
+
+
+def step_matches(step, page_url):
+    """A step's 'url' matches a page path exactly, or as a prefix when it ends with '*'"""
+    target = (step.get('url') or '').strip()
+    if not target:
+        return False
+    if target.endswith('*'):
+        return page_url.startswith(target[:-1])
+    return page_url == target or page_url.rstrip('/') == target.rstrip('/')
+
+
+class Funnel:
+    """One funnel definition and its per-day step counts"""
+
+    def __init__(self, url_id, name, steps, computed=True):
+        self.url_id = url_id
+        self.name = name
+        self.steps = [step for step in steps if isinstance(step, dict)]
+        self.computed = computed  # False until a run has written step counts
+        self.completion = defaultdict(lambda: [0] * len(self.steps))  # date -> sessions per step
+
+    def advance(self, reached, page_url):
+        """Next state of a session that has matched `reached` steps so far"""
+        if reached < len(self.steps) and step_matches(self.steps[reached], page_url):
+            return reached + 1
+        return reached
+
+    def count(self, date, reached):
+        counts = self.completion[date]
+        for i in range(reached):
+            counts[i] += 1
+
+
+def funnel_definitions(url_ids=None):
+    """
+    {url id: [Funnel]}. Each (url, name) pair is a funnel; its steps come
+    from its most recent ConversionFunnel row. A funnel added by creating a
+    row with empty step_completion is marked as not computed yet.
+    """
+    from monitor.models import ConversionFunnel
+
+    rows = ConversionFunnel.objects.filter(url__isnull=False).order_by('url_id', 'name', '-date', '-updated_at')
+    if url_ids is not None:
+        rows = rows.filter(url_id__in=url_ids)
+
+    funnels = {}
+    for url_id, name, steps, step_completion in rows.values_list('url_id', 'name', 'steps', 'step_completion'):
+        if (url_id, name) not in funnels:
+            funnels[(url_id, name)] = Funnel(url_id, name, steps or [], computed=False)
+        if step_completion:
+            funnels[(url_id, name)].computed = True
+
+    definitions = defaultdict(list)
+    for funnel in funnels.values():
+        if funnel.steps:
+            definitions[funnel.url_id].append(funnel)
+    return definitions
+
+
+def _session_starts(url_id):
+    """Per-session first pageview timestamp, as a grouped PageView queryset"""
+    from monitor.models import PageView
+
+    return PageView.objects.filter(url_id=url_id).values('session_id').annotate(
+        start=Min('timestamp'),
+    ).order_by()
+
+
+def _walk_sessions(url_id, funnels, first_day, last_day):
+    """
+    Run the step state machines over every session of url_id that started
+    between first_day and last_day. Rows are streamed in session order, so
+    only the current session's state is held in memory.
+    """
+    from monitor.models import PageView
+
+    started = _session_starts(url_id).filter(
+        start__gte=day_start(first_day),
+        start__lt=day_start(last_day + timedelta(days=1)),
+    ).values('session_id')
+    pageviews = PageView.objects.filter(
+        url_id=url_id, session_id__in=Subquery(started),
+    ).order_by('session_id', 'timestamp', 'id').values_list('session_id', 'timestamp', 'page_url')
+
+    current = None
+    date = None
+    reached = []
+    sessions = 0
+    for session_id, timestamp, page_url in pageviews.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        if session_id != current:
+            if current is not None:
+                for funnel, state in zip(funnels, reached):
+                    funnel.count(date, state)
+            current = session_id
+            date = session_date(timestamp)
+            reached = [0] * len(funnels)
+            sessions += 1
+        reached = [funnel.advance(state, page_url) for funnel, state in zip(funnels, reached)]
+    if current is not None:
+        for funnel, state in zip(funnels, reached):
+            funnel.count(date, state)
+    return sessions
+
+
+def _write(funnel, first_day, last_day):
+    """Upsert the funnel's rows for first_day..last_day; days without entries are zeroed"""
+    from monitor.models import ConversionFunnel
+
+    now = timezone.now()
+    existing = {
+        row.date: row
+        for row in ConversionFunnel.objects.filter(
+            url_id=funnel.url_id, name=funnel.name, date__gte=first_day, date__lte=last_day,
+        )
+    }
+    changed, created = [], []
+    for date in sorted(set(existing) | set(funnel.completion)):
+        counts = funnel.completion.get(date, [0] * len(funnel.steps))
+        step_completion = {str(i): count for i, count in enumerate(counts)}
+        conversion_rate = counts[-1] / counts[0] * 100 if counts and counts[0] else 0
+        row = existing.get(date)
+        if row is None:
+            created.append(ConversionFunnel(
+                url_id=funnel.url_id, name=funnel.name, steps=funnel.steps, date=date,
+                step_completion=step_completion, conversion_rate=conversion_rate,
+            ))
+        else:
+            row.steps = funnel.steps
+            row.step_completion = step_completion
+            row.conversion_rate = conversion_rate
+            row.updated_at = now
+            changed.append(row)
+    ConversionFunnel.objects.bulk_update(
+        changed, ['steps', 'step_completion', 'conversion_rate', 'updated_at'], batch_size=500,
+    )
+    ConversionFunnel.objects.bulk_create(created, batch_size=500)
+    return len(changed) + len(created)
+
+
+def compute_funnels(url_id, first_day, last_day, funnels=None):
+    """
+    Recompute the funnels of one URL for the UTC days first_day..last_day
+    (inclusive). Returns (sessions walked, rows written).
+    """
+    if funnels is None:
+        funnels = funnel_definitions([url_id]).get(url_id, [])
+    if not funnels:
+        return 0, 0
+
+    for funnel in funnels:
+        funnel.completion.clear()
+    sessions = _walk_sessions(url_id, funnels, first_day, last_day)
+    with transaction.atomic():
+        written = sum(_write(funnel, first_day, last_day) for funnel in funnels)
+    return sessions, written
+
+
+def _full_ranges(url_ids, until):
+    """{url id: (first day, last day)} covering all sessions of the URLs"""
+    from monitor.models import PageView
+
+    ranges = {}
+    bounds = PageView.objects.filter(url_id__in=url_ids).values('url_id').annotate(
+        first=Min('timestamp'),
+    ).order_by()
+    for row in bounds:
+        ranges[row['url_id']] = (session_date(row['first']), session_date(until))
+    return ranges
+
+
+def _dirty_ranges(url_ids, since, until):
+    """
+    {url id: (first day, last day)} spanning the start days of the sessions
+    that received pageviews in (since, until]
+    """
+    from monitor.models import PageView
+
+    ranges = {}
+    touched = PageView.objects.filter(
+        url_id__in=url_ids, updated_at__gt=since, updated_at__lte=until,
+    ).values('url_id', 'session_id').distinct().order_by()
+    starts = PageView.objects.filter(
+        url_id=OuterRef('url_id'), session_id=OuterRef('session_id'),
+    ).order_by('timestamp').values('timestamp')[:1]
+    for url_id, start in touched.annotate(start=Subquery(starts)).values_list('url_id', 'start').iterator():
+        date = session_date(start)
+        first, last = ranges.get(url_id, (date, date))
+        ranges[url_id] = (min(first, date), max(last, date))
+    return ranges
+
+
+def compute_incremental(now=None, full=False):
+    """
+    Recompute the days of the sessions that received pageviews since the
+    last run and move the watermark forward. The watermark row stays locked
+    for the run, so concurrent runs take turns. Returns (sessions, rows).
+    """
+    from monitor.models import AggregateWatermark
+
+    until = (now or timezone.now()) - COMPUTE_LAG
+    with transaction.atomic():
+        AggregateWatermark.objects.bulk_create([AggregateWatermark(name=WATERMARK_NAME)], ignore_conflicts=True)
+        watermark = AggregateWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+        since = None if full else watermark.processed_through
+        if since is not None and since >= until:
+            return 0, 0
+
+        definitions = funnel_definitions()
+        # URLs with a funnel that was never computed get their whole history
+        new = [url_id for url_id, funnels in definitions.items() if not all(f.computed for f in funnels)]
+        if since is None:
+            ranges = _full_ranges(list(definitions), until)
+        else:
+            ranges = _dirty_ranges([url_id for url_id in definitions if url_id not in new], since, until)
+            ranges.update(_full_ranges(new, until))
+
+        sessions = written = 0
+        for url_id, (first_day, last_day) in ranges.items():
+            url_sessions, url_written = compute_funnels(url_id, first_day, last_day, definitions[url_id])
+            sessions += url_sessions
+            written += url_written
+            logger.debug(f"Funnels for {url_id}: {url_sessions} sessions, {first_day}..{last_day}")
+
+        watermark.processed_through = until
+        watermark.save(update_fields=['processed_through'])
+    return sessions, written
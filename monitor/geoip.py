@@ -0,0 +1,217 @@
+"""
+Offline IP Geolocation Database
+Builds and reads a compact file of sorted IP ranges, looked up by binary
+search over a memory-mapped array
+
+File layout (all integers big-endian):
+    header   MAGIC, version (u16), range count (u32), locations length (u32)
+    ranges   count x (start: 16 bytes, end: 16 bytes, location index: u32)
+    locations  JSON list of [country, country_code, city, region,
+               latitude, longitude, timezone]
+
+IPv4 addresses are stored as IPv4-mapped IPv6 (::ffff:a.b.c.d), so both
+families share one sorted array and compare as plain bytes.
+"""
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'URLMGEO'
+VERSION = 1
+HEADER = struct.Struct('>7sHII')
+RECORD = struct.Struct('>16s16sI')
+LOCATION_FIELDS = ['country', 'country_code', 'city', 'region', 'latitude', 'longitude', 'timezone']
+
+# CSV column names accepted for each value (first match wins)
+CSV_COLUMNS = {
+    'start': ['start_ip', 'ip_start', 'network_start'],
+    'end': ['end_ip', 'ip_end', 'network_end'],
+    'network': ['network', 'cidr'],
+    'country': ['country', 'country_name'],
+    'country_code': ['country_code', 'country_iso_code'],
+    'city': ['city', 'city_name'],
+    'region': ['region', 'stateprov', 'subdivision_1_name'],
+    'latitude': ['latitude', 'lat'],
+    'longitude': ['longitude', 'lon', 'lng'],
+    'timezone': ['timezone', 'time_zone'],
+}
+# Column order of headerless DB-IP "city lite" dumps
+DBIP_COLUMNS = ['start_ip', 'end_ip', 'continent', 'country_code', 'region', 'city', 'latitude', 'longitude']
+
+
+def _key(address):
+    """16-byte sort key for an IPv4 or IPv6 address"""
+    ip = ipaddress.ip_address(address.strip())
+    if ip.version == 4:
+        ip = ipaddress.IPv6Address(b'\0' * 10 + b'\xff\xff' + ip.packed)
+    return ip.packed
+
+
+def _float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def _read_csv(path, has_header=True):
+    """Yield (start_key, end_key, location tuple) for each usable CSV row"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if has_header:
+            reader = csv.DictReader(f)
+            names = {name.strip().lower(): name for name in reader.fieldnames or []}
+        else:
+            reader = csv.DictReader(f, fieldnames=DBIP_COLUMNS)
+            names = {name: name for name in DBIP_COLUMNS}
+
+        columns = {
+            field: next((names[c] for c in candidates if c in names), None)
+            for field, candidates in CSV_COLUMNS.items()
+        }
+        if not columns['network'] and not (columns['start'] and columns['end']):
+            raise ValueError("CSV needs start_ip/end_ip or network columns")
+
+        for line, row in enumerate(reader, start=2 if has_header else 1):
+            value = lambda field: (row.get(columns[field]) or '').strip() if columns[field] else ''
+            try:
+                if columns['network'] and value('network'):
+                    network = ipaddress.ip_network(value('network'), strict=False)
+                    start, end = _key(str(network[0])), _key(str(network[-1]))
+                else:
+                    start, end = _key(value('start')), _key(value('end'))
+            except ValueError:
+                logger.warning(f"Skipping line {line}: invalid IP range")
+                continue
+            if end < start:
+                logger.warning(f"Skipping line {line}: range end before start")
+                continue
+
+            country_code = value('country_code')[:2].upper()
+            location = (
+                value('country') or country_code,
+                country_code,
+                value('city'),
+                value('region'),
+                _float(value('latitude')),
+                _float(value('longitude')),
+                value('timezone'),
+            )
+            yield start, end, location
+
+
+def build_database(csv_path, output_path, has_header=True):
+    """
+    Convert a CSV of IP ranges into the binary format. Ranges are sorted,
+    overlapping ranges are dropped (the earlier start wins) and identical
+    locations are stored once. Returns (ranges written, distinct locations).
+    """
+    rows = sorted(_read_csv(csv_path, has_header), key=lambda r: r[0])
+
+    location_index = {}
+    records = []
+    last_end = None
+    for start, end, location in rows:
+        if last_end is not None and start <= last_end:
+            logger.warning(f"Skipping overlapping range starting at {ipaddress.IPv6Address(start)}")
+            continue
+        index = location_index.setdefault(location, len(location_index))
+        records.append(RECORD.pack(start, end, index))
+        last_end = end
+
+    locations = json.dumps(
+        [list(location) for location in location_index], separators=(',', ':')
+    ).encode()
+
+    tmp_path = f"{output_path}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), len(locations)))
+        for record in records:
+            f.write(record)
+        f.write(locations)
+    os.replace(tmp_path, output_path)
+    return len(records), len(location_index)
+
+
+class GeoIPDatabase:
+    """
+    Read-only view of a built database file.
+
+    The range array stays in the memory map (paged in by the OS on demand)
+    and is binary searched in place; only the location table is decoded
+    into Python objects. Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, locations_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} geolocation database")
+        self._ranges_offset = HEADER.size
+        locations_offset = self._ranges_offset + self.count * RECORD.size
+        raw = self._mmap[locations_offset:locations_offset + locations_length]
+        self._locations = [dict(zip(LOCATION_FIELDS, location)) for location in json.loads(raw)]
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._mmap.close()
+
+    def lookup(self, address):
+        """Location dict for address, or None if it is in no range"""
+        try:
+            key = _key(address)
+        except ValueError:
+            return None
+
+        buf = self._mmap
+        base = self._ranges_offset
+        size = RECORD.size
+        # Find the last range starting at or before key
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = base + mid * size
+            if buf[offset:offset + 16] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        start, end, index = RECORD.unpack_from(buf, base + (lo - 1) * size)
+        if key > end:
+            return None
+        return dict(self._locations[index])
+
+
+_database = None
+_unavailable = set()  # Paths that failed to open (not retried until restart)
+_database_lock = threading.Lock()
+
+def get_database(path):
+    """Open (once per process) the database at path, or None if unavailable"""
+    global _database
+    if _database is None or _database.path != path:
+        if path in _unavailable:
+            return None
+        with _database_lock:
+            if _database is None or _database.path != path:
+                try:
+                    _database = GeoIPDatabase(path)
+                    logger.info(f"Loaded {len(_database)} IP ranges from {path}")
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not open geolocation database {path}: {e}")
+                    _unavailable.add(path)
+                    return None
+    return _database
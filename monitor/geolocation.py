@@ -0,0 +1,201 @@
+"""
+IP Geolocation
+Cached lookups of visitor location, shared by the tracking endpoints
+"""
+import threading
+import time
+import logging
+from collections import OrderedDict
+from django.conf import settings
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CACHE_SIZE = 10000  # IPs kept in the in-process cache
+CACHE_TTL = 24 * 3600  # Seconds a successful lookup is reused
+NEGATIVE_TTL = 300  # Seconds a failed lookup is reused (avoids hammering the API)
+LOOKUP_TIMEOUT = 2  # Seconds before the upstream lookup gives up
+SHARED_CACHE_PREFIX = 'geoip:'
+LOCAL_ADDRESSES = {'127.0.0.1', '::1', 'localhost'}
+
+
+class LookupCache:
+    """
+    Thread-safe LRU cache with per-entry expiry.
+
+    get_or_fetch() coalesces concurrent misses: the first caller for a key
+    runs fetch() while later callers wait for its result, so a burst of
+    requests from one IP makes a single upstream call.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, negative_ttl=NEGATIVE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._in_flight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Cached value for key, or None if missing or expired"""
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value):
+        """Store value; empty values expire after negative_ttl"""
+        with self._lock:
+            self._set(key, value)
+
+    def get_or_fetch(self, key, fetch):
+        """Cached value for key, calling fetch() at most once per miss"""
+        while True:
+            with self._lock:
+                value = self._get(key)
+                if value is not None:
+                    self.hits += 1
+                    return value
+                waiter = self._in_flight.get(key)
+                if waiter is None:
+                    self.misses += 1
+                    waiter = self._in_flight[key] = threading.Event()
+                    leader = True
+                else:
+                    self.coalesced += 1
+                    leader = False
+
+            if not leader:
+                waiter.wait(LOOKUP_TIMEOUT * 2)
+                with self._lock:
+                    value = self._get(key)
+                if value is not None:
+                    return value
+                continue  # The lookup failed without caching anything; try ourselves
+
+            try:
+                value = fetch()
+                self.set(key, value)
+                return value
+            finally:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+                waiter.set()
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+        }
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        ttl = self.ttl if value else self.negative_ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+def lookup_ipapi(ip_address):
+    """Get geolocation data from IP address using ipapi.co"""
+    try:
+        response = requests.get(f'https://ipapi.co/{ip_address}/json/', timeout=LOOKUP_TIMEOUT)
+        if response.status_code == 200:
+            data = response.json()
+            if not data.get('error'):
+                return {
+                    'country': data.get('country_name') or '',
+                    'country_code': data.get('country_code') or '',
+                    'city': data.get('city') or '',
+                    'region': data.get('region') or '',
+                    'latitude': data.get('latitude'),
+                    'longitude': data.get('longitude'),
+                    'timezone': data.get('timezone') or '',
+                }
+    except Exception as e:
+        logger.warning(f"Geolocation lookup failed for {ip_address}: {e}")
+    return {}
+
+
+def _shared_cache():
+    """The Django cache used as a second tier, or None if disabled"""
+    if not getattr(settings, 'GEOLOCATION_SHARED_CACHE', False):
+        return None
+    from django.core.cache import cache
+    return cache
+
+
+def _fetch(ip_address):
+    """Second-tier cache, then the upstream lookup"""
+    shared = _shared_cache()
+    key = f"{SHARED_CACHE_PREFIX}{ip_address}"
+    if shared is not None:
+        try:
+            cached = shared.get(key)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            logger.debug(f"Shared geolocation cache unavailable: {e}")
+
+    geo_data = lookup_ipapi(ip_address)
+
+    if shared is not None:
+        try:
+            shared.set(key, geo_data, CACHE_TTL if geo_data else NEGATIVE_TTL)
+        except Exception as e:
+            logger.debug(f"Shared geolocation cache unavailable: {e}")
+    return geo_data
+
+
+def lookup_local(ip_address):
+    """Look ip_address up in the offline database (GEOIP_DATABASE)"""
+    from .geoip import get_database
+
+    database = get_database(str(settings.GEOIP_DATABASE))
+    if database is None:
+        return {}
+    return database.lookup(ip_address) or {}
+
+
+_cache = LookupCache()
+
+def get_geolocation(ip_address):
+    """
+    Location fields for a PageView ({} if unknown). GEOLOCATION_BACKEND
+    'local' answers from the offline database; 'ipapi' calls ipapi.co
+    through the cache.
+    """
+    if not ip_address or ip_address in LOCAL_ADDRESSES:
+        return {}
+    if getattr(settings, 'GEOLOCATION_BACKEND', 'ipapi') == 'local':
+        return lookup_local(ip_address)
+    # Copy so callers can't mutate the cached dict
+    return dict(_cache.get_or_fetch(ip_address, lambda: _fetch(ip_address)))
+
+def geolocation_cache_stats():
+    """Hit/miss counters of the in-process geolocation cache"""
+    return _cache.stats()
@@ -0,0 +1,159 @@
+"""
+Click Heatmap Grids
+Bins clicks at ingest time into a fixed grid per (URL, page, device type,
+UTC day), so a heatmap over any range is the sum of a few small arrays
+instead of a GROUP BY over raw ClickHeatmap rows
+"""
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from django.db import transaction
+
+# Grid resolution; cells are relative to the viewport, so clicks from
+# different screen sizes land in comparable cells
+GRID_COLUMNS = 64
+GRID_ROWS = 40
+GRID_CELLS = GRID_COLUMNS * GRID_ROWS
+# Assumed viewport when the tracker did not report one
+DEFAULT_VIEWPORT = (1280, 800)
+
+
+def grid_date(timestamp):
+    """UTC day a click is binned on"""
+    return timestamp.astimezone(dt_timezone.utc).date()
+
+
+def cell_index(x, y, viewport_width, viewport_height):
+    """Grid cell for a click at viewport coordinates (x, y)"""
+    width = viewport_width if viewport_width and viewport_width > 0 else DEFAULT_VIEWPORT[0]
+    height = viewport_height if viewport_height and viewport_height > 0 else DEFAULT_VIEWPORT[1]
+    column = min(max(int(x * GRID_COLUMNS / width), 0), GRID_COLUMNS - 1)
+    row = min(max(int(y * GRID_ROWS / height), 0), GRID_ROWS - 1)
+    return row * GRID_COLUMNS + column
+
+
+def empty_grid():
+    return array('I', bytes(GRID_CELLS * 4))
+
+
+def decode_grid(data):
+    """Counts array from its stored form (empty grid for no data)"""
+    grid = array('I')
+    if data:
+        grid.frombytes(zlib.decompress(bytes(data)))
+    if len(grid) != GRID_CELLS:
+        return empty_grid()
+    return grid
+
+
+def encode_grid(grid):
+    """Compressed uint32 counts (empty cells compress away)"""
+    return zlib.compress(grid.tobytes())
+
+
+def add_grids(total, grid):
+    """Add grid into total (in place)"""
+    for i, count in enumerate(grid):
+        if count:
+            total[i] += count
+    return total
+
+
+def _group(clicks):
+    pending = defaultdict(empty_grid)
+    for click in clicks:
+        if click.url_id is None:
+            continue
+        key = (click.url_id, click.page_url, click.device_type, grid_date(click.timestamp))
+        pending[key][cell_index(click.x_position, click.y_position, click.viewport_width, click.viewport_height)] += 1
+    return pending
+
+
+def record_clicks(clicks):
+    """
+    Bin new ClickHeatmap rows into their grid rows. Missing rows are created
+    empty and then locked, so concurrent ingest workers add to the same row.
+    """
+    from monitor.models import ClickHeatmapGrid
+
+    pending = _group(clicks)
+    if not pending:
+        return 0
+
+    empty = encode_grid(empty_grid())
+    with transaction.atomic():
+        ClickHeatmapGrid.objects.bulk_create(
+            [
+                ClickHeatmapGrid(url_id=url_id, page_url=page_url, device_type=device_type, date=date, counts=empty)
+                for url_id, page_url, device_type, date in pending
+            ],
+            ignore_conflicts=True,
+        )
+        rows = ClickHeatmapGrid.objects.select_for_update().filter(
+            url_id__in={key[0] for key in pending},
+            page_url__in={key[1] for key in pending},
+            date__in={key[3] for key in pending},
+        )
+
+        changed = []
+        for row in rows:
+            grid = pending.get((row.url_id, row.page_url, row.device_type, row.date))
+            if grid is None:
+                continue
+            row.counts = encode_grid(add_grids(decode_grid(row.counts), grid))
+            row.clicks += sum(grid)
+            changed.append(row)
+        ClickHeatmapGrid.objects.bulk_update(changed, ['counts', 'clicks'])
+    return len(changed)
+
+
+def summed_grid(rows):
+    """(counts array, total clicks) summed over ClickHeatmapGrid rows"""
+    total = empty_grid()
+    clicks = 0
+    for data, row_clicks in rows.values_list('counts', 'clicks').iterator():
+        add_grids(total, decode_grid(data))
+        clicks += row_clicks
+    return total, clicks
+
+
+def grid_cells(grid):
+    """Non-empty cells as [column, row, count] for the heatmap canvas"""
+    return [
+        [i % GRID_COLUMNS, i // GRID_COLUMNS, count]
+        for i, count in enumerate(grid) if count
+    ]
+
+
+def rebuild_click_grids(url_ids=None, batch_size=5000):
+    """
+    Recompute grids from the ClickHeatmap rows in the database, replacing
+    the existing grids of the affected URLs. Returns clicks read.
+    """
+    from monitor.models import ClickHeatmap, ClickHeatmapGrid
+
+    clicks = ClickHeatmap.objects.filter(url__isnull=False).order_by('url_id', 'timestamp')
+    if url_ids is not None:
+        clicks = clicks.filter(url_id__in=url_ids)
+
+    with transaction.atomic():
+        grids = ClickHeatmapGrid.objects.all()
+        if url_ids is not None:
+            grids = grids.filter(url_id__in=url_ids)
+        grids.delete()
+
+        count = 0
+        batch = []
+        fields = ('url_id', 'page_url', 'device_type', 'timestamp',
+                  'x_position', 'y_position', 'viewport_width', 'viewport_height')
+        for click in clicks.only(*fields).iterator(chunk_size=batch_size):
+            batch.append(click)
+            if len(batch) >= batch_size:
+                record_clicks(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            record_clicks(batch)
+            count += len(batch)
+    return count
@@ -0,0 +1,377 @@
+"""
+Analytics Event Ingestion
+Groups a batch of tracker events by type and writes each model with one
+bulk_create
+"""
+import logging
+import math
+from functools import partial
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, FloatField, JSONField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import PageView, ClickHeatmap, MouseMovement, PerformanceMetric
+from .visitors import record_pageviews
+from .heatmaps import record_clicks
+from .web_vitals import record_metrics
+from .sessionizer import TIMELINE_FIELDS, get_sessionizer, timeline_entry
+
+logger = logging.getLogger(__name__)
+
+MOVEMENT_TYPES = {value for value, _ in MouseMovement.MOVEMENT_TYPES}
+
+
+def _required(event, key):
+    value = event.get(key)
+    if value is None or value == '':
+        raise ValueError(f"missing {key}")
+    return value
+
+
+def _int(event, key, default=None):
+    value = event.get(key, default)
+    if value is None:
+        if default is None:
+            raise ValueError(f"missing {key}")
+        return default
+    return int(float(value))
+
+
+def _float(event, key):
+    """Optional number (None if not reported); rejects non-numeric values"""
+    value = event.get(key)
+    if value is None or value == '':
+        return None
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"invalid {key}")
+    return value
+
+
+def _fit(instance):
+    """Truncate string values to their column's max_length"""
+    for field in instance._meta.concrete_fields:
+        max_length = getattr(field, 'max_length', None)
+        value = getattr(instance, field.attname)
+        if max_length and isinstance(value, str) and len(value) > max_length:
+            setattr(instance, field.attname, value[:max_length])
+    return instance
+
+
+class EventCollector:
+    """
+    Collects tracking events and writes them together.
+
+    add() turns each event into an unsaved model instance, or folds
+    scroll/page_leave events into pending changes per pageview; flush() then
+    inserts each model's rows with a single bulk_create and applies all
+    pageview changes with one UPDATE, so the number of queries does not grow
+    with the batch size.
+    """
+
+    def __init__(self, url=None, **client):
+        self.bind(url_id=url.pk if url is not None else None, **client)
+        self.rows = {}  # model -> [unsaved instances]
+        self.updates = {}  # (url_id, session_id, visitor_id, page_url) -> PageView changes
+        self.activity = []  # Accepted events with their client context, for the sessionizer
+        self.skipped = 0
+
+    def bind(self, url_id=None, ip_address=None, user_agent='', geo_data=None,
+             device_type='desktop', browser='', os='', received_at=None):
+        """
+        Set the client context used for the events added next, so one
+        collector can batch events from many requests. received_at is the
+        event time (None means the time of the write).
+        """
+        self.url_id = url_id
+        self.ip_address = ip_address
+        self.user_agent = user_agent
+        self.geo_data = geo_data or {}
+        self.device_type = device_type
+        self.browser = browser
+        self.os = os
+        self.received_at = received_at
+        return self
+
+    def add(self, event):
+        """Queue one event. Returns False if it was invalid or of an unknown type."""
+        event_type = event.get('type') if isinstance(event, dict) else None
+        instance = None  # Row written for the event; scroll/page_leave update an existing one
+        try:
+            if event_type == 'pageview':
+                instance = self._queue(self._pageview(event))
+            elif event_type == 'click':
+                instance = self._queue(self._click(event))
+            elif event_type in MOVEMENT_TYPES:
+                instance = self._queue(self._movement(event, event_type))
+            elif event_type == 'performance':
+                instance = self._queue(self._performance(event))
+            elif event_type in ('scroll', 'page_leave'):
+                self._reduce_update(event_type, event)
+            else:
+                raise ValueError("unknown event type")
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Skipping {event_type} event: {e}")
+            self.skipped += 1
+            return False
+        if event_type in TIMELINE_FIELDS:
+            self.activity.append(
+                (instance, self.url_id, event_type, event, self.received_at, self.device_type, self.browser)
+            )
+        return True
+
+    def extend(self, events):
+        for event in events:
+            self.add(event)
+        return self
+
+    def flush(self):
+        """Write everything collected. Returns the number of events written."""
+        written = 0
+        unsaved = []  # Instances whose rows could not be written
+        for model, instances in self.rows.items():
+            written += self._insert(model, instances, unsaved)
+            if unsaved:
+                failed = {id(instance) for instance in unsaved}
+                instances = [instance for instance in instances if id(instance) not in failed]
+            if model is PageView:
+                self._record_visitors(instances)
+            elif model is ClickHeatmap:
+                self._record_clicks(instances)
+            elif model is PerformanceMetric:
+                self._record_web_vitals(instances)
+        self.rows = {}
+
+        updated = True
+        if self.updates:
+            try:
+                with transaction.atomic():
+                    written += self._apply_updates()
+            except DatabaseError as e:
+                logger.error(f"Error applying {len(self.updates)} pageview updates: {e}")
+                updated = False
+            self.updates = {}
+
+        if self.activity:
+            failed = {id(instance) for instance in unsaved}
+            activity = [
+                entry[1:] for entry in self.activity
+                if (id(entry[0]) not in failed if entry[0] is not None else updated)
+            ]
+            # The sessionizer is in memory, so hand events over only once their rows
+            # are committed; a rolled back batch is ingested (and handed over) again
+            transaction.on_commit(partial(self._record_sessions, activity), robust=True)
+            self.activity = []
+        return written
+
+    def _queue(self, instance):
+        if self.received_at is not None:
+            instance.timestamp = self.received_at
+        self.rows.setdefault(type(instance), []).append(_fit(instance))
+        return instance
+
+    def _insert(self, model, instances, unsaved):
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(instances)
+            return len(instances)
+        except DatabaseError as e:
+            # Fall back to row-by-row so one bad event does not drop the batch
+            logger.warning(f"Bulk insert of {len(instances)} {model.__name__} rows failed ({e}), retrying individually")
+            written = 0
+            for instance in instances:
+                try:
+                    with transaction.atomic():
+                        instance.save()
+                    written += 1
+                except DatabaseError as row_error:
+                    logger.error(f"Error saving {model.__name__} event: {row_error}")
+                    unsaved.append(instance)
+            return written
+
+    def _record_visitors(self, pageviews):
+        """Add new pageviews to the unique visitor sketches"""
+        try:
+            with transaction.atomic():
+                record_pageviews(pageviews)
+        except DatabaseError as e:
+            logger.error(f"Error updating visitor sketches for {len(pageviews)} pageviews: {e}")
+
+    def _record_clicks(self, clicks):
+        """Bin new clicks into the heatmap grids"""
+        try:
+            with transaction.atomic():
+                record_clicks(clicks)
+        except DatabaseError as e:
+            logger.error(f"Error updating click grids for {len(clicks)} clicks: {e}")
+
+    def _record_web_vitals(self, metrics):
+        """Add new performance metrics to the Web Vitals sketches"""
+        try:
+            with transaction.atomic():
+                record_metrics(metrics)
+        except DatabaseError as e:
+            logger.error(f"Error updating Web Vitals sketches for {len(metrics)} metrics: {e}")
+
+    def _record_sessions(self, activity):
+        """Add accepted events to the open sessions of this process's sessionizer"""
+        sessionizer = get_sessionizer()
+        now = timezone.now()
+        for url_id, event_type, event, received_at, device_type, browser in activity:
+            timestamp = received_at or now
+            sessionizer.add(
+                url_id, str(event['session_id'])[:100], timeline_entry(event_type, event, timestamp), timestamp,
+                visitor_id=str(event.get('visitor_id') or '')[:100],
+                device_type=device_type,
+                browser=browser,
+            )
+
+    def _pageview(self, event):
+        return PageView(
+            url_id=self.url_id,
+            session_id=_required(event, 'session_id'),
+            visitor_id=_required(event, 'visitor_id'),
+            page_url=event.get('page_url') or '',
+            page_title=event.get('page_title') or '',
+            referrer=event.get('referrer') or '',
+            user_agent=event.get('user_agent') or self.user_agent,
+            device_type=self.device_type,
+            browser=self.browser,
+            os=self.os,
+            screen_resolution=event.get('screen_resolution') or '',
+            ip_address=self.ip_address,
+            **self.geo_data
+        )
+
+    def _click(self, event):
+        return ClickHeatmap(
+            url_id=self.url_id,
+            page_url=event.get('page_url') or '',
+            x_position=_int(event, 'x_position'),
+            y_position=_int(event, 'y_position'),
+            viewport_width=_int(event, 'viewport_width', 0),
+            viewport_height=_int(event, 'viewport_height', 0),
+            element_tag=str(event.get('element_tag') or ''),
+            element_id=str(event.get('element_id') or ''),
+            element_class=str(event.get('element_class') or ''),
+            element_text=str(event.get('element_text') or ''),
+            session_id=_required(event, 'session_id'),
+            device_type=self.device_type
+        )
+
+    def _movement(self, event, movement_type):
+        return MouseMovement(
+            url_id=self.url_id,
+            session_id=_required(event, 'session_id'),
+            page_url=event.get('page_url') or '',
+            movement_type=movement_type,
+            x_position=_int(event, 'x_position', 0),
+            y_position=_int(event, 'y_position', 0),
+            click_count=_int(event, 'click_count', 1),
+            element_selector=event.get('element_selector') or ''
+        )
+
+    def _performance(self, event):
+        return PerformanceMetric(
+            url_id=self.url_id,
+            page_url=event.get('page_url') or '',
+            session_id=_required(event, 'session_id'),
+            first_contentful_paint=_float(event, 'first_contentful_paint'),
+            largest_contentful_paint=_float(event, 'largest_contentful_paint'),
+            first_input_delay=_float(event, 'first_input_delay'),
+            cumulative_layout_shift=_float(event, 'cumulative_layout_shift'),
+            time_to_interactive=_float(event, 'time_to_interactive'),
+            dom_load_time=_float(event, 'dom_load_time'),
+            page_load_time=_float(event, 'page_load_time'),
+            resource_load_time=_float(event, 'resource_load_time'),
+            connection_type=event.get('connection_type') or '',
+            effective_bandwidth=_float(event, 'effective_bandwidth')
+        )
+
+    def _reduce_update(self, event_type, event):
+        """
+        Fold a scroll or page_leave event into the pending changes for its
+        pageview: the deepest scroll wins, the latest page_leave supplies
+        time on page (and scroll events / click count when sent)
+        """
+        key = (
+            self.url_id,
+            _required(event, 'session_id'),
+            event.get('visitor_id') or None,
+            event.get('page_url') or None,
+        )
+        # Parse everything before registering the key, so a bad value leaves no partial update
+        depth = _float(event, 'scroll_depth') or 0
+        if event_type == 'page_leave':
+            time_on_page = _float(event, 'time_on_page') or 0
+            click_count = int(_float(event, 'click_count') or 0)
+
+        changes = self.updates.setdefault(key, {'events': 0})
+        changes['events'] += 1
+        if depth > changes.get('scroll_depth', 0):
+            changes['scroll_depth'] = depth
+        if event_type == 'page_leave':
+            changes['time_on_page'] = time_on_page
+            if 'scroll_events' in event:
+                changes['scroll_events'] = event['scroll_events']
+            if 'click_count' in event:
+                changes['click_count'] = click_count
+
+    def _target_pageviews(self):
+        """
+        Map each pending update key to the id of its most recent PageView,
+        using one query over the sessions involved
+        """
+        sessions = {session_id for _, session_id, _, _ in self.updates}
+        candidates = PageView.objects.filter(session_id__in=sessions).order_by('-timestamp', '-id').values_list(
+            'id', 'url_id', 'session_id', 'visitor_id', 'page_url'
+        )
+        latest = {}
+        for pk, url_id, session_id, visitor_id, page_url in candidates:
+            for key in (
+                (url_id, session_id, visitor_id, page_url),
+                (url_id, session_id, visitor_id, None),
+                (url_id, session_id, None, page_url),
+                (url_id, session_id, None, None),
+            ):
+                latest.setdefault(key, pk)
+        return {key: latest[key] for key in self.updates if key in latest}
+
+    def _apply_updates(self):
+        """
+        Write all pending pageview changes with a single UPDATE that only
+        touches the changed columns. Returns the number of events applied.
+        """
+        targets = self._target_pageviews()
+        if not targets:
+            return 0
+
+        # Several keys can resolve to the same pageview; merge them
+        per_pageview = {}
+        applied = 0
+        for key, pk in targets.items():
+            changes = self.updates[key]
+            applied += changes['events']
+            merged = per_pageview.setdefault(pk, {})
+            for field, value in changes.items():
+                if field == 'scroll_depth':
+                    merged[field] = max(value, merged.get(field, 0))
+                elif field != 'events':
+                    merged[field] = value
+
+        fields = {}
+        for pk, changes in per_pageview.items():
+            for field, value in changes.items():
+                if field == 'scroll_depth':
+                    # Never lower a depth recorded by an earlier batch
+                    value = Greatest(F('scroll_depth'), Value(value, output_field=FloatField()))
+                elif field == 'scroll_events':
+                    value = Value(value, output_field=JSONField())
+                fields.setdefault(field, []).append(When(pk=pk, then=value))
+
+        # App clock, like the updated_at default and the watermark jobs reading it
+        PageView.objects.filter(pk__in=per_pageview).update(updated_at=timezone.now(), **{
+            field: Case(*whens, default=F(field))
+            for field, whens in fields.items()
+        })
+        return applied
@@ -0,0 +1,182 @@
+"""
+Analytics Ingest Queue
+Spools tracking requests to the IngestQueueItem table so the tracking
+endpoints can answer immediately, and drains them in large batches
+"""
+import threading
+import uuid
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Now
+from .ingest import EventCollector
+from .leader import make_node_id
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+BATCH_SIZE = 200  # Queued requests claimed and written per batch
+POLL_INTERVAL = 1  # Seconds a consumer waits when the queue is empty
+CLAIM_TIMEOUT = 300  # Seconds before a claimed batch is retried by another consumer
+MAX_ATTEMPTS = 5  # Batches are dropped after failing this many times
+MAX_EVENTS_PER_REQUEST = 500  # Larger tracking requests are rejected
+
+
+def ingest_queue_enabled():
+    return getattr(settings, 'TRACKING_INGEST_MODE', 'sync') == 'queue'
+
+
+def valid_event_batch(events):
+    """Cheap shape check done before a batch is accepted"""
+    return (
+        isinstance(events, list)
+        and 0 < len(events) <= MAX_EVENTS_PER_REQUEST
+        and all(isinstance(event, dict) and event.get('type') for event in events)
+    )
+
+
+def enqueue_events(events, ip_address, user_agent, url=None):
+    """Spool one request's events for a consumer to write"""
+    from monitor.models import IngestQueueItem
+
+    return IngestQueueItem.objects.create(
+        url=url,
+        events=events,
+        ip_address=ip_address or None,
+        user_agent=(user_agent or '')[:500],
+    )
+
+
+def _available():
+    """Items that are unclaimed or whose claim has expired"""
+    return Q(claimed_at__isnull=True) | Q(claimed_at__lt=Now() - timedelta(seconds=CLAIM_TIMEOUT))
+
+
+class IngestConsumer:
+    """
+    Pool of worker threads draining the IngestQueueItem table.
+
+    Each worker claims up to batch_size items with a conditional UPDATE
+    (safe with any number of consumers across processes and hosts), writes
+    all of their events through one EventCollector, and deletes the items in
+    the same transaction. A consumer that dies mid-batch leaves its claim to
+    expire after CLAIM_TIMEOUT, and the items are retried.
+    """
+
+    def __init__(self, workers=None, batch_size=BATCH_SIZE):
+        self.workers = workers or getattr(settings, 'INGEST_WORKERS', 2)
+        self.batch_size = batch_size
+        self.node_id = make_node_id()
+        self.running = False
+        self.threads = []
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the worker threads"""
+        if self.running:
+            return
+        self.running = True
+        self._stop.clear()
+        self.threads = [
+            threading.Thread(target=self._run, daemon=True, name=f'ingest-{i}')
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+        logger.info(f"Ingest consumer started with {self.workers} worker(s)")
+
+    def stop(self):
+        """Stop the workers after their current batch"""
+        self.running = False
+        self._stop.set()
+        for thread in self.threads:
+            thread.join(timeout=30)
+        self.threads = []
+        logger.info("Ingest consumer stopped")
+
+    def claim(self):
+        """Claim the oldest available items. Returns them (possibly empty)."""
+        from monitor.models import IngestQueueItem
+
+        ids = list(
+            IngestQueueItem.objects.filter(_available()).order_by('id').values_list('id', flat=True)[:self.batch_size]
+        )
+        if not ids:
+            return []
+        token = f"{self.node_id}:{uuid.uuid4().hex[:8]}"
+        # Re-checking availability in the UPDATE makes the claim atomic
+        IngestQueueItem.objects.filter(_available(), id__in=ids).update(
+            claimed_by=token, claimed_at=Now(), attempts=F('attempts') + 1
+        )
+        return list(IngestQueueItem.objects.filter(claimed_by=token))
+
+    def process(self, items):
+        """Write the events of claimed items and remove them from the queue"""
+        from monitor.models import IngestQueueItem
+        from .analytics_api import describe_client
+
+        collector = EventCollector()
+        for item in items:
+            if item.attempts > MAX_ATTEMPTS:
+                logger.error(f"Dropping ingest item {item.id} after {item.attempts - 1} failed attempts")
+                continue
+            collector.bind(
+                url_id=item.url_id,
+                received_at=item.received_at,
+                **describe_client(item.ip_address, item.user_agent)
+            )
+            collector.extend(item.events)
+
+        with transaction.atomic():
+            written = collector.flush()
+            IngestQueueItem.objects.filter(id__in=[item.id for item in items]).delete()
+        return written
+
+    def drain_once(self):
+        """Claim and process one batch. Returns the number of items handled."""
+        items = self.claim()
+        if items:
+            written = self.process(items)
+            logger.debug(f"Ingested {written} events from {len(items)} queued requests")
+        return len(items)
+
+    def _run(self):
+        while self.running:
+            close_old_connections()
+            try:
+                handled = self.drain_once()
+            except Exception as e:
+                logger.error(f"Ingest batch failed: {e}", exc_info=True)
+                handled = 0
+            finally:
+                close_old_connections()
+            if handled < self.batch_size:
+                self._stop.wait(POLL_INTERVAL)
+
+
+def queue_depth():
+    """Number of tracking requests waiting to be written"""
+    from monitor.models import IngestQueueItem
+
+    return IngestQueueItem.objects.count()
+
+
+# Global consumer instance
+_consumer = None
+
+def start_ingest_consumer(workers=None):
+    """Initialize and start the global ingest consumer"""
+    global _consumer
+    if _consumer is None:
+        _consumer = IngestConsumer(workers=workers)
+        _consumer.start()
+    return _consumer
+
+def stop_ingest_consumer():
+    """Stop the global ingest consumer"""
+    global _consumer
+    if _consumer:
+        _consumer.stop()
+        _consumer = None
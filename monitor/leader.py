@@ -0,0 +1,144 @@
+"""
+Scheduler Leader Election
+Elects one active scheduler across workers and hosts using a lease row
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+import logging
+from datetime import timedelta
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LEASE_TTL = 15  # Seconds a lease stays valid without renewal (failover time)
+RENEW_INTERVAL = 5  # Seconds between lease renewals
+SAFETY_MARGIN = 3  # Step down this many seconds before our lease could expire elsewhere
+
+
+def make_node_id():
+    """Unique id for this process: host, pid and a random suffix"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderElector:
+    """
+    Competes for a named SchedulerLease row and renews it while held.
+
+    Lease expiry is compared against the database clock (Now()), so hosts
+    with skewed clocks still agree on who holds the lease. Locally, this node
+    only reports itself leader until LEASE_TTL - SAFETY_MARGIN seconds after
+    its last successful renewal started, so a node that cannot reach the
+    database steps down before anyone else can take over.
+    """
+
+    def __init__(self, name, node_id=None, on_change=None):
+        self.name = name
+        self.node_id = node_id or make_node_id()
+        self.on_change = on_change
+        self.running = False
+        self.thread = None
+        self._valid_until = 0  # time.monotonic() deadline for our lease
+        self._was_leader = False
+        self._stop = threading.Event()
+
+    @property
+    def is_leader(self):
+        return time.monotonic() < self._valid_until
+
+    def start(self):
+        """Start the lease renewal thread"""
+        if self.running:
+            return
+        self.running = True
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"Leader election started for '{self.name}' as {self.node_id}")
+
+    def stop(self):
+        """Stop renewing and release the lease so another node can take over"""
+        self.running = False
+        self._stop.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.release()
+
+    def try_acquire(self):
+        """Acquire or renew the lease. Returns True if this node holds it."""
+        from monitor.models import SchedulerLease
+
+        started = time.monotonic()
+        expires = Now() + timedelta(seconds=LEASE_TTL)
+
+        # Renew our own lease
+        held = SchedulerLease.objects.filter(
+            name=self.name, holder=self.node_id, expires_at__gt=Now()
+        ).update(expires_at=expires)
+
+        if not held:
+            # Take over a lease that is free or has expired
+            held = SchedulerLease.objects.filter(name=self.name).filter(
+                Q(holder='') | Q(expires_at__lte=Now())
+            ).update(holder=self.node_id, expires_at=expires, acquired_at=Now())
+
+        if not held and not SchedulerLease.objects.filter(name=self.name).exists():
+            try:
+                with transaction.atomic():
+                    SchedulerLease.objects.create(
+                        name=self.name, holder=self.node_id, expires_at=expires, acquired_at=Now()
+                    )
+                held = 1
+            except IntegrityError:
+                held = 0  # Another node created it first
+
+        if held:
+            self._valid_until = started + LEASE_TTL - SAFETY_MARGIN
+        else:
+            self._valid_until = 0
+        return bool(held)
+
+    def release(self):
+        """Give up the lease if this node holds it"""
+        from monitor.models import SchedulerLease
+
+        self._valid_until = 0
+        try:
+            released = SchedulerLease.objects.filter(
+                name=self.name, holder=self.node_id
+            ).update(holder='', expires_at=Now())
+            if released:
+                logger.info(f"Released leadership of '{self.name}'")
+        except Exception as e:
+            logger.warning(f"Failed to release lease '{self.name}': {e}")
+        finally:
+            close_old_connections()
+        self._notify()
+
+    def _run(self):
+        while self.running:
+            close_old_connections()
+            try:
+                self.try_acquire()
+            except Exception as e:
+                logger.error(f"Lease renewal for '{self.name}' failed: {e}")
+            finally:
+                close_old_connections()
+            self._notify()
+            self._stop.wait(RENEW_INTERVAL)
+
+    def _notify(self):
+        is_leader = self.is_leader
+        if is_leader != self._was_leader:
+            self._was_leader = is_leader
+            if is_leader:
+                logger.info(f"{self.node_id} is now leader for '{self.name}'")
+            else:
+                logger.info(f"{self.node_id} is no longer leader for '{self.name}'")
+            if self.on_change:
+                self.on_change(is_leader)
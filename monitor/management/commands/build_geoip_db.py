@@ -0,0 +1,40 @@
+"""
+Django management command to build the offline IP geolocation database
+Usage: python manage.py build_geoip_db dbip-city-lite.csv --no-header
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from monitor.geoip import GeoIPDatabase, build_database
+
+
+class Command(BaseCommand):
+    help = 'Build the binary IP range database used by GEOLOCATION_BACKEND=local from a CSV dump'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='CSV of IP ranges (start_ip,end_ip or network columns plus location columns)')
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Output file (default: GEOIP_DATABASE setting)'
+        )
+        parser.add_argument(
+            '--no-header',
+            action='store_true',
+            help='CSV has no header row and uses the DB-IP city lite column order'
+        )
+
+    def handle(self, *args, **options):
+        output = options['output'] or str(settings.GEOIP_DATABASE)
+        started = time.monotonic()
+        try:
+            ranges, locations = build_database(options['csv_path'], output, has_header=not options['no_header'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not build geolocation database: {e}")
+
+        database = GeoIPDatabase(output)
+        database.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {ranges} IP ranges ({locations} distinct locations) to {output} "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,26 @@
+"""
+Django management command to compute the conversion funnels
+Usage: python manage.py compute_funnels [--full]
+"""
+from django.core.management.base import BaseCommand
+from monitor.funnels import compute_incremental
+
+
+class Command(BaseCommand):
+    help = 'Update the daily ConversionFunnel step counts from the sessions that received page views since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every day of every funnel (e.g. after editing funnel steps)'
+        )
+
+    def handle(self, *args, **options):
+        if options['full']:
+            self.stdout.write(self.style.WARNING("Recomputing conversion funnels for all days"))
+        sessions, written = compute_incremental(full=options['full'])
+        if written:
+            self.stdout.write(self.style.SUCCESS(f"Walked {sessions} sessions, wrote {written} funnel rows"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Conversion funnels are up to date"))
@@ -0,0 +1,26 @@
+"""
+Django management command to materialize the daily scroll depth aggregates
+Usage: python manage.py materialize_scroll_heatmaps [--full]
+"""
+from django.core.management.base import BaseCommand
+from monitor.scroll_depth import materialize_incremental
+
+
+class Command(BaseCommand):
+    help = 'Fold page view scroll depths written since the last run into the daily ScrollHeatmap rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-materialize every day that has page views, ignoring the watermark'
+        )
+
+    def handle(self, *args, **options):
+        if options['full']:
+            self.stdout.write(self.style.WARNING("Re-materializing scroll heatmaps for all days"))
+        days, written = materialize_incremental(full=options['full'])
+        if days:
+            self.stdout.write(self.style.SUCCESS(f"Materialized {written} scroll heatmap rows for {days} day(s)"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Scroll heatmaps are up to date"))
@@ -0,0 +1,32 @@
+"""
+Django management command to rebuild the click heatmap grids
+Usage: python manage.py rebuild_click_grids [--url-id <uuid>]
+"""
+import uuid
+from django.core.management.base import BaseCommand
+from monitor.heatmaps import rebuild_click_grids
+
+
+class Command(BaseCommand):
+    help = 'Recompute the binned click heatmap grids from the clicks in the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url-id',
+            type=uuid.UUID,
+            action='append',
+            dest='url_ids',
+            help='Only rebuild grids for this URL id (may be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        url_ids = options['url_ids']
+
+        self.stdout.write(
+            self.style.WARNING(
+                "Rebuilding click grids for "
+                f"{'URL(s) ' + ', '.join(map(str, url_ids)) if url_ids else 'all URLs'}"
+            )
+        )
+        count = rebuild_click_grids(url_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt click grids from {count} clicks"))
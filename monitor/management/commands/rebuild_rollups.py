@@ -0,0 +1,44 @@
+"""
+Django management command to rebuild hourly and daily status rollups
+Usage: python manage.py rebuild_rollups [--url-id <uuid>] [--discard-history]
+"""
+import uuid
+from django.core.management.base import BaseCommand
+from monitor.result_writer import flush_status_writer
+from monitor.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute status rollups from the URL status records still in the database. '
+        'Only the newest records of each URL are kept, so rollups older than its oldest '
+        'record are left as they are unless --discard-history is given'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url-id',
+            type=uuid.UUID,
+            action='append',
+            dest='url_ids',
+            help='Only rebuild rollups for this URL id (may be repeated)'
+        )
+        parser.add_argument(
+            '--discard-history',
+            action='store_true',
+            help='Delete all rollups of the selected URLs, including buckets older than their '
+                 'oldest status record, and rebuild them from the remaining records only'
+        )
+
+    def handle(self, *args, **options):
+        url_ids = options['url_ids']
+        flush_status_writer()
+
+        self.stdout.write(
+            self.style.WARNING(
+                "Rebuilding rollups for "
+                f"{'URL(s) ' + ', '.join(map(str, url_ids)) if url_ids else 'all URLs'}"
+            )
+        )
+        count = rebuild_rollups(url_ids, discard_history=options['discard_history'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups from {count} URL status records"))
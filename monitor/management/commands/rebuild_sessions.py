@@ -0,0 +1,32 @@
+"""
+Django management command to rebuild the session recordings and user flows
+Usage: python manage.py rebuild_sessions [--url-id <uuid>]
+"""
+import uuid
+from django.core.management.base import BaseCommand
+from monitor.sessionizer import rebuild_sessions
+
+
+class Command(BaseCommand):
+    help = 'Reconstruct SessionRecording and UserFlow rows from the page views, clicks and mouse movements in the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url-id',
+            type=uuid.UUID,
+            action='append',
+            dest='url_ids',
+            help='Only rebuild sessions for this URL id (may be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        url_ids = options['url_ids']
+
+        self.stdout.write(
+            self.style.WARNING(
+                "Rebuilding sessions for "
+                f"{'URL(s) ' + ', '.join(map(str, url_ids)) if url_ids else 'all URLs'}"
+            )
+        )
+        count = rebuild_sessions(url_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} sessions"))
@@ -0,0 +1,32 @@
+"""
+Django management command to rebuild the unique visitor sketches
+Usage: python manage.py rebuild_visitor_sketches [--url-id <uuid>]
+"""
+import uuid
+from django.core.management.base import BaseCommand
+from monitor.visitors import rebuild_visitor_sketches
+
+
+class Command(BaseCommand):
+    help = 'Recompute the HyperLogLog visitor/session sketches from the page views in the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url-id',
+            type=uuid.UUID,
+            action='append',
+            dest='url_ids',
+            help='Only rebuild sketches for this URL id (may be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        url_ids = options['url_ids']
+
+        self.stdout.write(
+            self.style.WARNING(
+                "Rebuilding visitor sketches for "
+                f"{'URL(s) ' + ', '.join(map(str, url_ids)) if url_ids else 'all URLs'}"
+            )
+        )
+        count = rebuild_visitor_sketches(url_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt visitor sketches from {count} page views"))
@@ -0,0 +1,32 @@
+"""
+Django management command to rebuild the Web Vitals sketches
+Usage: python manage.py rebuild_web_vitals [--url-id <uuid>]
+"""
+import uuid
+from django.core.management.base import BaseCommand
+from monitor.web_vitals import rebuild_web_vitals
+
+
+class Command(BaseCommand):
+    help = 'Recompute the DDSketch Web Vitals sketches from the performance metrics in the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url-id',
+            type=uuid.UUID,
+            action='append',
+            dest='url_ids',
+            help='Only rebuild sketches for this URL id (may be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        url_ids = options['url_ids']
+
+        self.stdout.write(
+            self.style.WARNING(
+                "Rebuilding Web Vitals sketches for "
+                f"{'URL(s) ' + ', '.join(map(str, url_ids)) if url_ids else 'all URLs'}"
+            )
+        )
+        count = rebuild_web_vitals(url_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt Web Vitals sketches from {count} performance metrics"))
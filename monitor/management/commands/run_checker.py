@@ -0,0 +1,42 @@
+"""
+Django management command to run a standalone URL checker node
+Usage: python manage.py run_checker --mode sharded
+"""
+import signal
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from monitor.scheduler import start_scheduler, stop_scheduler
+
+
+class Command(BaseCommand):
+    help = 'Run the URL monitor scheduler in the foreground as a dedicated checker node'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=['leader', 'sharded'],
+            default=None,
+            help='Scheduler mode (default: SCHEDULER_MODE setting)'
+        )
+
+    def handle(self, *args, **options):
+        mode = options['mode'] or getattr(settings, 'SCHEDULER_MODE', 'leader')
+        stop_event = threading.Event()
+
+        def handle_signal(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+
+        scheduler = start_scheduler(mode=mode)
+        node_id = scheduler.membership.node_id if scheduler.membership else scheduler.elector.node_id
+        self.stdout.write(self.style.SUCCESS(f"Checker node {node_id} running in {mode} mode (Ctrl+C to stop)"))
+
+        while not stop_event.wait(60):
+            self.stdout.write(f"Status: {scheduler.role}, {scheduler.engine.in_flight} checks in flight")
+
+        self.stdout.write(self.style.WARNING("Shutting down checker node..."))
+        stop_scheduler()
+        self.stdout.write(self.style.SUCCESS("Checker node stopped"))
@@ -0,0 +1,58 @@
+"""
+Django management command to run a standalone analytics ingest consumer
+Usage: python manage.py run_ingest_consumer --workers 4
+"""
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from monitor.ingest_queue import IngestConsumer, queue_depth
+
+
+class Command(BaseCommand):
+    help = 'Drain the analytics ingest queue (used with TRACKING_INGEST_MODE=queue)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Consumer threads (default: INGEST_WORKERS setting)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain everything currently queued and exit'
+        )
+
+    def handle(self, *args, **options):
+        consumer = IngestConsumer(workers=options['workers'])
+
+        if options['once']:
+            total = 0
+            while True:
+                handled = consumer.drain_once()
+                if not handled:
+                    break
+                total += handled
+            self.stdout.write(self.style.SUCCESS(f"Ingested {total} queued tracking requests"))
+            return
+
+        stop_event = threading.Event()
+
+        def handle_signal(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+
+        consumer.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingest consumer {consumer.node_id} running with {consumer.workers} worker(s) (Ctrl+C to stop)"
+        ))
+
+        while not stop_event.wait(60):
+            self.stdout.write(f"Status: {queue_depth()} tracking requests queued")
+
+        self.stdout.write(self.style.WARNING("Shutting down ingest consumer..."))
+        consumer.stop()
+        self.stdout.write(self.style.SUCCESS("Ingest consumer stopped"))
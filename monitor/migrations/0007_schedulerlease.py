@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0006_alter_clickheatmap_url_alter_conversionfunnel_url_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SchedulerLease",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("holder", models.CharField(blank=True, max_length=200)),
+                ("expires_at", models.DateTimeField()),
+                ("acquired_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0007_schedulerlease"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CheckerNode",
+            fields=[
+                (
+                    "node_id",
+                    models.CharField(max_length=200, primary_key=True, serialize=False),
+                ),
+                ("hostname", models.CharField(blank=True, max_length=100)),
+                ("started_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("heartbeat_at", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "ordering": ["node_id"],
+            },
+        ),
+    ]
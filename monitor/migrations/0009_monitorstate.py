@@ -0,0 +1,72 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_monitor_states(apps, schema_editor):
+    """Build a MonitorState for every URL that already has status history"""
+    MonitoredURL = apps.get_model("monitor", "MonitoredURL")
+    URLStatus = apps.get_model("monitor", "URLStatus")
+    MonitorState = apps.get_model("monitor", "MonitorState")
+
+    states = []
+    for url in MonitoredURL.objects.all().iterator():
+        statuses = URLStatus.objects.filter(url=url).order_by("-timestamp")
+        latest = statuses.first()
+        if latest is None:
+            continue
+
+        # The current state began right after the last check in the other state
+        last_flip = statuses.exclude(is_up=latest.is_up).first()
+        current_run = statuses.filter(is_up=latest.is_up)
+        if last_flip is not None:
+            current_run = current_run.filter(timestamp__gt=last_flip.timestamp)
+        state_since = current_run.order_by("timestamp").values_list("timestamp", flat=True).first()
+
+        states.append(
+            MonitorState(
+                url=url,
+                last_checked_at=latest.timestamp,
+                last_status_code=latest.status_code,
+                last_response_time=latest.response_time,
+                last_error=latest.error_message,
+                is_up=latest.is_up,
+                state_since=state_since,
+                consecutive_failures=0 if latest.is_up else current_run.count(),
+            )
+        )
+    MonitorState.objects.bulk_create(states, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0008_checkernode"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonitorState",
+            fields=[
+                (
+                    "url",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="state",
+                        serialize=False,
+                        to="monitor.monitoredurl",
+                    ),
+                ),
+                ("last_checked_at", models.DateTimeField(db_index=True)),
+                ("last_status_code", models.IntegerField()),
+                ("last_response_time", models.FloatField()),
+                ("last_error", models.TextField(blank=True, null=True)),
+                ("is_up", models.BooleanField(db_index=True)),
+                ("state_since", models.DateTimeField()),
+                ("consecutive_failures", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_monitor_states, migrations.RunPython.noop),
+    ]
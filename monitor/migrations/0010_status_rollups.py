@@ -0,0 +1,135 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:51
+
+import bisect
+from datetime import timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of the rollup bucketing as of this migration (monitor.rollups
+# may change later without changing what this backfill wrote)
+LATENCY_BUCKETS = [50, 100, 200, 300, 500, 750, 1000, 2000, 5000, 10000]
+
+
+def hour_bucket(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(timestamp):
+    return hour_bucket(timestamp).replace(hour=0)
+
+
+def fold_into_rollup(rollup, url_status):
+    latency = url_status.response_time or 0
+    rollup.check_count += 1
+    if url_status.is_up:
+        rollup.up_count += 1
+    rollup.latency_sum += latency
+    rollup.latency_min = latency if rollup.latency_min is None else min(rollup.latency_min, latency)
+    rollup.latency_max = latency if rollup.latency_max is None else max(rollup.latency_max, latency)
+    rollup.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+
+def backfill_rollups(apps, schema_editor):
+    """Build hourly and daily rollups from the existing status history"""
+    MonitoredURL = apps.get_model("monitor", "MonitoredURL")
+    URLStatus = apps.get_model("monitor", "URLStatus")
+    StatusRollupHourly = apps.get_model("monitor", "StatusRollupHourly")
+    StatusRollupDaily = apps.get_model("monitor", "StatusRollupDaily")
+
+    for url_id in MonitoredURL.objects.values_list("id", flat=True).iterator():
+        hourly = {}
+        daily = {}
+        statuses = URLStatus.objects.filter(url_id=url_id).only("timestamp", "is_up", "response_time")
+        for url_status in statuses.iterator():
+            for model, rows, bucket in (
+                (StatusRollupHourly, hourly, hour_bucket(url_status.timestamp)),
+                (StatusRollupDaily, daily, day_bucket(url_status.timestamp)),
+            ):
+                rollup = rows.get(bucket)
+                if rollup is None:
+                    rollup = rows[bucket] = model(
+                        url_id=url_id, bucket=bucket, latency_histogram=[0] * (len(LATENCY_BUCKETS) + 1)
+                    )
+                fold_into_rollup(rollup, url_status)
+        StatusRollupHourly.objects.bulk_create(hourly.values(), batch_size=500)
+        StatusRollupDaily.objects.bulk_create(daily.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0009_monitorstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StatusRollupDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("check_count", models.PositiveIntegerField(default=0)),
+                ("up_count", models.PositiveIntegerField(default=0)),
+                ("latency_sum", models.FloatField(default=0)),
+                ("latency_min", models.FloatField(blank=True, null=True)),
+                ("latency_max", models.FloatField(blank=True, null=True)),
+                ("latency_histogram", models.JSONField(default=list)),
+                (
+                    "url",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="monitor.monitoredurl",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["bucket"],
+                "abstract": False,
+                "default_related_name": "daily_rollups",
+                "unique_together": {("url", "bucket")},
+            },
+        ),
+        migrations.CreateModel(
+            name="StatusRollupHourly",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("check_count", models.PositiveIntegerField(default=0)),
+                ("up_count", models.PositiveIntegerField(default=0)),
+                ("latency_sum", models.FloatField(default=0)),
+                ("latency_min", models.FloatField(blank=True, null=True)),
+                ("latency_max", models.FloatField(blank=True, null=True)),
+                ("latency_histogram", models.JSONField(default=list)),
+                (
+                    "url",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="monitor.monitoredurl",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["bucket"],
+                "abstract": False,
+                "default_related_name": "hourly_rollups",
+                "unique_together": {("url", "bucket")},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
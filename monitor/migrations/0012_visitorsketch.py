@@ -0,0 +1,124 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:05
+
+import hashlib
+import zlib
+from datetime import timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of the sketch encoding as of this migration (monitor.sketches
+# and monitor.visitors may change later without changing this backfill)
+HLL_PRECISION = 12
+ALL_COUNTRIES = ""
+
+
+def sketch_date(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).date()
+
+
+class HyperLogLog:
+    def __init__(self):
+        self.registers = bytearray(1 << HLL_PRECISION)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+        index = h >> (64 - HLL_PRECISION)
+        remaining_bits = 64 - HLL_PRECISION
+        rank = remaining_bits - (h & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def to_bytes(self):
+        return zlib.compress(bytes([HLL_PRECISION]) + bytes(self.registers))
+
+
+def backfill_visitor_sketches(apps, schema_editor):
+    """Build visitor/session sketches from the existing pageviews"""
+    MonitoredURL = apps.get_model("monitor", "MonitoredURL")
+    PageView = apps.get_model("monitor", "PageView")
+    VisitorSketch = apps.get_model("monitor", "VisitorSketch")
+
+    for url_id in MonitoredURL.objects.values_list("id", flat=True).iterator():
+        rows = {}
+        pageviews = PageView.objects.filter(url_id=url_id).values_list(
+            "timestamp", "visitor_id", "session_id", "country", "country_code"
+        )
+        for timestamp, visitor_id, session_id, country, country_code in pageviews.iterator():
+            date = sketch_date(timestamp)
+            for key in {ALL_COUNTRIES, country}:
+                row = rows.get((date, key))
+                if row is None:
+                    row = rows[(date, key)] = [0, HyperLogLog(), HyperLogLog(), ""]
+                row[0] += 1
+                row[1].add(visitor_id)
+                row[2].add(session_id)
+                if key:
+                    row[3] = country_code or row[3]
+        VisitorSketch.objects.bulk_create(
+            [
+                VisitorSketch(
+                    url_id=url_id,
+                    date=date,
+                    country=country,
+                    country_code=country_code,
+                    pageviews=count,
+                    visitors=visitors.to_bytes(),
+                    sessions=sessions.to_bytes(),
+                )
+                for (date, country), (count, visitors, sessions, country_code) in rows.items()
+            ],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0011_ingestqueueitem"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VisitorSketch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("country", models.CharField(blank=True, max_length=100)),
+                ("country_code", models.CharField(blank=True, max_length=2)),
+                ("pageviews", models.PositiveIntegerField(default=0)),
+                ("visitors", models.BinaryField()),
+                ("sessions", models.BinaryField()),
+                (
+                    "url",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="visitor_sketches",
+                        to="monitor.monitoredurl",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="visitorsketch",
+            index=models.Index(
+                fields=["date", "country"], name="monitor_vis_date_f64c91_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="visitorsketch",
+            unique_together={("url", "date", "country")},
+        ),
+        migrations.RunPython(backfill_visitor_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:06
+
+import zlib
+from array import array
+from datetime import timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of the grid binning as of this migration (monitor.heatmaps may
+# change later without changing this backfill)
+GRID_COLUMNS = 64
+GRID_ROWS = 40
+DEFAULT_VIEWPORT = (1280, 800)
+
+
+def grid_date(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).date()
+
+
+def cell_index(x, y, viewport_width, viewport_height):
+    width = viewport_width if viewport_width and viewport_width > 0 else DEFAULT_VIEWPORT[0]
+    height = viewport_height if viewport_height and viewport_height > 0 else DEFAULT_VIEWPORT[1]
+    column = min(max(int(x * GRID_COLUMNS / width), 0), GRID_COLUMNS - 1)
+    row = min(max(int(y * GRID_ROWS / height), 0), GRID_ROWS - 1)
+    return row * GRID_COLUMNS + column
+
+
+def empty_grid():
+    return array("I", bytes(GRID_COLUMNS * GRID_ROWS * 4))
+
+
+def encode_grid(grid):
+    return zlib.compress(grid.tobytes())
+
+
+def backfill_click_grids(apps, schema_editor):
+    """Bin the existing clicks into heatmap grids"""
+    MonitoredURL = apps.get_model("monitor", "MonitoredURL")
+    ClickHeatmap = apps.get_model("monitor", "ClickHeatmap")
+    ClickHeatmapGrid = apps.get_model("monitor", "ClickHeatmapGrid")
+
+    for url_id in MonitoredURL.objects.values_list("id", flat=True).iterator():
+        grids = {}
+        clicks = ClickHeatmap.objects.filter(url_id=url_id).values_list(
+            "page_url", "device_type", "timestamp",
+            "x_position", "y_position", "viewport_width", "viewport_height",
+        )
+        for page_url, device_type, timestamp, x, y, width, height in clicks.iterator():
+            key = (page_url, device_type, grid_date(timestamp))
+            grid = grids.get(key)
+            if grid is None:
+                grid = grids[key] = empty_grid()
+            grid[cell_index(x, y, width, height)] += 1
+        ClickHeatmapGrid.objects.bulk_create(
+            [
+                ClickHeatmapGrid(
+                    url_id=url_id,
+                    page_url=page_url,
+                    device_type=device_type,
+                    date=date,
+                    clicks=sum(grid),
+                    counts=encode_grid(grid),
+                )
+                for (page_url, device_type, date), grid in grids.items()
+            ],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0012_visitorsketch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClickHeatmapGrid",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("page_url", models.CharField(max_length=500)),
+                ("device_type", models.CharField(default="desktop", max_length=20)),
+                ("date", models.DateField()),
+                ("clicks", models.PositiveIntegerField(default=0)),
+                ("counts", models.BinaryField()),
+                (
+                    "url",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="click_grids",
+                        to="monitor.monitoredurl",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="clickheatmapgrid",
+            index=models.Index(
+                fields=["url", "-date"], name="monitor_cli_url_id_c43376_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="clickheatmapgrid",
+            unique_together={("url", "page_url", "device_type", "date")},
+        ),
+        migrations.RunPython(backfill_click_grids, migrations.RunPython.noop),
+    ]
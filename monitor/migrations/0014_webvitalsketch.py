@@ -0,0 +1,145 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:08
+
+import math
+from datetime import timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of the sketch encoding as of this migration (monitor.sketches
+# and monitor.web_vitals may change later without changing this backfill)
+VITAL_FIELDS = {
+    "fcp": "first_contentful_paint",
+    "lcp": "largest_contentful_paint",
+    "fid": "first_input_delay",
+    "cls": "cumulative_layout_shift",
+    "tti": "time_to_interactive",
+    "dom_load": "dom_load_time",
+    "page_load": "page_load_time",
+}
+DDSKETCH_ACCURACY = 0.01
+DDSKETCH_MAX_BINS = 2048
+
+
+def vitals_date(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).date()
+
+
+class DDSketch:
+    def __init__(self):
+        self._log_gamma = math.log((1 + DDSKETCH_ACCURACY) / (1 - DDSKETCH_ACCURACY))
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        value = float(value)
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + 1
+            if len(self.bins) > DDSKETCH_MAX_BINS:
+                indexes = sorted(self.bins)
+                excess = len(indexes) - DDSKETCH_MAX_BINS
+                merged = sum(self.bins.pop(index) for index in indexes[:excess + 1])
+                self.bins[indexes[excess]] = merged
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        return {
+            "a": DDSKETCH_ACCURACY,
+            "z": self.zero_count,
+            "n": self.count,
+            "s": self.sum,
+            "b": [[index, count] for index, count in self.bins.items()],
+        }
+
+
+def backfill_web_vitals(apps, schema_editor):
+    """Build Web Vitals sketches from the existing performance metrics"""
+    MonitoredURL = apps.get_model("monitor", "MonitoredURL")
+    PerformanceMetric = apps.get_model("monitor", "PerformanceMetric")
+    WebVitalSketch = apps.get_model("monitor", "WebVitalSketch")
+
+    for url_id in MonitoredURL.objects.values_list("id", flat=True).iterator():
+        sketches = {}
+        metrics = PerformanceMetric.objects.filter(url_id=url_id).values_list(
+            "page_url", "timestamp", *VITAL_FIELDS.values()
+        )
+        for page_url, timestamp, *values in metrics.iterator():
+            date = vitals_date(timestamp)
+            for metric, value in zip(VITAL_FIELDS, values):
+                if value is None:
+                    continue
+                sketch = sketches.get((page_url, date, metric))
+                if sketch is None:
+                    sketch = sketches[(page_url, date, metric)] = DDSketch()
+                sketch.add(value)
+        WebVitalSketch.objects.bulk_create(
+            [
+                WebVitalSketch(
+                    url_id=url_id,
+                    page_url=page_url,
+                    date=date,
+                    metric=metric,
+                    count=sketch.count,
+                    sketch=sketch.to_dict(),
+                )
+                for (page_url, date, metric), sketch in sketches.items()
+            ],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0013_clickheatmapgrid"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WebVitalSketch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("page_url", models.CharField(max_length=500)),
+                ("date", models.DateField()),
+                ("metric", models.CharField(max_length=20)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("sketch", models.JSONField(default=dict)),
+                (
+                    "url",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="web_vital_sketches",
+                        to="monitor.monitoredurl",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="webvitalsketch",
+            index=models.Index(
+                fields=["url", "-date"], name="monitor_web_url_id_7feb49_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="webvitalsketch",
+            unique_together={("url", "page_url", "date", "metric")},
+        ),
+        migrations.RunPython(backfill_web_vitals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import migrations
+from django.db.models import Count, F, IntegerField, Sum, Value
+from django.db.models.functions import Cast, Floor, Greatest, Least, TruncDate
+
+# Frozen copy of the scroll depth bucketing as of this migration
+# (monitor.scroll_depth may change later without changing this backfill)
+BUCKET_WIDTH = 10
+BUCKET_COUNT = 10
+BUCKET_LABELS = [f"{i * BUCKET_WIDTH}-{(i + 1) * BUCKET_WIDTH}" for i in range(BUCKET_COUNT)]
+
+
+def backfill_scroll_heatmaps(apps, schema_editor):
+    """Materialize daily scroll depth distributions from the existing pageviews"""
+    PageView = apps.get_model("monitor", "PageView")
+    ScrollHeatmap = apps.get_model("monitor", "ScrollHeatmap")
+
+    bucket = Least(
+        Greatest(Cast(Floor(F("scroll_depth") / BUCKET_WIDTH), IntegerField()), Value(0)),
+        Value(BUCKET_COUNT - 1),
+    )
+    grouped = PageView.objects.filter(url__isnull=False).annotate(
+        date=TruncDate("timestamp", tzinfo=dt_timezone.utc),
+        bucket=bucket,
+    ).values("url_id", "page_url", "date", "bucket").annotate(
+        views=Count("id"),
+        depth_sum=Sum("scroll_depth"),
+    ).order_by()
+
+    rows = {}
+    depth_sums = defaultdict(float)
+    for group in grouped:
+        key = (group["url_id"], group["page_url"], group["date"])
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = ScrollHeatmap(
+                url_id=key[0], page_url=key[1], date=key[2],
+                depth_distribution={label: 0 for label in BUCKET_LABELS},
+            )
+        row.depth_distribution[BUCKET_LABELS[group["bucket"]]] += group["views"]
+        row.total_views += group["views"]
+        depth_sums[key] += group["depth_sum"] or 0
+    for key, row in rows.items():
+        row.average_depth = depth_sums[key] / row.total_views if row.total_views else 0
+
+    ScrollHeatmap.objects.all().delete()
+    ScrollHeatmap.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0014_webvitalsketch"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_scroll_heatmaps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# Watermark row of the scroll heatmap job (frozen; see monitor.scroll_depth)
+WATERMARK_NAME = "scroll_heatmaps"
+
+
+def start_watermark(apps, schema_editor):
+    """ScrollHeatmap was backfilled by 0015; only later page view writes need folding in"""
+    AggregateWatermark = apps.get_model("monitor", "AggregateWatermark")
+    AggregateWatermark.objects.update_or_create(
+        name=WATERMARK_NAME, defaults={"processed_through": django.utils.timezone.now()}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0015_backfill_scroll_heatmaps"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AggregateWatermark",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("processed_through", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="pageview",
+            name="updated_at",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.RunPython(start_watermark, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:18
+
+import json
+import zlib
+from datetime import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of the chunk encoding as of this migration
+# (monitor.session_events may change later without changing this migration)
+CHUNK_EVENTS = 500
+
+
+def build_chunks(SessionEventChunk, recording_id, entries):
+    chunks = []
+    for i in range(0, len(entries), CHUNK_EVENTS):
+        part = entries[i:i + CHUNK_EVENTS]
+        chunks.append(SessionEventChunk(
+            recording_id=recording_id,
+            sequence=len(chunks),
+            first_timestamp=datetime.fromisoformat(part[0]["timestamp"]),
+            last_timestamp=datetime.fromisoformat(part[-1]["timestamp"]),
+            event_count=len(part),
+            data=zlib.compress(json.dumps(part, separators=(",", ":")).encode(), 6),
+        ))
+    return chunks
+
+
+def move_events_to_chunks(apps, schema_editor):
+    """Compress the timelines stored inline on SessionRecording into chunks"""
+    SessionRecording = apps.get_model("monitor", "SessionRecording")
+    SessionEventChunk = apps.get_model("monitor", "SessionEventChunk")
+
+    recordings = SessionRecording.objects.exclude(events=[]).values_list("id", "events")
+    for recording_id, events in recordings.iterator(chunk_size=100):
+        events = sorted(
+            (entry for entry in events if isinstance(entry, dict) and entry.get("timestamp")),
+            key=lambda entry: entry["timestamp"],
+        )
+        if not events:
+            continue
+        SessionEventChunk.objects.bulk_create(build_chunks(SessionEventChunk, recording_id, events))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0016_scroll_heatmap_watermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SessionEventChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sequence", models.PositiveIntegerField()),
+                ("first_timestamp", models.DateTimeField()),
+                ("last_timestamp", models.DateTimeField()),
+                ("event_count", models.PositiveIntegerField(default=0)),
+                ("data", models.BinaryField()),
+                (
+                    "recording",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="event_chunks",
+                        to="monitor.sessionrecording",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["recording", "sequence"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="sessioneventchunk",
+            index=models.Index(
+                fields=["recording", "first_timestamp"],
+                name="monitor_ses_recordi_08cff3_idx",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="sessioneventchunk",
+            unique_together={("recording", "sequence")},
+        ),
+        migrations.RunPython(move_events_to_chunks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="sessionrecording",
+            name="events",
+        ),
+    ]
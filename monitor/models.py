@@ -44,6 +44,14 @@ class MonitoredURL(models.Model):
     
     def get_absolute_url(self):
         return reverse('monitor:url_detail', args=[self.id])
+    
+    @property
+    def current_state(self):
+        """Latest check state, or None if the URL has never been checked"""
+        try:
+            return self.state
+        except MonitorState.DoesNotExist:
+            return None
 
 
 class URLStatus(models.Model):
@@ -65,6 +73,113 @@ class URLStatus(models.Model):
     def __str__(self):
         return f"{self.url.name} - {'UP' if self.is_up else 'DOWN'} at {self.timestamp}"
 
+class MonitorState(models.Model):
+    """Current state of a monitored URL, updated with every check result"""
+    url = models.OneToOneField(MonitoredURL, on_delete=models.CASCADE, primary_key=True, related_name='state')
+    last_checked_at = models.DateTimeField(db_index=True)
+    last_status_code = models.IntegerField()
+    last_response_time = models.FloatField()  # in milliseconds
+    last_error = models.TextField(blank=True, null=True)
+    is_up = models.BooleanField(db_index=True)
+    state_since = models.DateTimeField()  # When the current up/down state began
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.url.name} - {'UP' if self.is_up else 'DOWN'} since {self.state_since}"
+
+class SchedulerLease(models.Model):
+    """Time-limited lease row used to elect a single active scheduler"""
+    name = models.CharField(max_length=100, primary_key=True)
+    holder = models.CharField(max_length=200, blank=True)  # Node id of the current leader
+    expires_at = models.DateTimeField()
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.name} held by {self.holder or 'nobody'} until {self.expires_at}"
+
+class AggregateWatermark(models.Model):
+    """How far an incremental aggregation job has processed its source rows"""
+    name = models.CharField(max_length=100, primary_key=True)
+    processed_through = models.DateTimeField(null=True, blank=True)  # Source rows updated up to here are folded in
+    
+    def __str__(self):
+        return f"{self.name} processed through {self.processed_through or 'never'}"
+
+class CheckerNode(models.Model):
+    """Checker process taking part in the sharded scheduler's hash ring"""
+    node_id = models.CharField(max_length=200, primary_key=True)
+    hostname = models.CharField(max_length=100, blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    heartbeat_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        ordering = ['node_id']
+    
+    def __str__(self):
+        return f"{self.node_id} (last seen {self.heartbeat_at})"
+
+class StatusRollup(models.Model):
+    """Aggregated check results for one URL over one time bucket"""
+    url = models.ForeignKey(MonitoredURL, on_delete=models.CASCADE)
+    bucket = models.DateTimeField()  # Start of the bucket (UTC)
+    check_count = models.PositiveIntegerField(default=0)
+    up_count = models.PositiveIntegerField(default=0)
+    latency_sum = models.FloatField(default=0)  # in milliseconds
+    latency_min = models.FloatField(null=True, blank=True)
+    latency_max = models.FloatField(null=True, blank=True)
+    latency_histogram = models.JSONField(default=list)  # Counts per rollups.LATENCY_BUCKETS bound
+    
+    class Meta:
+        abstract = True
+        ordering = ['bucket']
+    
+    @property
+    def uptime(self):
+        return (self.up_count / self.check_count) * 100 if self.check_count else 0
+    
+    @property
+    def avg_latency(self):
+        return self.latency_sum / self.check_count if self.check_count else 0
+
+
+class StatusRollupHourly(StatusRollup):
+    class Meta(StatusRollup.Meta):
+        unique_together = ['url', 'bucket']
+        default_related_name = 'hourly_rollups'
+    
+    def __str__(self):
+        return f"{self.url.name} - hour of {self.bucket}"
+
+
+class StatusRollupDaily(StatusRollup):
+    class Meta(StatusRollup.Meta):
+        unique_together = ['url', 'bucket']
+        default_related_name = 'daily_rollups'
+    
+    def __str__(self):
+        return f"{self.url.name} - day of {self.bucket}"
+
+class IngestQueueItem(models.Model):
+    """One tracking request's events, waiting to be written by an ingest consumer"""
+    url = models.ForeignKey(MonitoredURL, on_delete=models.CASCADE, null=True, blank=True)
+    events = models.JSONField(default=list)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.CharField(max_length=500, blank=True)
+    received_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=150, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['claimed_at', 'id']),
+            models.Index(fields=['claimed_by']),
+        ]
+    
+    def __str__(self):
+        return f"{len(self.events)} events received at {self.received_at}"
+
 class Alert(models.Model):
     ALERT_METHODS = [
         ('email', 'Email'),
@@ -155,7 +270,8 @@ class PageView(models.Model):
     referrer = models.CharField(max_length=500, blank=True)
     
     # Time tracking
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)  # Last write, set by ingest (drives incremental aggregates)
     time_on_page = models.FloatField(default=0)  # Seconds
     
     # Engagement metrics
@@ -212,7 +328,7 @@ class ClickHeatmap(models.Model):
     
     # Session info
     session_id = models.CharField(max_length=100, db_index=True)
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     device_type = models.CharField(max_length=20, default='desktop')
     
     class Meta:
@@ -226,6 +342,26 @@ class ClickHeatmap(models.Model):
         return f"Click at ({self.x_position}, {self.y_position}) on {self.page_url}"
 
 
+class ClickHeatmapGrid(models.Model):
+    """Clicks on one page binned into a viewport-relative grid (see monitor.heatmaps) for one UTC day"""
+    url = models.ForeignKey(MonitoredURL, on_delete=models.CASCADE, related_name='click_grids')
+    page_url = models.CharField(max_length=500)
+    device_type = models.CharField(max_length=20, default='desktop')
+    date = models.DateField()
+    clicks = models.PositiveIntegerField(default=0)
+    counts = models.BinaryField()  # heatmaps.encode_grid(): GRID_ROWS x GRID_COLUMNS counts
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['url', 'page_url', 'device_type', 'date']
+        indexes = [
+            models.Index(fields=['url', '-date']),
+        ]
+    
+    def __str__(self):
+        return f"Click grid for {self.page_url} ({self.device_type}) on {self.date}"
+
+
 class ScrollHeatmap(models.Model):
     """Track scroll depth distribution for heatmap visualization"""
     url = models.ForeignKey(MonitoredURL, on_delete=models.CASCADE, related_name='scroll_heatmaps', null=True, blank=True)
@@ -251,6 +387,27 @@ class ScrollHeatmap(models.Model):
         return f"Scroll heatmap for {self.page_url} on {self.date}"
 
 
+class VisitorSketch(models.Model):
+    """HyperLogLog sketches of the visitors and sessions one URL saw on one UTC day"""
+    url = models.ForeignKey(MonitoredURL, on_delete=models.CASCADE, related_name='visitor_sketches')
+    date = models.DateField()
+    country = models.CharField(max_length=100, blank=True)  # '' covers all countries
+    country_code = models.CharField(max_length=2, blank=True)
+    pageviews = models.PositiveIntegerField(default=0)
+    visitors = models.BinaryField()  # sketches.HyperLogLog.to_bytes()
+    sessions = models.BinaryField()
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['url', 'date', 'country']
+        indexes = [
+            models.Index(fields=['date', 'country']),
+        ]
+
+    def __str__(self):
+        return f"Visitor sketch for {self.url_id} on {self.date} ({self.country or 'all countries'})"
+
+
 class MouseMovement(models.Model):
     """Track mouse movement patterns (rage clicks, dead clicks, etc.)"""
     url = models.ForeignKey(MonitoredURL, on_delete=models.CASCADE, related_name='mouse_movements', null=True, blank=True)
@@ -273,7 +430,7 @@ class MouseMovement(models.Model):
     # Additional context
     click_count = models.IntegerField(default=1)  # For rage clicks
     element_selector = models.CharField(max_length=200, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     
     class Meta:
         ordering = ['-timestamp']
@@ -297,8 +454,8 @@ class SessionRecording(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     duration = models.FloatField(default=0)  # Seconds
     
-    # Events data - stored as compressed JSON
-    events = models.JSONField(default=list)  # Interaction events timeline
+    # Events data - the interaction timeline is stored as compressed
+    # SessionEventChunk rows (event_chunks), streamed back for replay
     
     # Summary metrics
     pages_visited = models.IntegerField(default=0)
@@ -322,6 +479,26 @@ class SessionRecording(models.Model):
         return f"Session {self.session_id[:8]} - {self.start_time}"
 
 
+class SessionEventChunk(models.Model):
+    """Compressed slice of a session recording's event timeline"""
+    recording = models.ForeignKey(SessionRecording, on_delete=models.CASCADE, related_name='event_chunks')
+    sequence = models.PositiveIntegerField()  # Append order within the recording
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    event_count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()  # zlib-compressed JSON list of timeline entries, oldest first
+    
+    class Meta:
+        ordering = ['recording', 'sequence']
+        unique_together = ['recording', 'sequence']
+        indexes = [
+            models.Index(fields=['recording', 'first_timestamp']),
+        ]
+    
+    def __str__(self):
+        return f"Chunk {self.sequence} of session {self.recording_id} ({self.event_count} events)"
+
+
 class PerformanceMetric(models.Model):
     """Track page performance metrics"""
     url = models.ForeignKey(MonitoredURL, on_delete=models.CASCADE, related_name='performance_metrics', null=True, blank=True)
@@ -344,7 +521,7 @@ class PerformanceMetric(models.Model):
     connection_type = models.CharField(max_length=20, blank=True)  # 4g, wifi, etc.
     effective_bandwidth = models.FloatField(null=True, blank=True)  # Mbps
     
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     
     class Meta:
         ordering = ['-timestamp']
@@ -357,6 +534,26 @@ class PerformanceMetric(models.Model):
         return f"Performance metrics for {self.page_url}"
 
 
+class WebVitalSketch(models.Model):
+    """DDSketch of one performance metric on one page for one UTC day (see monitor.web_vitals)"""
+    url = models.ForeignKey(MonitoredURL, on_delete=models.CASCADE, related_name='web_vital_sketches')
+    page_url = models.CharField(max_length=500)
+    date = models.DateField()
+    metric = models.CharField(max_length=20)  # Key of web_vitals.VITAL_FIELDS
+    count = models.PositiveIntegerField(default=0)
+    sketch = models.JSONField(default=dict)  # sketches.DDSketch.to_dict()
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['url', 'page_url', 'date', 'metric']
+        indexes = [
+            models.Index(fields=['url', '-date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.metric} sketch for {self.page_url} on {self.date}"
+
+
 class ConversionFunnel(models.Model):
     """Track conversion funnel steps"""
     url = models.ForeignKey(MonitoredURL, on_delete=models.CASCADE, related_name='conversion_funnels', null=True, blank=True)
@@ -0,0 +1,180 @@
+"""
+Buffered URLStatus Writer
+Collects check results in memory and saves them with bulk_create,
+keeping each monitor's MonitorState row and hourly/daily rollups up to date
+in the same transaction
+"""
+import atexit
+import threading
+import logging
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from .state import apply_check_results
+from .rollups import apply_rollups
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+FLUSH_SIZE = 200  # Flush once this many results are buffered
+FLUSH_INTERVAL = 5  # Seconds between time-based flushes
+MAX_PENDING = 10000  # Results kept for retry while the database is unavailable
+
+
+class StatusWriter:
+    """
+    Write-behind buffer for URLStatus rows.
+
+    UP results are buffered and written in one bulk_create when FLUSH_SIZE
+    results are waiting, every FLUSH_INTERVAL seconds, or on shutdown.
+    DOWN results bypass the buffer and are saved immediately, so alerting
+    always has a saved row to point at.
+    """
+
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.running = False
+        self.thread = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def start(self):
+        """Start the time-based flush thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write everything still buffered"""
+        self.running = False
+        self._wake.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.flush()
+
+    def add(self, url_status):
+        """
+        Record an unsaved URLStatus. DOWN results are saved before returning
+        and the saved instance is returned; UP results are buffered and None
+        is returned.
+        """
+        if not url_status.is_up:
+            self._write([url_status], bulk=False)
+            return url_status
+
+        with self._lock:
+            self._buffer.append(url_status)
+            full = len(self._buffer) >= self.flush_size
+        if full:
+            self._wake.set()
+        return None
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def flush(self):
+        """Write all buffered results. Returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            try:
+                batch = self._drop_deleted_urls(batch)
+                self._write(batch)
+                logger.debug(f"Flushed {len(batch)} URL status records")
+                return len(batch)
+            except IntegrityError as e:
+                # A bad row must not block the rest of the batch on every retry
+                logger.warning(f"Bulk write of {len(batch)} URL status records failed ({e}), retrying individually")
+                return self._write_individually(batch)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} URL status records: {e}")
+                self._requeue(batch)
+                return 0
+
+    def _requeue(self, statuses):
+        with self._lock:
+            # Keep the newest results for the next attempt
+            self._buffer = (statuses + self._buffer)[-MAX_PENDING:]
+
+    def _drop_deleted_urls(self, statuses):
+        """Results of monitors deleted while the results were buffered are discarded"""
+        from monitor.models import MonitoredURL
+
+        existing = set(MonitoredURL.objects.filter(
+            id__in={url_status.url_id for url_status in statuses},
+        ).values_list('id', flat=True))
+        kept = [url_status for url_status in statuses if url_status.url_id in existing]
+        if len(kept) < len(statuses):
+            logger.info(f"Discarded {len(statuses) - len(kept)} buffered results of deleted URLs")
+        return kept
+
+    def _write_individually(self, statuses):
+        """
+        Write results one per savepoint. Rows that violate a constraint are
+        dropped; rows that fail for another reason are kept for retry.
+        Returns the number written.
+        """
+        written = 0
+        retry = []
+        for url_status in statuses:
+            try:
+                self._write([url_status])
+                written += 1
+            except IntegrityError as e:
+                logger.error(f"Dropping URL status record for {url_status.url_id}: {e}")
+            except DatabaseError as e:
+                logger.error(f"Failed to write URL status record for {url_status.url_id}: {e}")
+                retry.append(url_status)
+        if retry:
+            self._requeue(retry)
+        return written
+
+    def _write(self, statuses, bulk=True):
+        from monitor.models import URLStatus
+
+        with transaction.atomic():
+            if bulk:
+                URLStatus.objects.bulk_create(statuses, batch_size=self.flush_size)
+            else:
+                for url_status in statuses:
+                    url_status.save()
+            apply_check_results(statuses)
+            apply_rollups(statuses)
+
+    def _run(self):
+        while self.running:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+# Global writer instance (one per process)
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_status_writer():
+    """Get the process-wide StatusWriter, starting it on first use"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = StatusWriter()
+                _writer.start()
+                atexit.register(_writer.stop)
+    return _writer
+
+def flush_status_writer():
+    """Write any buffered results (no-op if the writer was never used)"""
+    if _writer is not None:
+        return _writer.flush()
+    return 0
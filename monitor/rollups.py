@@ -0,0 +1,235 @@
+"""
+Status Rollups
+Keeps per-URL hourly and daily aggregates of check results up to date
+"""
+import bisect
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+# Upper bounds (ms) of the latency histogram buckets; a final bucket holds
+# everything slower than the last bound
+LATENCY_BUCKETS = [50, 100, 200, 300, 500, 750, 1000, 2000, 5000, 10000]
+
+ROLLUP_FIELDS = [
+    'check_count', 'up_count', 'latency_sum', 'latency_min', 'latency_max', 'latency_histogram',
+]
+
+# Retention (days) for rollup rows, applied by the scheduler's cleanup
+HOURLY_RETENTION_DAYS = 95
+DAILY_RETENTION_DAYS = 400
+
+
+def hour_bucket(timestamp):
+    """Start of the UTC hour containing timestamp"""
+    return timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(timestamp):
+    """Start of the UTC day containing timestamp"""
+    return hour_bucket(timestamp).replace(hour=0)
+
+
+def latency_bucket_index(response_time):
+    return bisect.bisect_left(LATENCY_BUCKETS, response_time)
+
+
+def empty_histogram():
+    return [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+def fold_into_rollup(rollup, url_status):
+    """Add one URLStatus to a rollup row in memory"""
+    latency = url_status.response_time or 0
+    rollup.check_count += 1
+    if url_status.is_up:
+        rollup.up_count += 1
+    rollup.latency_sum += latency
+    rollup.latency_min = latency if rollup.latency_min is None else min(rollup.latency_min, latency)
+    rollup.latency_max = latency if rollup.latency_max is None else max(rollup.latency_max, latency)
+    histogram = rollup.latency_histogram or empty_histogram()
+    histogram[latency_bucket_index(latency)] += 1
+    rollup.latency_histogram = histogram
+
+
+def _apply(model, bucket_fn, statuses):
+    by_key = defaultdict(list)
+    for url_status in statuses:
+        by_key[(url_status.url_id, bucket_fn(url_status.timestamp))].append(url_status)
+
+    # Create missing rows empty first, so concurrent writers lock and add to the same row
+    model.objects.bulk_create(
+        [model(url_id=url_id, bucket=bucket, latency_histogram=empty_histogram()) for url_id, bucket in by_key],
+        ignore_conflicts=True,
+    )
+    rows = []
+    for rollup in model.objects.select_for_update().filter(
+        url_id__in={url_id for url_id, _ in by_key},
+        bucket__in={bucket for _, bucket in by_key},
+    ):
+        url_statuses = by_key.get((rollup.url_id, rollup.bucket))
+        if url_statuses is None:
+            continue
+        for url_status in url_statuses:
+            fold_into_rollup(rollup, url_status)
+        rows.append(rollup)
+    model.objects.bulk_update(rows, ROLLUP_FIELDS)
+
+
+def apply_rollups(statuses):
+    """
+    Add a batch of saved URLStatus rows to the hourly and daily rollups with
+    one insert of missing rows, one locking SELECT and one bulk update per
+    table. Call inside the transaction that
+    saves the statuses, so a failed write never counts a result twice.
+    """
+    from monitor.models import StatusRollupHourly, StatusRollupDaily
+
+    if not statuses:
+        return
+    _apply(StatusRollupHourly, hour_bucket, statuses)
+    _apply(StatusRollupDaily, day_bucket, statuses)
+
+
+def histogram_percentile(histogram, q):
+    """
+    Approximate the q-th percentile (0-100) of a latency histogram, returning
+    the upper bound of the bucket it falls in (None if the histogram is empty)
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = total * q / 100
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank and count:
+            if index < len(LATENCY_BUCKETS):
+                return LATENCY_BUCKETS[index]
+            return float('inf')
+    return None
+
+
+def summarize(rollups):
+    """
+    Combine rollup rows into a single summary dict: checks, uptime (percent,
+    None without data), avg/min/max latency and an approximate p95.
+    """
+    checks = up = 0
+    latency_sum = 0.0
+    latency_min = latency_max = None
+    histogram = empty_histogram()
+    for r in rollups:
+        checks += r.check_count
+        up += r.up_count
+        latency_sum += r.latency_sum
+        if r.latency_min is not None:
+            latency_min = r.latency_min if latency_min is None else min(latency_min, r.latency_min)
+        if r.latency_max is not None:
+            latency_max = r.latency_max if latency_max is None else max(latency_max, r.latency_max)
+        for index, count in enumerate(r.latency_histogram or []):
+            histogram[index] += count
+
+    p95 = histogram_percentile(histogram, 95)
+    if p95 is not None and latency_max is not None:
+        p95 = min(p95, latency_max)
+    return {
+        'checks': checks,
+        'uptime': round(up / checks * 100, 2) if checks else None,
+        'avg_latency': latency_sum / checks if checks else 0,
+        'min_latency': latency_min,
+        'max_latency': latency_max,
+        'p95_latency': p95,
+    }
+
+
+def rollup_source(since, now=None):
+    """
+    Rollup model and first bucket covering `since` until now. Windows of two
+    days or more are read from the daily rollups (one row per day), shorter
+    ones from the hourly rollups; `since` is rounded down to the bucket.
+    """
+    from django.utils import timezone
+    from monitor.models import StatusRollupHourly, StatusRollupDaily
+
+    now = now or timezone.now()
+    if now - since < timedelta(days=2):
+        return StatusRollupHourly, hour_bucket(since)
+    return StatusRollupDaily, day_bucket(since)
+
+
+def url_window_stats(url, since, now=None):
+    """Summary for one URL from `since` until now (see rollup_source)"""
+    model, start = rollup_source(since, now)
+    return summarize(model.objects.filter(url=url, bucket__gte=start))
+
+
+def _first_complete_bucket(bucket_fn, step, oldest):
+    """First bucket that starts at or after a URL's oldest surviving raw row"""
+    return bucket_fn(oldest - timedelta(microseconds=1)) + step
+
+
+def rebuild_rollups(url_ids=None, batch_size=5000, discard_history=False):
+    """
+    Recompute rollups from the URLStatus rows still in the database. The
+    scheduler keeps only the newest raw rows of each URL, so by default only
+    the buckets those rows cover completely are replaced and older rollups
+    are kept. With discard_history every rollup row of the affected URLs is
+    deleted and rebuilt from the raw rows alone. Returns rows read.
+    """
+    from django.db import transaction
+    from django.db.models import Min
+    from monitor.models import URLStatus, StatusRollupHourly, StatusRollupDaily
+
+    tables = ((StatusRollupHourly, hour_bucket, timedelta(hours=1)), (StatusRollupDaily, day_bucket, timedelta(days=1)))
+    oldest = URLStatus.objects.values('url_id').annotate(oldest=Min('timestamp')).order_by()
+    if url_ids is not None:
+        oldest = oldest.filter(url_id__in=url_ids)
+
+    with transaction.atomic():
+        if discard_history:
+            for model, _, _ in tables:
+                rows = model.objects.all()
+                if url_ids is not None:
+                    rows = rows.filter(url_id__in=url_ids)
+                rows.delete()
+
+        count = 0
+        for url_id, first in oldest.values_list('url_id', 'oldest'):
+            starts = {}  # model -> first bucket rebuilt
+            for model, bucket_fn, step in tables:
+                starts[model] = bucket_fn(first) if discard_history else _first_complete_bucket(bucket_fn, step, first)
+                model.objects.filter(url_id=url_id, bucket__gte=starts[model]).delete()
+
+            statuses = URLStatus.objects.filter(url_id=url_id, timestamp__gte=min(starts.values())).order_by('timestamp')
+            batch = []
+            for url_status in statuses.only('url_id', 'timestamp', 'is_up', 'response_time').iterator(chunk_size=batch_size):
+                batch.append(url_status)
+                if len(batch) >= batch_size:
+                    count += _rebuild_batch(tables, starts, batch)
+                    batch = []
+            count += _rebuild_batch(tables, starts, batch)
+    return count
+
+
+def _rebuild_batch(tables, starts, statuses):
+    """Fold statuses into each table's buckets from its rebuild start on"""
+    for model, bucket_fn, _ in tables:
+        included = [url_status for url_status in statuses if url_status.timestamp >= starts[model]]
+        if included:
+            _apply(model, bucket_fn, included)
+    return len(statuses)
+
+
+def prune_rollups(now=None):
+    """Delete rollup rows older than their retention period"""
+    from django.utils import timezone
+    from monitor.models import StatusRollupHourly, StatusRollupDaily
+
+    now = now or timezone.now()
+    hourly, _ = StatusRollupHourly.objects.filter(
+        bucket__lt=now - timedelta(days=HOURLY_RETENTION_DAYS)
+    ).delete()
+    daily, _ = StatusRollupDaily.objects.filter(
+        bucket__lt=now - timedelta(days=DAILY_RETENTION_DAYS)
+    ).delete()
+    return hourly + daily
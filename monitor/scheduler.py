@@ -1,26 +1,64 @@
 """
 Standalone URL Monitor - No Celery Required
-Runs URL checks in background threads without external dependencies
+Schedules URL checks in a background thread and runs them on the asyncio check engine
 """
 import threading
 import time
 import logging
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.utils import timezone
+from .check_engine import AsyncCheckEngine
+from .due_queue import DueQueue
+from .leader import LeaderElector
+from .sharding import ShardMembership
+from .result_writer import get_status_writer, flush_status_writer
+from .rollups import prune_rollups
+from . import scroll_depth
 
 logger = logging.getLogger(__name__)
 
 # Configuration
-SCHEDULER_CHECK_INTERVAL = 30  # Seconds between scheduler iterations
-CLEANUP_INTERVAL = 10  # Run cleanup every N scheduler iterations (10 * 30s = 5 minutes)
+SCHEDULER_CHECK_INTERVAL = 30  # Max seconds between scheduler iterations
+MIN_SLEEP = 1  # Min seconds between scheduler iterations
+CLEANUP_INTERVAL = 300  # Seconds between old data cleanups (5 minutes)
+RESYNC_INTERVAL = 300  # Seconds between full due queue re-seeds from the database
+DISPATCH_BATCH_SIZE = 500  # Due URLs loaded per query
+STANDBY_POLL_INTERVAL = 5  # Seconds between leadership/membership checks while standing by
+LEASE_NAME = 'url-monitor-scheduler'  # SchedulerLease row shared by all scheduler processes
 KEEP_RECORDS_PER_URL = 100  # Keep last N status records per URL (prevents database bloat)
 
 class URLMonitorScheduler:
-    """Background scheduler that runs URL checks without Celery"""
+    """
+    Background scheduler that runs URL checks without Celery.
     
-    def __init__(self):
+    Runs in one of two modes (settings.SCHEDULER_MODE):
+    
+    - 'leader': every web worker runs one, but only the process holding the
+      scheduler lease (see leader.py) dispatches checks; the rest stand by
+      and take over within LEASE_TTL seconds if the leader dies.
+    - 'sharded': every node joins a consistent-hash ring (see sharding.py)
+      and only schedules and checks the URLs the ring assigns to it. Slices
+      rebalance automatically as nodes join or leave.
+    """
+    
+    def __init__(self, mode=None):
+        self.mode = mode or getattr(settings, 'SCHEDULER_MODE', 'leader')
+        if self.mode not in ('leader', 'sharded'):
+            raise ValueError(f"Unknown scheduler mode: {self.mode}")
+        
         self.running = False
         self.thread = None
+        self.queue = DueQueue()
+        self._wake = threading.Event()
+        self.engine = AsyncCheckEngine(result_handler=self._record_result)
+        
+        if self.mode == 'sharded':
+            self.elector = None
+            self.membership = ShardMembership(on_change=self._wake.set)
+        else:
+            self.elector = LeaderElector(LEASE_NAME, on_change=lambda is_leader: self._wake.set())
+            self.membership = None
         
     def start(self):
         """Start the background scheduler"""
@@ -29,6 +67,8 @@ class URLMonitorScheduler:
             return
             
         self.running = True
+        self.engine.start()
+        self._coordinator.start()
         self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
         self.thread.start()
         logger.info("URL Monitor Scheduler started")
@@ -36,122 +76,177 @@ class URLMonitorScheduler:
     def stop(self):
         """Stop the background scheduler"""
         self.running = False
+        self._wake.set()
         if self.thread:
             self.thread.join(timeout=5)
+        self._coordinator.stop()
+        self.engine.stop()
+        flush_status_writer()
         logger.info("URL Monitor Scheduler stopped")
         
-    def _run_scheduler(self):
-        """Main scheduler loop - checks URLs periodically"""
-        from monitor.models import MonitoredURL, URLStatus
-        from monitor.tasks import check_url_status
+    @property
+    def _coordinator(self):
+        return self.membership if self.mode == 'sharded' else self.elector
+        
+    @property
+    def is_leader(self):
+        """True if this process currently holds the scheduler lease"""
+        return self.elector is not None and self.elector.is_leader
+        
+    @property
+    def is_active(self):
+        """True if this process should be dispatching checks right now"""
+        if self.mode == 'sharded':
+            return self.membership.ready
+        return self.elector.is_leader
         
+    @property
+    def role(self):
+        """Short description of this scheduler's part in the cluster"""
+        if self.mode == 'sharded':
+            if not self.membership.ready:
+                return "joining ring"
+            return f"shard of {len(self.membership.ring)} node(s), {len(self.queue)} URLs"
+        return "leader" if self.is_leader else "standby"
+        
+    def owns(self, url_id):
+        """True if this node is responsible for checking url_id"""
+        return self.membership is None or self.membership.owns(url_id)
+        
+    def check_now(self, url):
+        """Queue an immediate check for a URL on the check engine"""
+        return self.engine.submit(url)
+        
+    def _run_scheduler(self):
+        """Main scheduler loop - pops due URLs off the queue and checks them"""
         logger.info("Scheduler loop started")
-        cleanup_counter = 0  # Counter for periodic cleanup
+        
+        now = time.monotonic()
+        last_cleanup = now
+        last_resync = None  # Forces the initial seed
+        seeded_ring_version = None
         
         while self.running:
             try:
-                # Run cleanup every 10 iterations (every 5 minutes)
-                cleanup_counter += 1
-                if cleanup_counter >= CLEANUP_INTERVAL:
+                now = time.monotonic()
+                
+                # Only the lease holder (or a ring member) schedules checks;
+                # the others stand by
+                if not self.is_active:
+                    if last_resync is not None:
+                        logger.info(f"Scheduler inactive ({self.role}), standing by")
+                        self.queue.clear()
+                        last_resync = None
+                    self._wake.wait(STANDBY_POLL_INTERVAL)
+                    self._wake.clear()
+                    continue
+                
+                # Periodically clean up old status records
+                if now - last_cleanup >= CLEANUP_INTERVAL:
                     self._cleanup_old_data()
-                    cleanup_counter = 0
+                    last_cleanup = now
                 
-                # Get all active URLs that need checking
-                now = timezone.now()
-                urls_to_check = MonitoredURL.objects.filter(is_active=True)
+                # Re-seed the queue from the database; this also picks up
+                # URLs added or edited from other processes. In sharded mode
+                # a ring change moves URLs between nodes, so re-seed then too.
+                if self.membership is not None and self.membership.ring_version != seeded_ring_version:
+                    last_resync = None
+                if last_resync is None or now - last_resync >= RESYNC_INTERVAL:
+                    # Buffered results hold the latest check times; write them first
+                    flush_status_writer()
+                    if self.membership is not None:
+                        seeded_ring_version = self.membership.ring_version
+                        count = self.queue.seed(key=self.owns)
+                    else:
+                        count = self.queue.seed()
+                    logger.info(f"Due queue seeded with {count} active URLs")
+                    last_resync = now
                 
-                for url in urls_to_check:
-                    try:
-                        # Check if URL is due for checking based on last status
-                        last_status = URLStatus.objects.filter(url=url).order_by('-timestamp').first()
-                        
-                        if last_status:
-                            time_since_check = (now - last_status.timestamp).total_seconds() / 60
-                            if time_since_check < url.frequency:
-                                continue  # Not due yet
-                        
-                        # Run check in separate thread to avoid blocking
-                        check_thread = threading.Thread(
-                            target=self._check_url,
-                            args=(url,),
-                            daemon=True
-                        )
-                        check_thread.start()
-                        
-                    except Exception as e:
-                        logger.error(f"Error scheduling check for {url.url}: {e}")
+                self._dispatch_due()
                 
-                # Sleep for 30 seconds before next iteration
-                time.sleep(SCHEDULER_CHECK_INTERVAL)
+                # Sleep until the next URL is due, capped so cleanup and resync still run
+                wait = self.queue.seconds_until_next()
+                if wait is None or wait > SCHEDULER_CHECK_INTERVAL:
+                    wait = SCHEDULER_CHECK_INTERVAL
+                self._wake.wait(max(wait, MIN_SLEEP))
+                self._wake.clear()
                 
             except Exception as e:
                 logger.error(f"Scheduler loop error: {e}")
                 time.sleep(60)  # Wait longer on error
     
-    def _check_url(self, url):
-        """Execute URL check (runs in separate thread)"""
-        from monitor.tasks import check_url_status
+    def _dispatch_due(self):
+        """Submit every URL whose due time has passed to the check engine"""
+        from monitor.models import MonitoredURL
         
-        try:
-            # Import here to avoid circular imports
-            import requests
-            from monitor.models import URLStatus, Alert
-            from django.db import connection
-            
-            # Close old database connections (important for threads)
-            connection.close()
-            
-            logger.info(f"Checking URL: {url.url}")
-            
-            # Perform the actual HTTP check
-            start_time = time.time()
-            try:
-                response = requests.get(
-                    url.url,
-                    timeout=10,
-                    allow_redirects=True,
-                    verify=True
-                )
-                response_time = (time.time() - start_time) * 1000  # Convert to ms
-                status_code = response.status_code
-                is_up = (status_code == url.expected_status)
-                
-            except requests.exceptions.Timeout:
-                response_time = 10000
-                status_code = 0
-                is_up = False
-                logger.warning(f"Timeout checking {url.url}")
-                
-            except Exception as e:
-                response_time = 0
-                status_code = 0
-                is_up = False
-                logger.error(f"Error checking {url.url}: {e}")
+        due_ids = self.queue.pop_due()
+        if not due_ids:
+            return
+        
+        for i in range(0, len(due_ids), DISPATCH_BATCH_SIZE):
+            batch = due_ids[i:i + DISPATCH_BATCH_SIZE]
+            urls = MonitoredURL.objects.filter(id__in=batch, is_active=True).in_bulk()
             
-            # Save status to database
-            URLStatus.objects.create(
+            for url_id in batch:
+                url = urls.get(url_id)
+                if url is None or not self.owns(url_id):
+                    # Deleted, deactivated or moved to another node since it was queued
+                    self.queue.remove(url_id)
+                    continue
+                try:
+                    # Hand the check to the async engine (skipped if already in flight)
+                    self.engine.submit(url)
+                except Exception as e:
+                    logger.error(f"Error scheduling check for {url.url}: {e}")
+                    self.queue.reschedule_after_check(url_id)
+        
+        logger.debug(f"Dispatched {len(due_ids)} due URL checks")
+    
+    def url_saved(self, url):
+        """Keep the due queue in sync with a saved MonitoredURL"""
+        if not self.is_active or not self.owns(url.id):
+            return
+        if url.is_active:
+            self.queue.update_frequency(url.id, url.frequency)
+            self._wake.set()  # A new URL is due immediately
+        else:
+            self.queue.remove(url.id)
+    
+    def url_deleted(self, url_id):
+        """Drop a deleted MonitoredURL from the due queue"""
+        self.queue.remove(url_id)
+    
+    def _record_result(self, url, result):
+        """Save a finished check and trigger alerts (runs on the engine's result pool)"""
+        from monitor.models import URLStatus
+        
+        status_code = result['status_code']
+        is_up = result['is_up']
+        
+        checked_at = timezone.now()
+        try:
+            # UP results are buffered for a bulk insert; DOWN results are
+            # saved immediately and returned so the alert can reference them
+            saved_status = get_status_writer().add(URLStatus(
                 url=url,
                 is_up=is_up,
                 status_code=status_code,
-                response_time=response_time,
-                timestamp=timezone.now()
-            )
-            
-            logger.info(f"Check completed: {url.url} - Status: {status_code}, Up: {is_up}")
-            if not is_up:
-                try:
-                    from monitor.tasks import send_alert
-                    send_alert(str(url.id), f"URL is down (Status: {status_code})")
-                except Exception as alert_error:
-                    logger.error(f"Failed to send alert: {alert_error}")
-            
-            logger.info(f"Check completed: {url.url} - Status: {status_code}, Up: {is_up}")
-            
-        except Exception as e:
-            logger.error(f"Fatal error in _check_url for {url.url}: {e}", exc_info=True)
+                response_time=result['response_time'],
+                error_message=result['error_message'],
+                timestamp=checked_at
+            ))
         finally:
-            # Always close connection after thread work
-            connection.close()
+            # Always move the URL to its next due time, even if the save failed
+            self.queue.reschedule_after_check(url.id, checked_at)
+        
+        if saved_status is not None:
+            try:
+                from monitor.tasks import send_alert
+                send_alert(saved_status.id)
+            except Exception as alert_error:
+                logger.error(f"Failed to send alert: {alert_error}")
+        
+        logger.info(f"Check completed: {url.url} - Status: {status_code}, Up: {is_up}")
 
 
     def _cleanup_old_data(self):
@@ -174,6 +269,9 @@ class URLMonitorScheduler:
             # For each URL, keep only the most recent records
             urls = MonitoredURL.objects.all()
             for url in urls:
+                if not self.owns(url.id):
+                    continue  # Another node's slice
+                
                 # Get IDs of records to keep (most recent ones)
                 keep_ids = URLStatus.objects.filter(url=url).order_by('-timestamp')[:KEEP_RECORDS].values_list('id', flat=True)
                 
@@ -188,6 +286,18 @@ class URLMonitorScheduler:
                 logger.info(f"Cleanup completed: Removed {total_deleted} old status records")
             else:
                 logger.debug("Cleanup completed: No old records to remove")
+            
+            # Raw rows are capped per URL; rollups keep longer history
+            pruned = prune_rollups()
+            if pruned:
+                logger.info(f"Pruned {pruned} expired rollup rows")
+            
+            # Fold new and late pageview writes into the daily scroll depth rows
+            # (the job locks its watermark, so nodes running it at once take turns)
+            if getattr(settings, 'SCROLL_HEATMAP_MATERIALIZE', True):
+                days, written = scroll_depth.materialize_incremental()
+                if days:
+                    logger.info(f"Materialized {written} scroll heatmap rows for {days} day(s)")
                 
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
@@ -198,11 +308,11 @@ class URLMonitorScheduler:
 # Global scheduler instance
 _scheduler = None
 
-def start_scheduler():
+def start_scheduler(mode=None):
     """Initialize and start the global scheduler"""
     global _scheduler
     if _scheduler is None:
-        _scheduler = URLMonitorScheduler()
+        _scheduler = URLMonitorScheduler(mode=mode)
         _scheduler.start()
     return _scheduler
 
@@ -219,3 +329,13 @@ def get_scheduler():
     if _scheduler is None:
         start_scheduler()
     return _scheduler
+
+def url_saved(url):
+    """Forward a MonitoredURL save to the running scheduler, if any"""
+    if _scheduler is not None:
+        _scheduler.url_saved(url)
+
+def url_deleted(url_id):
+    """Forward a MonitoredURL delete to the running scheduler, if any"""
+    if _scheduler is not None:
+        _scheduler.url_deleted(url_id)
@@ -0,0 +1,216 @@
+"""
+Scroll Depth Aggregation
+Buckets PageView.scroll_depth with a grouped SQL query and keeps the result
+per URL, page and UTC day in ScrollHeatmap, so the scroll depth view merges
+a few daily rows instead of loading every pageview. An incremental job
+re-materializes only the days whose pageviews were written since its last run.
+"""
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Sum, Value
+from django.db.models.functions import Cast, Floor, Greatest, Least, TruncDate
+
+BUCKET_WIDTH = 10  # Percent of the page per bucket
+BUCKET_COUNT = 10
+BUCKET_LABELS = [f"{i * BUCKET_WIDTH}-{(i + 1) * BUCKET_WIDTH}" for i in range(BUCKET_COUNT)]
+WATERMARK_NAME = 'scroll_heatmaps'  # AggregateWatermark row of the incremental job
+# Pageview writes this recent may not be committed yet; they are picked up by the next run
+MATERIALIZE_LAG = timedelta(minutes=2)
+# Days read live from the pageviews at most (today); older days always come from ScrollHeatmap
+MAX_LIVE_DAYS = 1
+
+
+def depth_bucket():
+    """SQL expression for the bucket index of scroll_depth (100% falls in the last bucket)"""
+    index = Cast(Floor(F('scroll_depth') / BUCKET_WIDTH), IntegerField())
+    return Least(Greatest(index, Value(0)), Value(BUCKET_COUNT - 1))
+
+
+def day_start(date):
+    return datetime.combine(date, dt_time.min, tzinfo=dt_timezone.utc)
+
+
+def build_rows(pageviews, model=None):
+    """
+    Unsaved ScrollHeatmap rows for a PageView queryset, from one query
+    grouped by URL, page, UTC day and depth bucket
+    """
+    if model is None:
+        from monitor.models import ScrollHeatmap as model
+
+    grouped = pageviews.filter(url__isnull=False).annotate(
+        date=TruncDate('timestamp', tzinfo=dt_timezone.utc),
+        bucket=depth_bucket(),
+    ).values('url_id', 'page_url', 'date', 'bucket').annotate(
+        views=Count('id'),
+        depth_sum=Sum('scroll_depth'),
+    ).order_by()
+
+    rows = {}
+    depth_sums = defaultdict(float)
+    for group in grouped:
+        key = (group['url_id'], group['page_url'], group['date'])
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = model(
+                url_id=key[0], page_url=key[1], date=key[2],
+                depth_distribution={label: 0 for label in BUCKET_LABELS},
+            )
+        row.depth_distribution[BUCKET_LABELS[group['bucket']]] += group['views']
+        row.total_views += group['views']
+        depth_sums[key] += group['depth_sum'] or 0
+
+    for key, row in rows.items():
+        row.average_depth = depth_sums[key] / row.total_views if row.total_views else 0
+    return list(rows.values())
+
+
+def materialize(start_date, end_date, url_ids=None):
+    """
+    Recompute the ScrollHeatmap rows of the UTC days start_date..end_date
+    (inclusive) from the pageviews. Returns the number of rows written.
+    """
+    from monitor.models import PageView, ScrollHeatmap
+
+    pageviews = PageView.objects.filter(
+        timestamp__gte=day_start(start_date),
+        timestamp__lt=day_start(end_date + timedelta(days=1)),
+    )
+    existing = ScrollHeatmap.objects.filter(date__gte=start_date, date__lte=end_date)
+    if url_ids is not None:
+        pageviews = pageviews.filter(url_id__in=url_ids)
+        existing = existing.filter(url_id__in=url_ids)
+
+    rows = build_rows(pageviews)
+    with transaction.atomic():
+        existing.delete()
+        ScrollHeatmap.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def dirty_days(since, until):
+    """
+    {UTC day: set of URL ids} of the pageviews written or updated in
+    (since, until]; since=None covers every pageview
+    """
+    from monitor.models import PageView
+
+    pageviews = PageView.objects.filter(url__isnull=False, updated_at__lte=until)
+    if since is not None:
+        pageviews = pageviews.filter(updated_at__gt=since)
+    days = defaultdict(set)
+    pairs = pageviews.annotate(
+        date=TruncDate('timestamp', tzinfo=dt_timezone.utc),
+    ).values_list('date', 'url_id').distinct().order_by()
+    for date, url_id in pairs:
+        days[date].add(url_id)
+    return days
+
+
+def materialize_incremental(now=None, full=False):
+    """
+    Re-materialize the (day, URL) pairs whose pageviews changed since the
+    last run, including late page_leave updates to earlier days, and move
+    the watermark forward. The watermark row stays locked for the run, so
+    concurrent schedulers take turns. Returns (days, rows written).
+    """
+    from django.utils import timezone
+    from monitor.models import AggregateWatermark
+
+    until = (now or timezone.now()) - MATERIALIZE_LAG
+    with transaction.atomic():
+        AggregateWatermark.objects.bulk_create([AggregateWatermark(name=WATERMARK_NAME)], ignore_conflicts=True)
+        watermark = AggregateWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+        since = None if full else watermark.processed_through
+        if since is not None and since >= until:
+            return 0, 0
+
+        days = dirty_days(since, until)
+        written = 0
+        for date in sorted(days):
+            written += materialize(date, date, days[date])
+
+        watermark.processed_through = until
+        watermark.save(update_fields=['processed_through'])
+    return len(days), written
+
+
+def live_from(now=None):
+    """
+    First UTC day whose scroll data is read from the pageviews rather than
+    ScrollHeatmap: the watermark's day (today if the job never ran)
+    """
+    from django.utils import timezone
+    from monitor.models import AggregateWatermark
+
+    processed_through = AggregateWatermark.objects.filter(
+        name=WATERMARK_NAME,
+    ).values_list('processed_through', flat=True).first()
+    return (processed_through or now or timezone.now()).astimezone(dt_timezone.utc).date()
+
+
+def rows_for_range(urls, since, now=None):
+    """
+    ScrollHeatmap rows covering since..now: materialized rows up to the
+    incremental job's watermark, plus rows computed live after it. The live
+    part spans at most MAX_LIVE_DAYS, so a stalled job serves slightly stale
+    materialized rows rather than scanning every pageview since it stopped.
+    """
+    from django.utils import timezone
+    from monitor.models import PageView, ScrollHeatmap
+
+    now = now or timezone.now()
+    first_day = since.astimezone(dt_timezone.utc).date()
+    live_day = max(live_from(now), now.astimezone(dt_timezone.utc).date() - timedelta(days=MAX_LIVE_DAYS - 1))
+
+    rows = list(ScrollHeatmap.objects.filter(url__in=urls, date__gte=first_day, date__lt=live_day))
+    rows += build_rows(PageView.objects.filter(
+        url__in=urls, timestamp__gte=max(day_start(live_day), since), timestamp__lte=now,
+    ))
+    return rows
+
+
+def merge_distribution(rows):
+    """{bucket label: views} summed over rows"""
+    distribution = {label: 0 for label in BUCKET_LABELS}
+    for row in rows:
+        for label, views in (row.depth_distribution or {}).items():
+            if label in distribution:
+                distribution[label] += views
+    return distribution
+
+
+def daily_series(rows):
+    """[{'date', 'avg_scroll', 'total_views'}] per day, oldest first"""
+    days = defaultdict(lambda: [0, 0.0])
+    for row in rows:
+        day = days[row.date]
+        day[0] += row.total_views
+        day[1] += row.average_depth * row.total_views
+    return [
+        {'date': date, 'avg_scroll': depth_sum / views if views else 0, 'total_views': views}
+        for date, (views, depth_sum) in sorted(days.items())
+    ]
+
+
+def page_summary(rows, limit=15):
+    """Per-page views, average depth and views reaching the last bucket, busiest first"""
+    pages = defaultdict(lambda: [0, 0.0, 0])
+    last_label = BUCKET_LABELS[-1]
+    for row in rows:
+        page = pages[row.page_url]
+        page[0] += row.total_views
+        page[1] += row.average_depth * row.total_views
+        page[2] += (row.depth_distribution or {}).get(last_label, 0)
+    summary = [
+        {
+            'page_url': page_url,
+            'views': views,
+            'avg_scroll': depth_sum / views if views else 0,
+            'scrolled_to_bottom': bottom,
+        }
+        for page_url, (views, depth_sum, bottom) in pages.items()
+    ]
+    summary.sort(key=lambda page: -page['views'])
+    return summary[:limit]
@@ -0,0 +1,83 @@
+"""
+Session Event Chunks
+Stores session recording timelines as zlib-compressed JSON chunks in
+SessionEventChunk, appended as the sessionizer writes each part of a
+session, and streams them back in timestamp order for replay
+"""
+import heapq
+import itertools
+import json
+import zlib
+from datetime import datetime, timezone as dt_timezone
+
+CHUNK_EVENTS = 500  # Timeline entries per chunk
+COMPRESSION_LEVEL = 6
+STREAM_CHUNK_SIZE = 20  # Chunk rows fetched per round trip when replaying
+
+
+def iso_timestamp(timestamp):
+    """Timeline timestamp (fixed width, so entries sort as strings)"""
+    return timestamp.astimezone(dt_timezone.utc).isoformat(timespec='milliseconds')
+
+
+def entry_time(entry):
+    return datetime.fromisoformat(entry['timestamp'])
+
+
+def encode_chunk(entries):
+    """Compressed JSON list of timeline entries"""
+    return zlib.compress(json.dumps(entries, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def decode_chunk(data):
+    if not data:
+        return []
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def build_chunks(recording_id, entries, first_sequence, model=None):
+    """
+    Unsaved chunk rows for entries (sorted by timestamp), numbered from
+    first_sequence
+    """
+    if model is None:
+        from monitor.models import SessionEventChunk as model
+
+    chunks = []
+    for i in range(0, len(entries), CHUNK_EVENTS):
+        part = entries[i:i + CHUNK_EVENTS]
+        chunks.append(model(
+            recording_id=recording_id,
+            sequence=first_sequence + len(chunks),
+            first_timestamp=entry_time(part[0]),
+            last_timestamp=entry_time(part[-1]),
+            event_count=len(part),
+            data=encode_chunk(part),
+        ))
+    return chunks
+
+
+def iter_events(recording_id):
+    """
+    Timeline entries of a recording in timestamp order, decoding one chunk
+    at a time. Chunks are read by first timestamp; entries of earlier
+    chunks are only held back while a later chunk can still overlap them
+    (parts of a session written by different processes), so memory stays
+    at about one chunk.
+    """
+    from monitor.models import SessionEventChunk
+
+    chunks = SessionEventChunk.objects.filter(recording_id=recording_id).order_by(
+        'first_timestamp', 'sequence',
+    ).values_list('first_timestamp', 'data')
+
+    pending = []  # Heap of (timestamp, arrival order, entry)
+    order = itertools.count()
+    for first_timestamp, data in chunks.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        first = iso_timestamp(first_timestamp)
+        while pending and pending[0][0] <= first:
+            yield heapq.heappop(pending)[2]
+        for entry in decode_chunk(data):
+            heapq.heappush(pending, (entry['timestamp'], next(order), entry))
+    while pending:
+        yield heapq.heappop(pending)[2]
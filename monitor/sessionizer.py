@@ -0,0 +1,449 @@
+"""
+Session Reconstruction
+Follows ingested tracker events per session in memory and, once a session
+has been inactive for SESSION_TIMEOUT, writes its SessionRecording summary,
+UserFlow path and compressed timeline chunks with one batched upsert, so
+per-session analytics are a single-row read instead of scans of PageView,
+ClickHeatmap and MouseMovement
+"""
+import atexit
+import heapq
+import threading
+import time
+import logging
+from collections import OrderedDict
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Max
+from .session_events import CHUNK_EVENTS, build_chunks, iso_timestamp, iter_events
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SESSION_TIMEOUT = 1800  # Seconds without events after which a session is written
+SWEEP_INTERVAL = 30  # Seconds between checks for inactive sessions
+MAX_OPEN_SESSIONS = 20000  # Beyond this the least recently active sessions are written early
+WRITE_BATCH_SIZE = 500  # Sessions upserted per transaction
+
+# Tracker event types recorded on the timeline, with the fields they keep
+TIMELINE_FIELDS = {
+    'pageview': ('page_title', 'referrer'),
+    'click': ('x_position', 'y_position', 'element_tag', 'element_id', 'element_text'),
+    'scroll': ('scroll_depth',),
+    'page_leave': ('scroll_depth', 'time_on_page'),
+    'rage_click': ('x_position', 'y_position', 'click_count'),
+    'dead_click': ('x_position', 'y_position'),
+    'error_click': ('x_position', 'y_position', 'element_selector'),
+    'hover': ('x_position', 'y_position', 'element_selector'),
+}
+
+
+def timeline_entry(event_type, event, timestamp):
+    """Timeline entry for a tracker event, or None for types not recorded"""
+    fields = TIMELINE_FIELDS.get(event_type)
+    if fields is None:
+        return None
+    entry = {'type': event_type, 'timestamp': iso_timestamp(timestamp), 'page_url': str(event.get('page_url') or '')[:500]}
+    for field in fields:
+        value = event.get(field)
+        if value not in (None, ''):
+            entry[field] = value if isinstance(value, (int, float)) else str(value)[:200]
+    return entry
+
+
+class _OpenSession:
+    """Summary and timeline of one session collected since it was last written"""
+
+    __slots__ = ('url_id', 'session_id', 'visitor_id', 'device_type', 'browser', 'start', 'end',
+                 'events', 'pages', 'clicks', 'scrolls', 'had_errors', 'had_rage_clicks', 'last_seen')
+
+    def __init__(self, url_id, session_id):
+        self.url_id = url_id
+        self.session_id = session_id
+        self.visitor_id = ''
+        self.device_type = ''
+        self.browser = ''
+        self.start = None
+        self.end = None
+        self.events = []
+        self.pages = 0
+        self.clicks = 0
+        self.scrolls = 0
+        self.had_errors = False
+        self.had_rage_clicks = False
+        self.last_seen = 0.0
+
+    def add(self, entry, timestamp, scrolls=None):
+        event_type = entry['type']
+        if event_type == 'pageview':
+            self.pages += 1
+        elif event_type == 'click':
+            self.clicks += 1
+        elif event_type == 'scroll':
+            self.scrolls += 1
+        elif event_type == 'rage_click':
+            self.had_rage_clicks = True
+        elif event_type == 'error_click':
+            self.had_errors = True
+        if scrolls:
+            self.scrolls += scrolls
+
+        if self.start is None or timestamp < self.start:
+            self.start = timestamp
+        if self.end is None or timestamp > self.end:
+            self.end = timestamp
+        self.events.append(entry)
+
+    def absorb(self, other):
+        """Fold another part of the same session collected in this process"""
+        self.events.extend(other.events)
+        self.pages += other.pages
+        self.clicks += other.clicks
+        self.scrolls += other.scrolls
+        self.had_errors = self.had_errors or other.had_errors
+        self.had_rage_clicks = self.had_rage_clicks or other.had_rage_clicks
+        self.start = other.start if self.start is None else min(self.start, other.start)
+        self.end = other.end if self.end is None else max(self.end, other.end)
+        self.visitor_id = self.visitor_id or other.visitor_id
+        self.device_type = self.device_type or other.device_type
+        self.browser = self.browser or other.browser
+
+
+def _flow_path(flow, recording, entries):
+    """Page path of a session after new timeline entries were appended"""
+    pages = [entry['page_url'] for entry in entries if entry['type'] == 'pageview']
+    if flow is None or not pages:
+        return (flow.path_sequence if flow is not None else []) + pages
+    first_new = next(entry['timestamp'] for entry in entries if entry['type'] == 'pageview')
+    if iso_timestamp(flow.timestamp_end) <= first_new:
+        return flow.path_sequence + pages
+    # Interleaves with an earlier part of the session; re-read the whole timeline
+    return [entry['page_url'] for entry in iter_events(recording.pk) if entry['type'] == 'pageview']
+
+
+def _merged(parts):
+    """One _OpenSession combining the collected parts of a session, leaving the parts untouched"""
+    session = _OpenSession(parts[0].url_id, parts[0].session_id)
+    for part in parts:
+        session.absorb(part)
+    return session
+
+
+def _drop_deleted_urls(parts):
+    """parts without the sessions of URLs deleted since they were collected"""
+    from monitor.models import MonitoredURL
+
+    url_ids = {session_parts[0].url_id for session_parts in parts.values()} - {None}
+    existing = {str(pk) for pk in MonitoredURL.objects.filter(id__in=url_ids).values_list('id', flat=True)}
+    kept = {
+        session_id: session_parts for session_id, session_parts in parts.items()
+        if session_parts[0].url_id is None or str(session_parts[0].url_id) in existing
+    }
+    if len(kept) < len(parts):
+        logger.warning(f"Discarded {len(parts) - len(kept)} collected sessions of deleted URLs")
+    return kept
+
+
+def _write_batch(batch):
+    """Upsert one batch of merged sessions ({session_id: session}) in a transaction"""
+    from monitor.models import SessionRecording, SessionEventChunk, UserFlow
+
+    with transaction.atomic():
+        SessionRecording.objects.bulk_create(
+            [
+                SessionRecording(url_id=session.url_id, session_id=session.session_id,
+                                 visitor_id=session.visitor_id, start_time=session.start)
+                for session in batch.values()
+            ],
+            ignore_conflicts=True,
+        )
+        recordings = list(SessionRecording.objects.select_for_update().filter(session_id__in=batch))
+        next_sequence = dict(
+            SessionEventChunk.objects.filter(recording__in=recordings).values('recording_id').annotate(
+                last=Max('sequence'),
+            ).order_by().values_list('recording_id', 'last')
+        )
+        flows = {}
+        for flow in UserFlow.objects.filter(session_id__in=batch).order_by('id'):
+            flows.setdefault(flow.session_id, flow)
+
+        chunks = []
+        for recording in recordings:
+            session = batch[recording.session_id]
+            session.events.sort(key=lambda entry: entry['timestamp'])
+            last = next_sequence.get(recording.pk)
+            chunks += build_chunks(recording.pk, session.events, 0 if last is None else last + 1)
+        SessionEventChunk.objects.bulk_create(chunks)
+
+        new_flows, changed_flows = [], []
+        for recording in recordings:
+            session = batch[recording.session_id]
+            flow = flows.get(recording.session_id)
+            path = _flow_path(flow, recording, session.events)
+
+            recording.start_time = min(recording.start_time, session.start)
+            recording.end_time = max(recording.end_time or session.end, session.end)
+            recording.duration = (recording.end_time - recording.start_time).total_seconds()
+            recording.pages_visited += session.pages
+            recording.total_clicks += session.clicks
+            recording.total_scrolls += session.scrolls
+            recording.had_errors = recording.had_errors or session.had_errors
+            recording.had_rage_clicks = recording.had_rage_clicks or session.had_rage_clicks
+            recording.visitor_id = recording.visitor_id or session.visitor_id
+            recording.url_id = recording.url_id or session.url_id
+            if session.device_type:
+                recording.device_type = session.device_type
+            recording.browser = recording.browser or session.browser
+
+            if not path or recording.url_id is None:
+                continue
+            if flow is None:
+                flow = UserFlow(url_id=recording.url_id, session_id=recording.session_id)
+                new_flows.append(flow)
+            else:
+                changed_flows.append(flow)
+            flow.path_sequence = path
+            flow.timestamp_start = recording.start_time
+            flow.timestamp_end = recording.end_time
+            flow.exit_page = path[-1][:200]
+
+        SessionRecording.objects.bulk_update(recordings, [
+            'url', 'visitor_id', 'start_time', 'end_time', 'duration', 'pages_visited',
+            'total_clicks', 'total_scrolls', 'had_errors', 'had_rage_clicks', 'device_type', 'browser',
+        ])
+        UserFlow.objects.bulk_update(
+            changed_flows, ['path_sequence', 'timestamp_start', 'timestamp_end', 'exit_page'],
+        )
+        UserFlow.objects.bulk_create(new_flows)
+    return len(recordings)
+
+
+def _write_individually(batch, parts, failed):
+    """
+    Write a batch that failed an integrity check one session per
+    transaction; sessions that still fail it are dropped, ones hitting other
+    errors are handed to failed (or raised if failed is None)
+    """
+    written = 0
+    for session_id, session in batch.items():
+        try:
+            written += _write_batch({session_id: session})
+        except IntegrityError as e:
+            logger.error(f"Dropped session {session_id} that cannot be written: {e}")
+        except Exception:
+            if failed is None:
+                raise
+            failed.extend(parts[session_id])
+    return written
+
+
+def write_sessions(sessions, failed=None):
+    """
+    Merge collected sessions into their SessionRecording and UserFlow rows
+    and append their timeline entries as new SessionEventChunk rows. Missing
+    recordings are created empty and then locked, so parts of one session
+    collected by different processes add up instead of overwriting each
+    other. Each batch commits on its own; when one fails, the parts of it
+    and of the batches not yet written are appended to failed unchanged
+    (the error is raised if failed is None), so retrying them never repeats
+    a committed batch. Returns the number of sessions written.
+    """
+    parts = {}
+    for session in sessions:
+        parts.setdefault(session.session_id, []).append(session)
+    parts = _drop_deleted_urls(parts)
+    session_ids = list(parts)
+
+    written = 0
+    for i in range(0, len(session_ids), WRITE_BATCH_SIZE):
+        batch = {session_id: _merged(parts[session_id]) for session_id in session_ids[i:i + WRITE_BATCH_SIZE]}
+        try:
+            written += _write_batch(batch)
+        except IntegrityError as e:
+            # Usually a URL deleted mid-write; keep one bad session from blocking the rest
+            logger.warning(f"Writing {len(batch)} sessions failed ({e}), retrying individually")
+            written += _write_individually(batch, parts, failed)
+        except Exception as e:
+            if failed is None:
+                raise
+            logger.error(f"Failed to write {len(session_ids) - i} sessions: {e}")
+            failed.extend(part for session_id in session_ids[i:] for part in parts[session_id])
+            break
+    return written
+
+
+class Sessionizer:
+    """
+    In-memory session tracker fed by the ingest path.
+
+    Open sessions are kept in least-recently-active order; a background
+    thread writes the ones idle for SESSION_TIMEOUT every SWEEP_INTERVAL
+    seconds, and the least recently active ones early when more than
+    MAX_OPEN_SESSIONS are open. A session that has collected a full chunk
+    of timeline entries is written on the next sweep, so long recordings
+    are appended while they are still running. Everything still open is
+    written on shutdown. A session that continues after being written (or
+    that other processes also saw) is merged into the same rows.
+    """
+
+    def __init__(self, timeout=SESSION_TIMEOUT, sweep_interval=SWEEP_INTERVAL, max_open=MAX_OPEN_SESSIONS):
+        self.timeout = timeout
+        self.sweep_interval = sweep_interval
+        self.max_open = max_open
+        self.running = False
+        self.thread = None
+        self._open = OrderedDict()  # session_id -> _OpenSession, least recently active first
+        self._ready = []  # Parts of sessions due to be written on the next sweep
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def start(self):
+        """Start the sweep thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name='sessionizer')
+        self.thread.start()
+
+    def stop(self):
+        """Stop the sweep thread and write every open session"""
+        self.running = False
+        self._wake.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.sweep(force=True)
+
+    def __len__(self):
+        return len(self._open) + len(self._ready)
+
+    def add(self, url_id, session_id, entry, timestamp, visitor_id='', device_type='', browser='', scrolls=None):
+        """Record one timeline entry of a session"""
+        with self._lock:
+            session = self._open.get(session_id)
+            if session is None:
+                session = self._open[session_id] = _OpenSession(url_id, session_id)
+            else:
+                self._open.move_to_end(session_id)
+            session.add(entry, timestamp, scrolls)
+            session.visitor_id = session.visitor_id or visitor_id
+            session.device_type = session.device_type or device_type
+            session.browser = session.browser or browser
+            session.last_seen = time.monotonic()
+            if len(session.events) >= CHUNK_EVENTS:
+                # Later events of the session start a new part
+                self._ready.append(self._open.pop(session_id))
+            full = len(self._open) > self.max_open or len(self._ready) >= WRITE_BATCH_SIZE
+        if full:
+            self._wake.set()
+
+    def sweep(self, force=False):
+        """
+        Write the sessions that have been inactive for the timeout or have
+        collected a full chunk (every open session with force). Returns the
+        number written.
+        """
+        with self._sweep_lock:
+            cutoff = time.monotonic() - self.timeout
+            with self._lock:
+                closed, self._ready = self._ready, []
+                while self._open:
+                    session = next(iter(self._open.values()))
+                    if not (force or session.last_seen <= cutoff or len(self._open) > self.max_open):
+                        break
+                    closed.append(self._open.popitem(last=False)[1])
+            if not closed:
+                return 0
+            failed = []
+            try:
+                written = write_sessions(closed, failed)
+            except Exception as e:
+                logger.error(f"Failed to write {len(closed)} sessions: {e}")
+                written, failed = 0, closed
+            if failed:
+                with self._lock:
+                    # Retried on the next sweep; the newest parts are kept while the database is unavailable
+                    self._ready = (failed + self._ready)[-self.max_open:]
+            logger.debug(f"Wrote {written} finished sessions")
+            return written
+
+    def _run(self):
+        while self.running:
+            self._wake.wait(self.sweep_interval)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.sweep()
+            finally:
+                close_old_connections()
+
+
+def _stored_events(queryset, event_type, chunk_size):
+    for row in queryset.order_by('session_id', 'timestamp').iterator(chunk_size=chunk_size):
+        yield row.session_id, row.timestamp, event_type or row.movement_type, row
+
+
+def rebuild_sessions(url_ids=None, chunk_size=5000):
+    """
+    Reconstruct SessionRecording and UserFlow rows from the stored
+    PageView, ClickHeatmap and MouseMovement rows, replacing those of the
+    affected URLs. The three tables are streamed in session order and
+    merged, so memory holds one write batch. Returns sessions written.
+    """
+    from monitor.models import PageView, ClickHeatmap, MouseMovement, SessionRecording, UserFlow
+
+    sources = []
+    for model, event_type in ((PageView, 'pageview'), (ClickHeatmap, 'click'), (MouseMovement, None)):
+        rows = model.objects.filter(url__isnull=False)
+        if url_ids is not None:
+            rows = rows.filter(url_id__in=url_ids)
+        sources.append(_stored_events(rows, event_type, chunk_size))
+
+    sessionizer = Sessionizer()
+    written = 0
+    with transaction.atomic():
+        recordings = SessionRecording.objects.all()
+        flows = UserFlow.objects.all()
+        if url_ids is not None:
+            recordings = recordings.filter(url_id__in=url_ids)
+            flows = flows.filter(url_id__in=url_ids)
+        recordings.delete()
+        flows.delete()
+
+        current = None
+        for session_id, timestamp, event_type, row in heapq.merge(*sources, key=lambda item: item[:2]):
+            if session_id != current and len(sessionizer) >= WRITE_BATCH_SIZE:
+                # Rows arrive in session order, so the collected sessions are complete
+                written += sessionizer.sweep(force=True)
+            current = session_id
+            event = row.__dict__
+            sessionizer.add(
+                row.url_id, session_id, timeline_entry(event_type, event, timestamp), timestamp,
+                visitor_id=getattr(row, 'visitor_id', ''),
+                device_type=getattr(row, 'device_type', ''),
+                browser=getattr(row, 'browser', ''),
+                scrolls=len(row.scroll_events or []) if event_type == 'pageview' else None,
+            )
+        written += sessionizer.sweep(force=True)
+    return written
+
+
+# Global sessionizer instance (one per process)
+_sessionizer = None
+_sessionizer_lock = threading.Lock()
+
+def get_sessionizer():
+    """Get the process-wide Sessionizer, starting it on first use"""
+    global _sessionizer
+    if _sessionizer is None:
+        with _sessionizer_lock:
+            if _sessionizer is None:
+                _sessionizer = Sessionizer()
+                _sessionizer.start()
+                atexit.register(_sessionizer.stop)
+    return _sessionizer
+
+def flush_sessionizer():
+    """Write every open session (no-op if the sessionizer was never used)"""
+    if _sessionizer is not None:
+        return _sessionizer.sweep(force=True)
+    return 0
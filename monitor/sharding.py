@@ -0,0 +1,153 @@
+"""
+Sharded Checker Membership
+Splits MonitoredURLs across checker nodes with a consistent-hash ring
+"""
+import bisect
+import hashlib
+import socket
+import threading
+import logging
+from datetime import timedelta
+from django.db import close_old_connections
+from django.db.models.functions import Now
+from .leader import make_node_id
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+VIRTUAL_NODES = 64  # Points per node on the ring (smooths out slice sizes)
+HEARTBEAT_INTERVAL = 5  # Seconds between membership heartbeats
+NODE_TTL = 15  # Seconds without a heartbeat before a node is dropped from the ring
+PRUNE_AFTER = 3600  # Seconds before a dead node's row is deleted
+
+
+def _hash(value):
+    """Stable 64-bit hash (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent-hash ring over node ids.
+
+    Each node is placed at VIRTUAL_NODES points; a key belongs to the first
+    node clockwise from its hash. When a node joins or leaves only the keys
+    adjacent to its points move, so the other nodes keep most of their slice.
+    """
+
+    def __init__(self, nodes, vnodes=VIRTUAL_NODES):
+        self.nodes = frozenset(nodes)
+        points = sorted(
+            (_hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def node_for(self, key):
+        """Node id that owns key, or None if the ring is empty"""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardMembership:
+    """
+    Registers this process in the CheckerNode table, heartbeats it, and
+    rebuilds the hash ring from the live nodes after every heartbeat.
+
+    ring_version increases whenever the set of live nodes changes, which is
+    the scheduler's cue to re-seed its slice. ready is False until this node
+    has seen itself in the ring and whenever its own heartbeat is failing,
+    so a node that has dropped out of the ring stops checking.
+    """
+
+    def __init__(self, node_id=None, on_change=None):
+        self.node_id = node_id or make_node_id()
+        self.on_change = on_change
+        self.running = False
+        self.thread = None
+        self.ring = HashRing([])
+        self.ring_version = 0
+        self.ready = False
+        self._stop = threading.Event()
+
+    def owns(self, url_id):
+        return self.ready and self.ring.node_for(url_id) == self.node_id
+
+    def start(self):
+        """Join the ring and start heartbeating"""
+        if self.running:
+            return
+        self.running = True
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"Checker node {self.node_id} joining the ring")
+
+    def stop(self):
+        """Leave the ring so the remaining nodes take over this slice"""
+        from monitor.models import CheckerNode
+
+        self.running = False
+        self._stop.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.ready = False
+        try:
+            CheckerNode.objects.filter(node_id=self.node_id).delete()
+            logger.info(f"Checker node {self.node_id} left the ring")
+        except Exception as e:
+            logger.warning(f"Failed to deregister checker node {self.node_id}: {e}")
+        finally:
+            close_old_connections()
+
+    def heartbeat(self):
+        """Record this node as alive and rebuild the ring from live nodes"""
+        from monitor.models import CheckerNode
+
+        updated = CheckerNode.objects.filter(node_id=self.node_id).update(heartbeat_at=Now())
+        if not updated:
+            CheckerNode.objects.create(
+                node_id=self.node_id, hostname=socket.gethostname(), heartbeat_at=Now()
+            )
+
+        live = CheckerNode.objects.filter(
+            heartbeat_at__gt=Now() - timedelta(seconds=NODE_TTL)
+        ).values_list('node_id', flat=True)
+        self._set_ring(set(live))
+
+        CheckerNode.objects.filter(
+            heartbeat_at__lt=Now() - timedelta(seconds=PRUNE_AFTER)
+        ).delete()
+
+    def _set_ring(self, nodes):
+        ready = self.node_id in nodes
+        changed = nodes != self.ring.nodes or ready != self.ready
+        if nodes != self.ring.nodes:
+            self.ring = HashRing(nodes)
+            self.ring_version += 1
+            logger.info(f"Hash ring now has {len(nodes)} node(s): {', '.join(sorted(nodes))}")
+        self.ready = ready
+        if changed and self.on_change:
+            self.on_change()
+
+    def _run(self):
+        while self.running:
+            close_old_connections()
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"Checker node heartbeat failed: {e}")
+                if self.ready:
+                    self.ready = False
+                    if self.on_change:
+                        self.on_change()
+            finally:
+                close_old_connections()
+            self._stop.wait(HEARTBEAT_INTERVAL)
@@ -0,0 +1,18 @@
+"""
+Model signal handlers
+Keep in-process scheduler state in sync with MonitoredURL changes
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import MonitoredURL
+from . import scheduler
+
+
+@receiver(post_save, sender=MonitoredURL)
+def monitored_url_saved(sender, instance, **kwargs):
+    scheduler.url_saved(instance)
+
+
+@receiver(post_delete, sender=MonitoredURL)
+def monitored_url_deleted(sender, instance, **kwargs):
+    scheduler.url_deleted(instance.id)
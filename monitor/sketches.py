@@ -0,0 +1,177 @@
+"""
+Probabilistic Sketches
+Small, mergeable summaries of analytics streams that are stored per
+URL and day and combined at query time
+"""
+import hashlib
+import math
+import zlib
+from collections import Counter
+
+HLL_PRECISION = 12  # 2**12 registers: ~1.6% standard error, at most 4 KB per sketch
+DDSKETCH_ACCURACY = 0.01  # Quantiles are within 1% of the true value
+DDSKETCH_MAX_BINS = 2048  # Lowest bins are collapsed beyond this (only extreme ranges hit it)
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-value counter (Flajolet et al., with the linear
+    counting correction for small cardinalities).
+
+    Sketches of the same precision merge losslessly by taking the maximum
+    of each register, so a count over any set of days is the estimate of
+    their merged sketches. The standard error is 1.04 / sqrt(2**precision).
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError("register count does not match precision")
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(self.size)
+
+    def add(self, value):
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rank = remaining_bits - (h & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """Fold other into this sketch (in place)"""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values added"""
+        histogram = Counter(self.registers)
+        zeros = histogram.get(0, 0)
+        if zeros == self.size:
+            return 0
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(n * 2.0 ** -rank for rank, n in histogram.items())
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # Linear counting
+        return round(estimate)
+
+    def to_bytes(self):
+        """Compact serialized form (sparse sketches compress to a few bytes)"""
+        return zlib.compress(bytes([self.precision]) + bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        raw = zlib.decompress(bytes(data))
+        return cls(precision=raw[0], registers=raw[1:])
+
+
+class DDSketch:
+    """
+    DDSketch quantile sketch (Masson et al., 2019).
+
+    Positive values fall into logarithmic bins of ratio gamma, so any
+    quantile is answered within relative_accuracy of the true value;
+    values <= 0 are counted separately. Sketches with the same accuracy
+    merge exactly by adding bin counts.
+    """
+
+    def __init__(self, relative_accuracy=DDSKETCH_ACCURACY, max_bins=DDSKETCH_MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins = {}  # bin index -> count
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value, weight=1):
+        if value is None:
+            return
+        value = float(value)
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + weight
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += weight
+        self.sum += value * weight
+
+    def merge(self, other):
+        """Fold other into this sketch (in place)"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("cannot merge sketches of different accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        return self
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1), or None if empty"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def _collapse(self):
+        indexes = sorted(self.bins)
+        excess = len(indexes) - self.max_bins
+        merged = sum(self.bins.pop(index) for index in indexes[:excess + 1])
+        self.bins[indexes[excess]] = merged
+
+    def to_dict(self):
+        """JSON-serializable form"""
+        return {
+            'a': self.relative_accuracy,
+            'z': self.zero_count,
+            'n': self.count,
+            's': self.sum,
+            'b': [[index, count] for index, count in self.bins.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(relative_accuracy=(data or {}).get('a', DDSKETCH_ACCURACY))
+        if data:
+            sketch.bins = {int(index): count for index, count in data.get('b', [])}
+            sketch.zero_count = data.get('z', 0)
+            sketch.count = data.get('n', 0)
+            sketch.sum = data.get('s', 0.0)
+        return sketch
@@ -0,0 +1,64 @@
+"""
+Monitor Current State
+Folds check results into the per-URL MonitorState row
+"""
+from itertools import groupby
+
+STATE_FIELDS = [
+    'last_checked_at', 'last_status_code', 'last_response_time', 'last_error',
+    'is_up', 'state_since', 'consecutive_failures',
+]
+
+
+def fold_status(state, url_status):
+    """Apply one URLStatus to a MonitorState in memory"""
+    if state.is_up is None or state.is_up != url_status.is_up:
+        state.state_since = url_status.timestamp
+    state.is_up = url_status.is_up
+    state.consecutive_failures = 0 if url_status.is_up else state.consecutive_failures + 1
+    state.last_checked_at = url_status.timestamp
+    state.last_status_code = url_status.status_code
+    state.last_response_time = url_status.response_time
+    state.last_error = url_status.error_message
+
+
+def apply_check_results(statuses):
+    """
+    Update MonitorState for a batch of URLStatus rows with one insert of
+    missing rows, one locking SELECT and one bulk update. Results older than
+    a URL's last recorded check are ignored, so batches may arrive out of
+    order. Call inside the transaction that saves the statuses.
+    """
+    from monitor.models import MonitorState
+
+    if not statuses:
+        return
+
+    key = lambda s: (str(s.url_id), s.timestamp)
+    ordered = sorted(statuses, key=key)
+
+    # Create missing rows from each URL's oldest result first, so concurrent
+    # writers lock and fold into the same row instead of overwriting it
+    seeds = {}
+    for url_status in ordered:
+        if url_status.url_id not in seeds:
+            seeds[url_status.url_id] = MonitorState(url_id=url_status.url_id, is_up=None, consecutive_failures=0)
+            fold_status(seeds[url_status.url_id], url_status)
+    MonitorState.objects.bulk_create(seeds.values(), ignore_conflicts=True)
+    existing = MonitorState.objects.select_for_update().in_bulk(list(seeds))
+
+    changed = []
+    for url_id, url_statuses in groupby(ordered, key=lambda s: s.url_id):
+        state = existing.get(url_id)
+        if state is None:
+            continue
+        applied = False
+        for url_status in url_statuses:
+            if url_status.timestamp <= state.last_checked_at:
+                continue
+            fold_status(state, url_status)
+            applied = True
+        if applied:
+            changed.append(state)
+
+    MonitorState.objects.bulk_update(changed, STATE_FIELDS)
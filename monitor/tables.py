@@ -17,7 +17,7 @@ class URLTable(tables.Table):
         }
     
     def render_status(self, value, record):
-        latest = record.statuses.first()
+        latest = record.current_state
         if latest:
             if latest.is_up:
                 return format_html('<span class="badge bg-success">UP</span>')
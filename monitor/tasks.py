@@ -1,15 +1,23 @@
 from celery import shared_task
+from celery.signals import worker_process_shutdown
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
 import requests
 import time
 from .models import MonitoredURL, URLStatus, Alert, Notification
+from .due_queue import due_urls_queryset, next_due_time
+from .result_writer import get_status_writer, flush_status_writer
 import json
 import logging
 from uuid import UUID
 logger = logging.getLogger(__name__)
 
+@worker_process_shutdown.connect
+def flush_results_on_shutdown(**kwargs):
+    """Write buffered check results before a worker process exits"""
+    flush_status_writer()
+
 @shared_task
 def check_url_status(url_id):
     """
@@ -55,19 +63,19 @@ def check_url_status(url_id):
         error_message = str(e)
         logger.error(f"[CELERY WORKER] {url.name} - Error: {error_message}")
     
-    # Save the status
-    url_status = URLStatus.objects.create(
+    # Save the status (UP results are buffered for a bulk insert,
+    # DOWN results are saved immediately so the alert can reference them)
+    url_status = get_status_writer().add(URLStatus(
         url=url,
         status_code=status_code,
         response_time=response_time,
         is_up=is_up,
         error_message=error_message
-    )
-    
-    logger.info(f"[CELERY WORKER] URLStatus saved: ID={url_status.id}")
+    ))
     
     # Check if we need to send alerts
-    if not is_up:
+    if url_status is not None:
+        logger.info(f"[CELERY WORKER] URLStatus saved: ID={url_status.id}")
         logger.info(f"[CELERY WORKER] URL is DOWN, triggering alert")
         send_alert.delay(url_status.id)
     
@@ -154,18 +162,17 @@ def schedule_checks():
     """
     logger.info("[CELERY BEAT] Running schedule_checks task")
     
-    urls = MonitoredURL.objects.filter(is_active=True)
+    # One aggregate query annotates every URL with its latest check time
+    now = timezone.now()
+    urls = due_urls_queryset()
     checked_count = 0
     
     for url in urls:
         # Check if enough time has passed since last check
-        last_status = URLStatus.objects.filter(url=url).order_by('-timestamp').first()
-        
-        if last_status:
-            time_since_check = (timezone.now() - last_status.timestamp).total_seconds() / 60
-            if time_since_check < url.frequency:
-                logger.debug(f"[SKIP] {url.name} - Checked {time_since_check:.1f}min ago, frequency is {url.frequency}min")
-                continue
+        if next_due_time(url.last_checked, url.frequency, now) > now:
+            time_since_check = (now - url.last_checked).total_seconds() / 60
+            logger.debug(f"[SKIP] {url.name} - Checked {time_since_check:.1f}min ago, frequency is {url.frequency}min")
+            continue
         
         # Time to check this URL
         logger.info(f"[QUEUE] Checking {url.name} ({url.url})")
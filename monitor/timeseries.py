@@ -0,0 +1,192 @@
+"""
+Time Series Helpers
+Bucketed uptime/latency series for charts, with LTTB downsampling
+"""
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+DURATION_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+MAX_RANGE = timedelta(days=400)  # Longest range served (daily rollup retention)
+MAX_POINTS = 500  # Upper bound on points returned per series
+RESOLUTION_STEPS = [
+    timedelta(minutes=1), timedelta(minutes=5), timedelta(minutes=15),
+    timedelta(hours=1), timedelta(hours=6), timedelta(days=1),
+]
+ROLLUP_RESOLUTION = timedelta(hours=1)  # Finest step the rollup tables can serve
+# Ranges this long or longer are charted from rollups, never from raw checks
+ROLLUP_MIN_SPAN = timedelta(days=1)
+
+
+def parse_duration(value):
+    """Parse '15m', '6h' or '90d' into a timedelta (ValueError if malformed)"""
+    match = re.fullmatch(r'\s*(\d+)\s*([mhd])\s*', value or '')
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid duration: {value!r} (expected e.g. 15m, 6h, 90d)")
+    return timedelta(seconds=int(match.group(1)) * DURATION_UNITS[match.group(2)])
+
+
+def default_resolution(span, max_points=MAX_POINTS):
+    """
+    Smallest step from RESOLUTION_STEPS that fits span into max_points
+    buckets; hour and day steps line up with the rollup tables. Ranges of
+    ROLLUP_MIN_SPAN or more get at least ROLLUP_RESOLUTION, since raw
+    checks are only kept for the most recent few per URL.
+    """
+    for step in RESOLUTION_STEPS:
+        if span >= ROLLUP_MIN_SPAN and step < ROLLUP_RESOLUTION:
+            continue
+        if span / step <= max_points:
+            return step
+    days = -(-span.days // max_points)  # Ceiling division
+    return timedelta(days=max(days, 1))
+
+
+def _floor(moment, resolution):
+    """Start of the resolution-sized bucket (aligned to the epoch) containing moment"""
+    step = int(resolution.total_seconds())
+    epoch = int(moment.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % step, tz=dt_timezone.utc)
+
+
+def _raw_covers(url, start):
+    """
+    Whether the raw URLStatus rows still held for url reach back to start.
+    The scheduler keeps only the newest KEEP_RECORDS_PER_URL checks, so the
+    oldest retained row bounds what raw reads can answer.
+    """
+    oldest = url.statuses.order_by('timestamp').values_list('timestamp', flat=True).first()
+    return oldest is None or oldest <= start
+
+
+def _coarsen(resolution):
+    """Smallest multiple of ROLLUP_RESOLUTION that is at least resolution"""
+    step = ROLLUP_RESOLUTION.total_seconds()
+    return timedelta(seconds=max(-(-resolution.total_seconds() // step), 1) * step)
+
+
+def _source_rows(url, start, end, resolution):
+    """
+    (time, checks, up, latency_sum) rows covering start..end, read with one
+    query from the coarsest source that is at least as fine as resolution:
+    daily rollups, hourly rollups, or raw URLStatus rows grouped by minute.
+    Sub-hour resolutions fall back to hourly rollups (and an hourly step)
+    when the range reaches past raw retention. Returns (rows, source,
+    resolution actually served).
+    """
+    from monitor.models import StatusRollupDaily, StatusRollupHourly
+
+    if resolution.total_seconds() % 3600 and (end - start >= ROLLUP_MIN_SPAN or not _raw_covers(url, start)):
+        resolution = _coarsen(resolution)
+
+    if resolution >= timedelta(days=1) and resolution.total_seconds() % 86400 == 0:
+        queryset, source = StatusRollupDaily.objects.filter(url=url, bucket__gte=_floor(start, timedelta(days=1))), 'daily'
+    elif resolution >= timedelta(hours=1) and resolution.total_seconds() % 3600 == 0:
+        queryset, source = StatusRollupHourly.objects.filter(url=url, bucket__gte=_floor(start, timedelta(hours=1))), 'hourly'
+    else:
+        rows = url.statuses.filter(timestamp__gte=start, timestamp__lte=end).annotate(
+            minute=TruncMinute('timestamp', tzinfo=dt_timezone.utc)
+        ).values('minute').annotate(
+            checks=Count('id'),
+            up=Count('id', filter=Q(is_up=True)),
+            latency=Sum('response_time'),
+        ).order_by('minute').values_list('minute', 'checks', 'up', 'latency')
+        return list(rows), 'raw', resolution
+
+    rows = queryset.filter(bucket__lte=end).order_by('bucket').values_list(
+        'bucket', 'check_count', 'up_count', 'latency_sum'
+    )
+    return list(rows), source, resolution
+
+
+def bucketed_series(url, span, resolution=None, end=None):
+    """
+    Uptime and average latency for url over the last `span`, one point per
+    `resolution` bucket that has checks. Returns a dict of parallel lists
+    (timestamps, uptime, latency) plus the source and resolution used.
+    """
+    end = end or timezone.now()
+    start = end - span
+    resolution = resolution or default_resolution(span)
+    rows, source, resolution = _source_rows(url, start, end, resolution)
+
+    buckets = {}
+    for moment, checks, up, latency in rows:
+        if not checks:
+            continue
+        key = _floor(moment, resolution)
+        totals = buckets.setdefault(key, [0, 0, 0.0])
+        totals[0] += checks
+        totals[1] += up
+        totals[2] += latency or 0
+
+    timestamps, uptime, latency = [], [], []
+    for key in sorted(buckets):
+        checks, up, latency_sum = buckets[key]
+        timestamps.append(key)
+        uptime.append(round(up / checks * 100, 2))
+        latency.append(round(latency_sum / checks, 2))
+    return {
+        'timestamps': timestamps,
+        'uptime': uptime,
+        'latency': latency,
+        'source': source,
+        'resolution': resolution,
+    }
+
+
+def lttb(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns the sorted indices
+    of at most `threshold` points that best preserve the visual shape of the
+    series (first and last points are always kept).
+    """
+    n = len(xs)
+    if threshold >= n or n < 3:
+        return list(range(n))
+    threshold = max(threshold, 3)
+
+    selected = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        best, best_area = start, -1
+        for j in range(start, end):
+            area = abs(
+                (xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a])
+            )
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def downsample(series, max_points=MAX_POINTS):
+    """
+    Reduce a bucketed_series() result to at most max_points points. LTTB is
+    run on the uptime and latency series separately (half the budget each)
+    and the union of the chosen points is kept, so dips in either survive.
+    """
+    count = len(series['timestamps'])
+    if count <= max_points:
+        return series
+
+    xs = [t.timestamp() for t in series['timestamps']]
+    half = max(max_points // 2, 3)
+    keep = sorted(set(lttb(xs, series['uptime'], half)) | set(lttb(xs, series['latency'], half)))
+    downsampled = dict(series)
+    for field in ('timestamps', 'uptime', 'latency'):
+        downsampled[field] = [series[field][i] for i in keep]
+    return downsampled
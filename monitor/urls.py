@@ -77,6 +77,7 @@ urlpatterns = [
     path('analytics/performance/<uuid:url_id>/', analytics_views.performance_view, name='analytics_performance_url'),
     path('analytics/scroll/', analytics_views.scroll_depth_view, name='analytics_scroll'),
     path('analytics/scroll/<uuid:url_id>/', analytics_views.scroll_depth_view, name='analytics_scroll_url'),
+    path('analytics/sessions/<str:session_id>/replay/', analytics_views.session_replay, name='session_replay'),
     
     # Export
     path('urls/<uuid:url_id>/export/<str:format>/', views.export_url_data, name='export_url_data'),
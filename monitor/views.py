@@ -20,6 +20,9 @@ from .forms import (
     NotificationSettingsForm
 )
 from django_tables2 import RequestConfig
+from .rollups import url_window_stats
+from . import timeseries
+from .dashboard import status_summary, enrich_urls, daily_chart
 from .tables import URLTable, StatusTable, AlertTable, NotificationTable
 import json
 import csv
@@ -82,17 +85,26 @@ def health_check(request):
             from monitor.scheduler import get_scheduler
             scheduler = get_scheduler()
             if scheduler and scheduler.running:
-                scheduler_status = "running"
+                scheduler_status = f"running ({scheduler.role})"
             else:
                 scheduler_status = "not running"
         except Exception as scheduler_error:
             scheduler_status = f"error: {str(scheduler_error)}"
             logger.warning(f"Scheduler check failed: {scheduler_error}")
         
+        # Analytics ingest queue backlog (only used in queue ingest mode)
+        from monitor.ingest_queue import ingest_queue_enabled, queue_depth
+        from monitor.geolocation import geolocation_cache_stats
+        from monitor.analytics_api import user_agent_cache_stats
+        ingest_status = f"queue ({queue_depth()} pending)" if ingest_queue_enabled() else "sync"
+        
         return JsonResponse({
             'status': 'healthy',
             'database': 'connected',
             'scheduler': scheduler_status,
+            'ingest': ingest_status,
+            'geolocation_cache': geolocation_cache_stats(),
+            'user_agent_cache': user_agent_cache_stats(),
             'tables': {
                 'users': user_count,
                 'monitored_urls': url_count,
@@ -159,42 +171,18 @@ def user_logout(request):
 
 @login_required
 def dashboard(request):
+    now = timezone.now()
     try:
-        # Get user's URLs
-        urls = MonitoredURL.objects.filter(user=request.user, is_active=True)
+        # Get user's URLs with their current state (one join)
+        urls = MonitoredURL.objects.filter(user=request.user, is_active=True).select_related('state')
         
         # Calculate stats
-        stats = {
-            'total_urls': urls.count(),
-            'up_urls': 0,
-            'down_urls': 0,
-            'avg_response_time': 0,
-        }
-        
-        if urls.exists():
-            # Get latest status for each URL
-            latest_statuses = []
-            for url in urls:
-                latest = url.statuses.first()
-                if latest:
-                    latest_statuses.append(latest)
-                    if latest.is_up:
-                        stats['up_urls'] += 1
-                    else:
-                        stats['down_urls'] += 1
-            
-            # Calculate average response time
-            if latest_statuses:
-                stats['avg_response_time'] = sum(
-                    s.response_time for s in latest_statuses if s.response_time > 0
-                ) / len(latest_statuses)
+        stats = status_summary(urls)
         
         # Get recent notifications
         notifications = Notification.objects.filter(user=request.user).order_by('-created_at')[:5]
     except Exception as e:
         # If any database error occurs, show empty dashboard
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f"Dashboard error: {e}")
         messages.error(request, 'Some dashboard data could not be loaded. Database might be initializing.')
         stats = {
@@ -213,62 +201,21 @@ def dashboard(request):
     chart_response_times = []
     
     try:
-        for url in urls:
-            statuses = url.statuses.filter(
-                timestamp__gte=timezone.now() - timedelta(days=7)
-            ).order_by('timestamp')
-            
-            if statuses.exists():
-                up_count = statuses.filter(is_up=True).count()
-                uptime_percent = (up_count / statuses.count()) * 100
-                avg_response = statuses.aggregate(avg=Avg('response_time'))['avg'] or 0
-                
-                uptime_data.append({
-                    'url': url,
-                    'uptime': round(uptime_percent, 2),
-                    'avg_response': round(avg_response, 2) if avg_response else 0
-                })
+        urls = enrich_urls(urls, now - timedelta(days=7), now)
+        uptime_data = [
+            {'url': url, 'uptime': url.uptime, 'avg_response': url.avg_response}
+            for url in urls
+            if url.uptime is not None
+        ]
         
         # Prepare chart data for the last 7 days
-        if urls.exists():
-            # Get daily aggregated data for charts
-            from datetime import date
-            today = timezone.now().date()
-            
-            for i in range(6, -1, -1):  # Last 7 days
-                day = today - timedelta(days=i)
-                day_start = timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time()))
-                day_end = day_start + timedelta(days=1)
-                
-                # Get statuses for this day across all URLs
-                day_statuses = URLStatus.objects.filter(
-                    url__user=request.user,
-                    url__is_active=True,
-                    timestamp__gte=day_start,
-                    timestamp__lt=day_end
-                )
-                
-                if day_statuses.exists():
-                    # Calculate uptime percentage for this day
-                    up_count = day_statuses.filter(is_up=True).count()
-                    total_count = day_statuses.count()
-                    uptime_pct = round((up_count / total_count) * 100, 2) if total_count > 0 else 0
-                    
-                    # Calculate average response time for this day
-                    avg_response = day_statuses.aggregate(avg=Avg('response_time'))['avg'] or 0
-                    avg_response = round(avg_response, 2) if avg_response else 0
-                    
-                    chart_labels.append(day.strftime('%b %d'))
-                    chart_uptime.append(uptime_pct)
-                    chart_response_times.append(avg_response)
-                else:
-                    chart_labels.append(day.strftime('%b %d'))
-                    chart_uptime.append(0)
-                    chart_response_times.append(0)
+        if urls:
+            chart = daily_chart([url.id for url in urls], days=7, now=now)
+            chart_labels = chart['labels']
+            chart_uptime = chart['uptime']
+            chart_response_times = chart['response_times']
     except Exception as e:
         # If chart data fails, just use empty arrays
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f"Dashboard chart data error: {e}")
     
     # Convert to JSON for JavaScript
@@ -289,31 +236,10 @@ def dashboard(request):
 
 @login_required
 def url_list(request):
-    urls = MonitoredURL.objects.filter(user=request.user, is_active=True)
+    urls = MonitoredURL.objects.filter(user=request.user, is_active=True).select_related('state')
     
-    # Enrich each URL with extra stats
-    enriched_urls = []
-    for url in urls:
-        # Get 24h uptime
-        now = timezone.now()
-        statuses_24h = url.statuses.filter(timestamp__gte=now - timedelta(hours=24))
-        if statuses_24h.exists():
-            up_count = statuses_24h.filter(is_up=True).count()
-            url.uptime_24h = round((up_count / statuses_24h.count()) * 100, 2)
-        else:
-            url.uptime_24h = None
-        
-        # Get last response time
-        last_status = url.statuses.first()
-        url.last_response_time = last_status.response_time if last_status else None
-        
-        # Get status for display
-        if last_status:
-            url.display_status = "UP" if last_status.is_up else "DOWN"
-        else:
-            url.display_status = "UNKNOWN"
-        
-        enriched_urls.append(url)
+    # Enrich each URL with its status and 24h uptime
+    enriched_urls = enrich_urls(urls, timezone.now() - timedelta(hours=24))
     
     table = URLTable(enriched_urls)
     RequestConfig(request, paginate={'per_page': 10}).configure(table)
@@ -324,35 +250,33 @@ def url_list(request):
 
 @login_required
 def url_detail(request, url_id):
-    url = get_object_or_404(MonitoredURL, id=url_id, user=request.user)
+    url = get_object_or_404(MonitoredURL.objects.select_related('state'), id=url_id, user=request.user)
     status_table = StatusTable(url.statuses.all())
     RequestConfig(request, paginate={'per_page': 10}).configure(status_table)
     
-    # Calculate uptime percentages
+    # Uptime and latency from the hourly/daily rollups
     now = timezone.now()
     time_ranges = {
         '24h': now - timedelta(hours=24),
         '7d': now - timedelta(days=7),
         '30d': now - timedelta(days=30),
     }
+    window_stats = {
+        label: url_window_stats(url, start_time, now)
+        for label, start_time in time_ranges.items()
+    }
     
-    uptime_stats = {}
-    for label, start_time in time_ranges.items():
-        statuses = url.statuses.filter(timestamp__gte=start_time)
-        if statuses.exists():
-            up_count = statuses.filter(is_up=True).count()
-            uptime_stats[label] = round((up_count / statuses.count()) * 100, 2)
-        else:
-            uptime_stats[label] = 0.0
+    uptime_stats = {
+        label: summary['uptime'] if summary['uptime'] is not None else 0.0
+        for label, summary in window_stats.items()
+    }
     
     # Response time stats
     response_stats = {
-        '24h': url.statuses.filter(
-            timestamp__gte=now - timedelta(hours=24)
-        ).aggregate(avg=Avg('response_time'))['avg'] or 0,
-        '7d': url.statuses.filter(
-            timestamp__gte=now - timedelta(days=7)
-        ).aggregate(avg=Avg('response_time'))['avg'] or 0,
+        '24h': window_stats['24h']['avg_latency'],
+        '7d': window_stats['7d']['avg_latency'],
+        'p95_24h': window_stats['24h']['p95_latency'],
+        'p95_7d': window_stats['7d']['p95_latency'],
     }
     
     context = {
@@ -411,16 +335,11 @@ def check_now(request, url_id):
         from monitor.scheduler import get_scheduler
         scheduler = get_scheduler()
         
-        # Run check in background thread
-        import threading
-        check_thread = threading.Thread(
-            target=scheduler._check_url,
-            args=(url,),
-            daemon=True
-        )
-        check_thread.start()
-        
-        messages.success(request, 'URL check initiated. Refresh page in a few seconds to see results.')
+        # Queue the check on the scheduler's async check engine
+        if scheduler.check_now(url):
+            messages.success(request, 'URL check initiated. Refresh page in a few seconds to see results.')
+        else:
+            messages.info(request, 'A check for this URL is already in progress. Refresh page in a few seconds to see results.')
     except Exception as e:
         logger.error(f"Error initiating URL check: {e}")
         messages.error(request, f'Error checking URL: {e}')
@@ -495,16 +414,18 @@ def mark_all_read(request):
 
 @login_required
 def get_url_status(request, url_id):
-    url = get_object_or_404(MonitoredURL, id=url_id, user=request.user)
-    latest_status = url.statuses.first()
+    url = get_object_or_404(MonitoredURL.objects.select_related('state'), id=url_id, user=request.user)
+    state = url.current_state
     
-    if latest_status:
+    if state:
         data = {
-            'is_up': latest_status.is_up,
-            'status_code': latest_status.status_code,
-            'response_time': latest_status.response_time,
-            'timestamp': latest_status.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'error': latest_status.error_message,
+            'is_up': state.is_up,
+            'status_code': state.last_status_code,
+            'response_time': state.last_response_time,
+            'timestamp': state.last_checked_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'error': state.last_error,
+            'state_since': state.state_since.strftime('%Y-%m-%d %H:%M:%S'),
+            'consecutive_failures': state.consecutive_failures,
         }
     else:
         data = {'error': 'No status data available'}
@@ -513,47 +434,42 @@ def get_url_status(request, url_id):
 
 @login_required
 def get_uptime_chart_data(request, url_id):
+    """
+    Uptime and response time series for a URL.
+    Query params: range (e.g. 1h, 24h, 90d; default 7d), resolution (e.g. 1m,
+    6h; default fits the range into at most `points` buckets) and points
+    (default 500). Long series are downsampled with LTTB.
+    """
     url = get_object_or_404(MonitoredURL, id=url_id, user=request.user)
     
-    # Get data for the last 7 days
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=7)
+    try:
+        span = timeseries.parse_duration(request.GET.get('range', '7d'))
+        resolution = request.GET.get('resolution')
+        resolution = timeseries.parse_duration(resolution) if resolution else None
+        max_points = int(request.GET.get('points', timeseries.MAX_POINTS))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    if span > timeseries.MAX_RANGE:
+        return JsonResponse({'error': f'range may be at most {timeseries.MAX_RANGE.days}d'}, status=400)
+    if resolution is not None and resolution > span:
+        return JsonResponse({'error': 'resolution may not be longer than range'}, status=400)
+    max_points = min(max(max_points, 10), timeseries.MAX_POINTS)
     
-    # Group by day and hour
-    statuses = url.statuses.filter(
-        timestamp__gte=start_date,
-        timestamp__lte=end_date
-    ).order_by('timestamp')
+    series = timeseries.bucketed_series(url, span, resolution or timeseries.default_resolution(span, max_points))
+    series = timeseries.downsample(series, max_points)
     
     # Prepare chart data
     chart_data = {
-        'labels': [],
-        'up': [],
-        'down': [],
-        'response_times': []
+        'labels': [timezone.localtime(t).strftime('%Y-%m-%d %H:%M') for t in series['timestamps']],
+        'timestamps': [t.isoformat() for t in series['timestamps']],
+        'up': series['uptime'],
+        'down': [round(100 - uptime, 2) for uptime in series['uptime']],
+        'response_times': series['latency'],
+        'resolution': int(series['resolution'].total_seconds()),
+        'source': series['source'],
     }
     
-    # Group by hour
-    current_hour = start_date.replace(minute=0, second=0, microsecond=0)
-    while current_hour <= end_date:
-        hour_statuses = statuses.filter(
-            timestamp__gte=current_hour,
-            timestamp__lt=current_hour + timedelta(hours=1)
-        )
-        
-        if hour_statuses.exists():
-            up_count = hour_statuses.filter(is_up=True).count()
-            total = hour_statuses.count()
-            uptime = (up_count / total) * 100 if total > 0 else 0
-            avg_response = hour_statuses.aggregate(avg=Avg('response_time'))['avg'] or 0
-            
-            chart_data['labels'].append(current_hour.strftime('%Y-%m-%d %H:%M'))
-            chart_data['up'].append(uptime)
-            chart_data['down'].append(100 - uptime)
-            chart_data['response_times'].append(avg_response)
-        
-        current_hour += timedelta(hours=1)
-    
     return JsonResponse(chart_data)
 
 @login_required
@@ -0,0 +1,163 @@
+"""
+Unique Visitor Counting
+Maintains per-URL, per-day (and per-country) HyperLogLog sketches of
+visitors and sessions at ingest time and merges them for the analytics
+views, instead of COUNT(DISTINCT) over raw PageView rows
+"""
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from django.db import transaction
+from .sketches import HyperLogLog
+
+ALL_COUNTRIES = ''
+
+
+def sketch_date(timestamp):
+    """UTC day a pageview is counted on"""
+    return timestamp.astimezone(dt_timezone.utc).date()
+
+
+class _Pending:
+    """Sketch changes for one (url, date, country) row"""
+
+    def __init__(self):
+        self.pageviews = 0
+        self.visitors = HyperLogLog()
+        self.sessions = HyperLogLog()
+        self.country_code = ''
+
+
+def _group(pageviews):
+    pending = defaultdict(_Pending)
+    for pageview in pageviews:
+        if pageview.url_id is None:
+            continue
+        date = sketch_date(pageview.timestamp)
+        keys = [(pageview.url_id, date, ALL_COUNTRIES)]
+        if pageview.country:
+            keys.append((pageview.url_id, date, pageview.country))
+        for key in keys:
+            row = pending[key]
+            row.pageviews += 1
+            row.visitors.add(pageview.visitor_id)
+            row.sessions.add(pageview.session_id)
+            if key[2]:
+                row.country_code = pageview.country_code or row.country_code
+    return pending
+
+
+def record_pageviews(pageviews):
+    """
+    Fold new pageviews into their sketch rows. Missing rows are created
+    empty first and the rows are then locked, so concurrent ingest workers
+    merge into the same row instead of overwriting each other.
+    """
+    from monitor.models import VisitorSketch
+
+    pending = _group(pageviews)
+    if not pending:
+        return 0
+
+    empty = HyperLogLog().to_bytes()
+    with transaction.atomic():
+        VisitorSketch.objects.bulk_create(
+            [
+                VisitorSketch(url_id=url_id, date=date, country=country, visitors=empty, sessions=empty)
+                for url_id, date, country in pending
+            ],
+            ignore_conflicts=True,
+        )
+        url_ids = {url_id for url_id, _, _ in pending}
+        dates = {date for _, date, _ in pending}
+        rows = VisitorSketch.objects.select_for_update().filter(url_id__in=url_ids, date__in=dates)
+
+        changed = []
+        for row in rows:
+            change = pending.get((row.url_id, row.date, row.country))
+            if change is None:
+                continue
+            row.pageviews += change.pageviews
+            row.visitors = HyperLogLog.from_bytes(row.visitors).merge(change.visitors).to_bytes()
+            row.sessions = HyperLogLog.from_bytes(row.sessions).merge(change.sessions).to_bytes()
+            row.country_code = row.country_code or change.country_code
+            changed.append(row)
+        VisitorSketch.objects.bulk_update(changed, ['pageviews', 'visitors', 'sessions', 'country_code'])
+    return len(changed)
+
+
+def _rows(urls, since, until=None, country=ALL_COUNTRIES):
+    from monitor.models import VisitorSketch
+
+    rows = VisitorSketch.objects.filter(url__in=urls, date__gte=sketch_date(since))
+    if until is not None:
+        rows = rows.filter(date__lte=sketch_date(until))
+    if country is not None:
+        rows = rows.filter(country=country)
+    return rows
+
+
+def unique_counts(urls, since, until=None):
+    """(visitors, sessions) estimated over the days from since to until"""
+    visitors = HyperLogLog()
+    sessions = HyperLogLog()
+    for row in _rows(urls, since, until).values_list('visitors', 'sessions').iterator():
+        visitors.merge(HyperLogLog.from_bytes(row[0]))
+        sessions.merge(HyperLogLog.from_bytes(row[1]))
+    return visitors.count(), sessions.count()
+
+
+def unique_visitors_by_day(urls, since, until=None):
+    """{date: estimated visitors}, merging the sketches of several URLs"""
+    by_day = {}
+    for date, data in _rows(urls, since, until).values_list('date', 'visitors').iterator():
+        sketch = HyperLogLog.from_bytes(data)
+        if date in by_day:
+            by_day[date].merge(sketch)
+        else:
+            by_day[date] = sketch
+    return {date: sketch.count() for date, sketch in by_day.items()}
+
+
+def unique_visitors_by_country(urls, since, until=None):
+    """{country: estimated visitors}"""
+    by_country = {}
+    rows = _rows(urls, since, until, country=None).exclude(country=ALL_COUNTRIES)
+    for country, data in rows.values_list('country', 'visitors').iterator():
+        sketch = HyperLogLog.from_bytes(data)
+        if country in by_country:
+            by_country[country].merge(sketch)
+        else:
+            by_country[country] = sketch
+    return {country: sketch.count() for country, sketch in by_country.items()}
+
+
+def rebuild_visitor_sketches(url_ids=None, batch_size=5000):
+    """
+    Recompute sketches from the PageView rows in the database, replacing
+    the existing sketches of the affected URLs. Returns pageviews read.
+    """
+    from monitor.models import PageView, VisitorSketch
+
+    pageviews = PageView.objects.filter(url__isnull=False).order_by('url_id', 'timestamp')
+    if url_ids is not None:
+        pageviews = pageviews.filter(url_id__in=url_ids)
+
+    with transaction.atomic():
+        sketches = VisitorSketch.objects.all()
+        if url_ids is not None:
+            sketches = sketches.filter(url_id__in=url_ids)
+        sketches.delete()
+
+        count = 0
+        batch = []
+        fields = ('url_id', 'timestamp', 'visitor_id', 'session_id', 'country', 'country_code')
+        for pageview in pageviews.only(*fields).iterator(chunk_size=batch_size):
+            batch.append(pageview)
+            if len(batch) >= batch_size:
+                record_pageviews(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            record_pageviews(batch)
+            count += len(batch)
+    return count
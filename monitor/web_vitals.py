@@ -0,0 +1,144 @@
+"""
+Web Vitals Percentiles
+Maintains per-URL, per-page, per-day DDSketches of each PerformanceMetric
+field at ingest time, so p50/p75/p95 over any range come from merging
+sketches instead of scanning metric rows
+"""
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from django.db import transaction
+from .sketches import DDSketch
+
+# Metric key -> PerformanceMetric field
+VITAL_FIELDS = {
+    'fcp': 'first_contentful_paint',
+    'lcp': 'largest_contentful_paint',
+    'fid': 'first_input_delay',
+    'cls': 'cumulative_layout_shift',
+    'tti': 'time_to_interactive',
+    'dom_load': 'dom_load_time',
+    'page_load': 'page_load_time',
+}
+QUANTILES = {'p50': 0.5, 'p75': 0.75, 'p95': 0.95}
+
+
+def vitals_date(timestamp):
+    """UTC day a metric is counted on"""
+    return timestamp.astimezone(dt_timezone.utc).date()
+
+
+def _group(metrics):
+    pending = defaultdict(DDSketch)
+    for metric in metrics:
+        if metric.url_id is None:
+            continue
+        date = vitals_date(metric.timestamp)
+        for key, field in VITAL_FIELDS.items():
+            value = getattr(metric, field)
+            if value is not None:
+                pending[(metric.url_id, metric.page_url, date, key)].add(value)
+    return pending
+
+
+def record_metrics(metrics):
+    """
+    Fold new PerformanceMetric rows into their sketch rows. Missing rows are
+    created empty and then locked, so concurrent ingest workers merge into
+    the same row.
+    """
+    from monitor.models import WebVitalSketch
+
+    pending = _group(metrics)
+    if not pending:
+        return 0
+
+    with transaction.atomic():
+        WebVitalSketch.objects.bulk_create(
+            [
+                WebVitalSketch(url_id=url_id, page_url=page_url, date=date, metric=metric, sketch=DDSketch().to_dict())
+                for url_id, page_url, date, metric in pending
+            ],
+            ignore_conflicts=True,
+        )
+        rows = WebVitalSketch.objects.select_for_update().filter(
+            url_id__in={key[0] for key in pending},
+            page_url__in={key[1] for key in pending},
+            date__in={key[2] for key in pending},
+        )
+
+        changed = []
+        for row in rows:
+            sketch = pending.get((row.url_id, row.page_url, row.date, row.metric))
+            if sketch is None:
+                continue
+            merged = DDSketch.from_dict(row.sketch).merge(sketch)
+            row.sketch = merged.to_dict()
+            row.count = merged.count
+            changed.append(row)
+        WebVitalSketch.objects.bulk_update(changed, ['sketch', 'count'])
+    return len(changed)
+
+
+def summarize(sketch):
+    """{'p50', 'p75', 'p95', 'avg', 'count'} of a merged sketch"""
+    summary = {name: sketch.quantile(q) for name, q in QUANTILES.items()}
+    summary['avg'] = sketch.mean
+    summary['count'] = sketch.count
+    return summary
+
+
+def vitals_report(rows):
+    """
+    Merge WebVitalSketch rows in one pass. Returns summaries for the whole
+    range, per page and per day:
+        ({metric: summary}, {page_url: {metric: summary}}, {date: {metric: summary}})
+    """
+    overall = defaultdict(DDSketch)
+    by_page = defaultdict(lambda: defaultdict(DDSketch))
+    by_day = defaultdict(lambda: defaultdict(DDSketch))
+    for page_url, date, metric, data in rows.values_list('page_url', 'date', 'metric', 'sketch').iterator():
+        sketch = DDSketch.from_dict(data)
+        overall[metric].merge(sketch)
+        by_page[page_url][metric].merge(sketch)
+        by_day[date][metric].merge(sketch)
+
+    def summaries(sketches):
+        return {metric: summarize(sketches.get(metric) or DDSketch()) for metric in VITAL_FIELDS}
+
+    return (
+        summaries(overall),
+        {page_url: summaries(sketches) for page_url, sketches in by_page.items()},
+        {date: summaries(sketches) for date, sketches in by_day.items()},
+    )
+
+
+def rebuild_web_vitals(url_ids=None, batch_size=5000):
+    """
+    Recompute sketches from the PerformanceMetric rows in the database,
+    replacing the existing sketches of the affected URLs. Returns rows read.
+    """
+    from monitor.models import PerformanceMetric, WebVitalSketch
+
+    metrics = PerformanceMetric.objects.filter(url__isnull=False).order_by('url_id', 'timestamp')
+    if url_ids is not None:
+        metrics = metrics.filter(url_id__in=url_ids)
+
+    with transaction.atomic():
+        sketches = WebVitalSketch.objects.all()
+        if url_ids is not None:
+            sketches = sketches.filter(url_id__in=url_ids)
+        sketches.delete()
+
+        count = 0
+        batch = []
+        fields = ('url_id', 'page_url', 'timestamp', *VITAL_FIELDS.values())
+        for metric in metrics.only(*fields).iterator(chunk_size=batch_size):
+            batch.append(metric)
+            if len(batch) >= batch_size:
+                record_metrics(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            record_metrics(batch)
+            count += len(batch)
+    return count
@@ -0,0 +1,253 @@
+(function() {
+    'use strict';
+
+    const TRACKING_URL_ID = '{{ url_id }}';
+    const API_ENDPOINT = '{{ api_endpoint }}';
+    const BEACON_CONTENT_TYPE = 'application/vnd.urlmonitor.beacon+json';
+
+    // Generate unique IDs
+    const generateId = () => Math.random().toString(36).substr(2, 9) + Date.now().toString(36);
+
+    const getVisitorId = () => {
+        let visitorId = localStorage.getItem('urlmon_visitor_id');
+        if (!visitorId) {
+            visitorId = generateId();
+            localStorage.setItem('urlmon_visitor_id', visitorId);
+        }
+        return visitorId;
+    };
+
+    const getSessionId = () => {
+        let sessionId = sessionStorage.getItem('urlmon_session_id');
+        if (!sessionId) {
+            sessionId = generateId();
+            sessionStorage.setItem('urlmon_session_id', sessionId);
+        }
+        return sessionId;
+    };
+
+    class URLMonitorTracker {
+        constructor() {
+            this.visitorId = getVisitorId();
+            this.sessionId = getSessionId();
+            this.pageLoadTime = Date.now();
+            this.eventQueue = [];
+            this.maxScrollDepth = 0;
+            this.clickCount = 0;
+            this.lastClickTime = 0;
+            this.lastClickPosition = null;
+
+            this.init();
+        }
+
+        init() {
+            this.trackPageView();
+            this.setupClickTracking();
+            this.setupScrollTracking();
+            this.trackPerformanceMetrics();
+
+            window.addEventListener('beforeunload', () => this.handlePageLeave());
+            setInterval(() => this.flush(), 5000);
+        }
+
+        trackPageView() {
+            const data = {
+                type: 'pageview',
+                session_id: this.sessionId,
+                visitor_id: this.visitorId,
+                page_url: window.location.pathname,
+                page_title: document.title,
+                referrer: document.referrer,
+                timestamp: new Date().toISOString(),
+                user_agent: navigator.userAgent,
+                screen_resolution: `${screen.width}x${screen.height}`,
+                viewport_size: `${window.innerWidth}x${window.innerHeight}`,
+                language: navigator.language
+            };
+
+            this.sendImmediately(data);
+        }
+
+        setupClickTracking() {
+            document.addEventListener('click', (e) => {
+                const now = Date.now();
+                const position = { x: e.clientX, y: e.clientY };
+
+                this.clickCount++;
+
+                // Check for rage click
+                if (this.lastClickPosition &&
+                    Math.abs(position.x - this.lastClickPosition.x) < 20 &&
+                    Math.abs(position.y - this.lastClickPosition.y) < 20 &&
+                    now - this.lastClickTime < 1000) {
+
+                    if (this.clickCount >= 3) {
+                        this.queueEvent({
+                            type: 'rage_click',
+                            page_url: window.location.pathname,
+                            session_id: this.sessionId,
+                            visitor_id: this.visitorId,
+                            x_position: position.x,
+                            y_position: position.y,
+                            click_count: this.clickCount,
+                            timestamp: new Date().toISOString()
+                        });
+                    }
+                } else {
+                    this.clickCount = 1;
+                }
+
+                this.lastClickTime = now;
+                this.lastClickPosition = position;
+
+                // Track regular click
+                this.queueEvent({
+                    type: 'click',
+                    page_url: window.location.pathname,
+                    session_id: this.sessionId,
+                    visitor_id: this.visitorId,
+                    x_position: e.clientX,
+                    y_position: e.clientY,
+                    viewport_width: window.innerWidth,
+                    viewport_height: window.innerHeight,
+                    element_tag: e.target.tagName.toLowerCase(),
+                    element_id: e.target.id || '',
+                    element_class: e.target.className || '',
+                    element_text: e.target.textContent?.substring(0, 100) || '',
+                    timestamp: new Date().toISOString()
+                });
+            });
+        }
+
+        setupScrollTracking() {
+            let scrollTimeout;
+            document.addEventListener('scroll', () => {
+                clearTimeout(scrollTimeout);
+                scrollTimeout = setTimeout(() => {
+                    const scrollDepth = Math.round(
+                        (window.scrollY / (document.documentElement.scrollHeight - window.innerHeight)) * 100
+                    );
+
+                    if (scrollDepth > this.maxScrollDepth) {
+                        this.maxScrollDepth = scrollDepth;
+                    }
+
+                    this.queueEvent({
+                        type: 'scroll',
+                        page_url: window.location.pathname,
+                        session_id: this.sessionId,
+                        visitor_id: this.visitorId,
+                        scroll_depth: scrollDepth,
+                        timestamp: new Date().toISOString()
+                    });
+                }, 150);
+            });
+        }
+
+        trackPerformanceMetrics() {
+            if (!window.performance) return;
+
+            window.addEventListener('load', () => {
+                setTimeout(() => {
+                    const timing = performance.timing;
+                    const data = {
+                        type: 'performance',
+                        page_url: window.location.pathname,
+                        session_id: this.sessionId,
+                        visitor_id: this.visitorId,
+                        dom_load_time: timing.domContentLoadedEventEnd - timing.domContentLoadedEventStart,
+                        page_load_time: timing.loadEventEnd - timing.navigationStart,
+                        timestamp: new Date().toISOString()
+                    };
+
+                    // Try to get Web Vitals
+                    if (window.PerformanceObserver) {
+                        const paintEntries = performance.getEntriesByType('paint');
+                        const fcpEntry = paintEntries.find(entry => entry.name === 'first-contentful-paint');
+                        if (fcpEntry) data.first_contentful_paint = fcpEntry.startTime;
+                    }
+
+                    this.queueEvent(data);
+                }, 100);
+            });
+        }
+
+        handlePageLeave() {
+            const timeOnPage = Math.round((Date.now() - this.pageLoadTime) / 1000);
+            this.sendBeacon({
+                type: 'page_leave',
+                page_url: window.location.pathname,
+                session_id: this.sessionId,
+                visitor_id: this.visitorId,
+                time_on_page: timeOnPage,
+                scroll_depth: this.maxScrollDepth,
+                timestamp: new Date().toISOString()
+            });
+        }
+
+        queueEvent(data) {
+            this.eventQueue.push(data);
+            if (this.eventQueue.length >= 10) {
+                this.flush();
+            }
+        }
+
+        flush() {
+            if (this.eventQueue.length === 0) return;
+            const events = [...this.eventQueue];
+            this.eventQueue = [];
+            this.send(events);
+        }
+
+        // Compact beacon: shared fields once, timestamps as deltas in ms
+        encode(events) {
+            const first = events[0];
+            let clock = Date.parse(first.timestamp) || Date.now();
+            const batch = { v: 1, s: first.session_id, u: first.visitor_id, p: first.page_url, t: clock, e: [] };
+            for (const event of events) {
+                const { type, session_id, visitor_id, page_url, timestamp, ...fields } = event;
+                const time = Date.parse(timestamp) || clock;
+                if (page_url !== batch.p) fields.page_url = page_url;
+                batch.e.push([type, time - clock, fields]);
+                clock = time;
+            }
+            return JSON.stringify(batch);
+        }
+
+        async post(events) {
+            const headers = { 'Content-Type': BEACON_CONTENT_TYPE };
+            let body = this.encode(events);
+            if (window.CompressionStream && body.length > 1024) {
+                const stream = new Blob([body]).stream().pipeThrough(new CompressionStream('gzip'));
+                body = await new Response(stream).blob();
+                headers['Content-Encoding'] = 'gzip';
+            }
+            return fetch(API_ENDPOINT, { method: 'POST', headers, body, keepalive: true });
+        }
+
+        send(events) {
+            this.post(events).catch(() => {
+                this.eventQueue.unshift(...events);
+            });
+        }
+
+        sendImmediately(data) {
+            this.post([data]).catch(() => {});
+        }
+
+        sendBeacon(data) {
+            if (navigator.sendBeacon) {
+                // sendBeacon only allows CORS-safelisted types; the server recognises the payload itself
+                const body = new Blob([this.encode([data])], { type: 'text/plain' });
+                navigator.sendBeacon(API_ENDPOINT, body);
+            }
+        }
+    }
+
+    // Initialize tracker
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', () => new URLMonitorTracker());
+    } else {
+        new URLMonitorTracker();
+    }
+})();
@@ -261,6 +261,34 @@ CELERY_BEAT_SCHEDULE = {
     },
 }
 
+# Background Scheduler
+# SCHEDULER_MODE: 'leader' runs one active scheduler elected across all processes,
+# 'sharded' splits URLs across every checker node with a consistent-hash ring
+SCHEDULER_MODE = config('SCHEDULER_MODE', default='leader')
+# SCHEDULER_AUTOSTART: start a scheduler inside each web worker
+# (disable when checks run in dedicated `manage.py run_checker` processes)
+SCHEDULER_AUTOSTART = config('SCHEDULER_AUTOSTART', default=True, cast=bool)
+
+# Analytics Ingestion
+# TRACKING_INGEST_MODE: 'sync' writes tracking events inside the request,
+# 'queue' spools them to the database and answers 202 right away
+TRACKING_INGEST_MODE = config('TRACKING_INGEST_MODE', default='sync')
+# INGEST_CONSUMER_AUTOSTART: drain the queue from inside each web worker
+# (disable when running dedicated `manage.py run_ingest_consumer` processes)
+INGEST_CONSUMER_AUTOSTART = config('INGEST_CONSUMER_AUTOSTART', default=True, cast=bool)
+INGEST_WORKERS = config('INGEST_WORKERS', default=2, cast=int)
+# GEOLOCATION_BACKEND: 'ipapi' looks visitors up on ipapi.co, 'local' uses the
+# offline database built with `manage.py build_geoip_db` (GEOIP_DATABASE)
+GEOLOCATION_BACKEND = config('GEOLOCATION_BACKEND', default='ipapi')
+GEOIP_DATABASE = config('GEOIP_DATABASE', default=str(BASE_DIR / 'data' / 'geoip.bin'))
+# GEOLOCATION_SHARED_CACHE: also cache IP geolocation in the Django cache
+# (shared by all workers; requires a working CACHES backend)
+GEOLOCATION_SHARED_CACHE = config('GEOLOCATION_SHARED_CACHE', default=False, cast=bool)
+# SCROLL_HEATMAP_MATERIALIZE: fold pageview scroll data into ScrollHeatmap
+# from the scheduler's cleanup pass (disable to run
+# `manage.py materialize_scroll_heatmaps` from cron instead)
+SCROLL_HEATMAP_MATERIALIZE = config('SCROLL_HEATMAP_MATERIALIZE', default=True, cast=bool)
+
 # Email Settings
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')